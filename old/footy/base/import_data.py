@@ -1,7 +1,9 @@
 import pandas as pd
 from django.conf import settings
+from django.db import transaction
 from django.utils.text import slugify
 from base.models import Player, PlayerStat, Club
+from base.peer_stats import refresh_peer_stats
 
 # from .clubs_elo_generator import calculate_clubs_elo
 import os
@@ -23,6 +25,66 @@ def import_club_elos():
         print("Error happend while reading csv files")
 
 
+# Rows per INSERT ... ON CONFLICT statement
+BULK_BATCH_SIZE = 500
+
+# PlayerStat field -> standard_stats_big5.csv column
+STAT_COLUMNS = {
+    "competition": "Comp",
+    "mp": "MP",
+    "starts": "Starts",
+    "minutes": "Min",
+    "nineties": "90s",
+    "goals": "Gls",
+    "assists": "Ast",
+    "goals_assists": "G+A",
+    "goals_minus_pens": "G-PK",
+    "penalties": "PK",
+    "penalties_attempted": "PKatt",
+    "yellow_cards": "CrdY",
+    "red_cards": "CrdR",
+    "xg": "xG",
+    "npxg": "npxG",
+    "xag": "xAG",
+    "npxg_plus_xag": "npxG+xAG",
+    "prog_carries": "PrgC",
+    "prog_passes": "PrgP",
+    "prog_runs": "PrgR",
+    "goals_per_90": "Gls-90",
+    "assists_per_90": "Ast-90",
+    "goals_assists_per_90": "G+A-90",
+    "goals_minus_pens_per_90": "G-PK-90",
+    "goals_assists_minus_pens": "G+A-PK",
+    "xg_per_90": "xG-90",
+    "xag_per_90": "xAG-90",
+    "xg_plus_xag": "xG+xAG",
+    "npxg_per_90": "npxG-90",
+    "npxg_plus_xag_per_90": "npxG+xAG-90",
+}
+
+
+def upsert(model, objects, unique_fields, update_fields):
+    """
+    Insert objects, updating the existing rows with the same unique fields instead
+    (INSERT ... ON CONFLICT DO UPDATE), BULK_BATCH_SIZE rows per query.
+    """
+    if objects:
+        model.objects.bulk_create(
+            objects,
+            batch_size=BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields,
+        )
+
+
+def ids_by_slug(model, slugs) -> dict:
+    """Primary keys of the rows with these slugs, in one query: {slug: id}."""
+    return dict(
+        model.objects.filter(slug__in=set(slugs)).values_list("slug", "id")
+    )
+
+
 def import_standard_stats():
     try:
 
@@ -110,143 +172,73 @@ def import_standard_stats():
         df["npxG-90"] = df["npxG-90"].astype(float)
         df["npxG+xAG-90"] = df["npxG+xAG-90"].astype(float)
 
-        # Lists to hold instances for bulk operations
-        clubs_to_update_or_create = []
-        players_to_update_or_create = []
-        player_stats_to_create = []
-        players_to_update = []
-        player_stats_to_update = []
-
-        # Helper dictionaries for lookup
-        player_lookup = {}
-
-        for index, row in elo_df.iterrows():
-            # Handle club
-            club_name = row["Squad"]
-            club_slug = slugify(club_name)
-            club, created = Club.objects.update_or_create(
-                name=club_name,
-                defaults={"slug": club_slug},
+        # Clubs, players and stats of the file, one per slug (the last row wins, as before)
+        df["club_slug"] = df["Squad"].map(slugify)
+        df["player_slug"] = [
+            slugify(f"{player}-{club}") for player, club in zip(df["Player"], df["Squad"])
+        ]
+        df = df.drop_duplicates(subset="player_slug", keep="last")
+        clubs = df.drop_duplicates(subset="club_slug", keep="last")
+        club_elos = dict(zip(elo_df["club"], elo_df["elo"]))
+
+        with transaction.atomic():
+            # Clubs with a known ELO get it updated as well
+            upsert(
+                Club,
+                [
+                    Club(name=name, slug=slug, elo=club_elos[name])
+                    for name, slug in zip(clubs["Squad"], clubs["club_slug"])
+                    if name in club_elos
+                ],
+                unique_fields=["slug"],
+                update_fields=["name", "elo"],
             )
-            if not created:
-                # Means we need to update
-                clubs_to_update_or_create.append(club)
-
-            # Handle Player
-            player_name = row["Player"]
-            player_slug = slugify(f"{player_name}-{club.name}")
-            player, created = Player.objects.update_or_create(
-                slug=player_slug,
-                defaults={
-                    "name": player_name,
-                    "age": row["Age"],
-                    "born": row["Born"],
-                    "nation": row["Nation"],
-                    "position": row["Pos"],
-                    "club": club,
-                },
+            upsert(
+                Club,
+                [
+                    Club(name=name, slug=slug)
+                    for name, slug in zip(clubs["Squad"], clubs["club_slug"])
+                    if name not in club_elos
+                ],
+                unique_fields=["slug"],
+                update_fields=["name"],
             )
-            if created:
-                players_to_update_or_create.append(player)
-            else:
-                # Alr exists
-                players_to_update.append(player)
-
-        # Iterate through the DataFrame
-        for index, row in df.iterrows():
-            # Handle club
-            club_name = row["Squad"]
-            club_slug = slugify(club_name)
-            club, created = Club.objects.update_or_create(
-                name=club_name,
-                defaults={"slug": club_slug},
+            club_ids = ids_by_slug(Club, clubs["club_slug"])
+
+            upsert(
+                Player,
+                [
+                    Player(
+                        slug=row["player_slug"],
+                        name=row["Player"],
+                        age=row["Age"],
+                        born=row["Born"],
+                        nation=row["Nation"],
+                        position=row["Pos"],
+                        club_id=club_ids[row["club_slug"]],
+                    )
+                    for row in df.to_dict("records")
+                ],
+                unique_fields=["slug"],
+                update_fields=["name", "age", "born", "nation", "position", "club"],
             )
-            if not created:
-                # Means we need to update
-                clubs_to_update_or_create.append(club)
-
-            # Handle Player
-            player_name = row["Player"]
-            player_slug = slugify(f"{player_name}-{club.name}")
-            player, created = Player.objects.update_or_create(
-                slug=player_slug,
-                defaults={
-                    "name": player_name,
-                    "age": row["Age"],
-                    "born": row["Born"],
-                    "nation": row["Nation"],
-                    "position": row["Pos"],
-                    "club": club,
-                },
+            player_ids = ids_by_slug(Player, df["player_slug"])
+
+            upsert(
+                PlayerStat,
+                [
+                    PlayerStat(
+                        player_id=player_ids[row["player_slug"]],
+                        **{field: row[column] for field, column in STAT_COLUMNS.items()},
+                    )
+                    for row in df.to_dict("records")
+                ],
+                unique_fields=["player"],
+                update_fields=list(STAT_COLUMNS),
             )
-            if created:
-                players_to_update_or_create.append(player)
-            else:
-                # Alr exists
-                players_to_update.append(player)
-
-            player_lookup[player_name] = player
-
-            # Handle PlayerStat
-            # stats_slug = slugify(f"{player.name}-{club.name}-{row['Comp']}")
-            stats, created = PlayerStat.objects.update_or_create(
-                player=player,
-                defaults={
-                    # "slug": stats_slug,
-                    "competition": row["Comp"],
-                    "mp": row["MP"],
-                    "starts": row["Starts"],
-                    "minutes": row["Min"],
-                    "nineties": row["90s"],
-                    "goals": row["Gls"],
-                    "assists": row["Ast"],
-                    "goals_assists": row["G+A"],
-                    "goals_minus_pens": row["G-PK"],
-                    "penalties": row["PK"],
-                    "penalties_attempted": row["PKatt"],
-                    "yellow_cards": row["CrdY"],
-                    "red_cards": row["CrdR"],
-                    "xg": row["xG"],
-                    "npxg": row["npxG"],
-                    "xag": row["xAG"],
-                    "npxg_plus_xag": row["npxG+xAG"],
-                    "prog_carries": row["PrgC"],
-                    "prog_passes": row["PrgP"],
-                    "prog_runs": row["PrgR"],
-                    "goals_per_90": row["Gls-90"],
-                    "assists_per_90": row["Ast-90"],
-                    "goals_assists_per_90": row["G+A-90"],
-                    "goals_minus_pens_per_90": row["G-PK-90"],
-                    "goals_assists_minus_pens": row["G+A-PK"],
-                    "xg_per_90": row["xG-90"],
-                    "xag_per_90": row["xAG-90"],
-                    "xg_plus_xag": row["xG+xAG"],
-                    "npxg_per_90": row["npxG-90"],
-                    "npxg_plus_xag_per_90": row["npxG+xAG-90"],
-                },
-            )
-            if created:
-                player_stats_to_create.append(stats)
-            else:
-                player_stats_to_update.append(stats)
-
-        # Perform bulk create and update operations
-        Club.objects.bulk_update(
-            clubs_to_update_or_create,
-            fields=[field.name for field in Club._meta.fields if field.name != "id"],
-        )
-        Player.objects.bulk_create(players_to_update_or_create)
-        Player.objects.bulk_update(
-            players_to_update,
-            fields=[field.name for field in Player._meta.fields if field.name != "id"],
-        )
-        PlayerStat.objects.bulk_create(player_stats_to_create)
-        PlayerStat.objects.bulk_update(
-            player_stats_to_update,
-            fields=[
-                field.name for field in PlayerStat._meta.fields if field.name != "id"
-            ],
-        )
+
+        # Peer group averages / percentiles of the graph view (invalidates cached graphs)
+        refresh_peer_stats()
 
         print("Data import complete.")
     except FileNotFoundError as e:
@@ -0,0 +1,87 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import math
+
+import pandas as pd
+
+# Peer groups and features as of this migration (base.peer_stats holds the current ones, which
+# the historical PlayerStat may not have)
+PEER_GROUPS = {
+    "competition": "competition",
+    "age": "player__age",
+    "position": "player__position",
+    "nationality": "player__nation",
+}
+PEER_FEATURES = [
+    "mp", "starts", "minutes", "nineties", "goals", "assists", "goals_assists",
+    "goals_minus_pens", "penalties", "penalties_attempted", "yellow_cards", "red_cards", "xg",
+    "npxg", "xag", "npxg_plus_xag", "prog_carries", "prog_passes", "prog_runs", "goals_per_90",
+    "assists_per_90", "goals_assists_per_90", "goals_minus_pens_per_90",
+    "goals_assists_minus_pens", "xg_per_90", "xag_per_90", "xg_plus_xag", "npxg_per_90",
+    "npxg_plus_xag_per_90",
+]
+
+
+def _json_number(value):
+    return None if value is None or math.isnan(value) else float(value)
+
+
+def backfill_peer_stats(apps, schema_editor):
+    """
+    Compute the peer stats of the existing player stats, which the graph view reads (same
+    computation as base.peer_stats.refresh_peer_stats, on the models of this migration).
+    """
+    PlayerStat = apps.get_model("base", "PlayerStat")
+    PlayerPeerStat = apps.get_model("base", "PlayerPeerStat")
+    stats = pd.DataFrame.from_records(
+        PlayerStat.objects.values("id", *set(PEER_GROUPS.values()), *PEER_FEATURES)
+    )
+    if stats.empty:
+        return
+
+    features = stats[PEER_FEATURES].astype(float)
+    group_averages = {}
+    group_percentiles = {}
+    for group, lookup in PEER_GROUPS.items():
+        grouped = features.groupby(stats[lookup], dropna=False)
+        group_averages[group] = grouped.transform("mean").to_numpy()
+        group_percentiles[group] = (grouped.rank(pct=True) * 100).to_numpy()
+
+    peer_stats = []
+    for row, player_stat_id in enumerate(stats["id"].tolist()):
+        comparisons = {
+            feature: {
+                group: {
+                    "avg": _json_number(group_averages[group][row, column]),
+                    "percentile": _json_number(group_percentiles[group][row, column]),
+                }
+                for group in PEER_GROUPS
+            }
+            for column, feature in enumerate(PEER_FEATURES)
+        }
+        peer_stats.append(
+            PlayerPeerStat(player_stat_id=player_stat_id, comparisons=comparisons, generation=1)
+        )
+    PlayerPeerStat.objects.bulk_create(peer_stats, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_club_other_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerPeerStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comparisons', models.JSONField()),
+                ('generation', models.PositiveIntegerField(default=0)),
+                ('player_stat', models.OneToOneField(help_text='Player stat compared with its peer groups.', on_delete=django.db.models.deletion.CASCADE, related_name='peer_stat', to='base.playerstat')),
+            ],
+        ),
+        migrations.RunPython(backfill_peer_stats, migrations.RunPython.noop),
+    ]
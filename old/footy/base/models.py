@@ -115,3 +115,24 @@ class PlayerStat(models.Model):
 
     def get_absolute_url(self):
         return reverse("player_stats_detail", args=[self.player.slug])
+
+
+class PlayerPeerStat(models.Model):
+    """
+    Precomputed comparison of a player's stats with their peer groups (same competition, age,
+    position and nationality), rebuilt by `base.peer_stats.refresh_peer_stats` on every import.
+    """
+
+    player_stat = models.OneToOneField(
+        PlayerStat,
+        on_delete=models.CASCADE,
+        related_name="peer_stat",
+        help_text="Player stat compared with its peer groups.",
+    )
+    # {feature: {group: {"avg": peer group mean, "percentile": player's percentile rank}}}
+    comparisons = models.JSONField()
+    # Import generation, part of the cache key of generated graphs
+    generation = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Peer stats for {self.player_stat.player}"
@@ -0,0 +1,75 @@
+import math
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import Max
+
+from base.models import PlayerPeerStat, PlayerStat
+
+# Peer groups a player is compared with: group name -> PlayerStat lookup
+PEER_GROUPS = {
+    "competition": "competition",
+    "age": "player__age",
+    "position": "player__position",
+    "nationality": "player__nation",
+}
+
+# PlayerStat fields that can be compared
+PEER_FEATURES = [
+    field.name
+    for field in PlayerStat._meta.fields
+    if field.name not in ["id", "player", "competition"]
+]
+
+
+def _json_number(value):
+    """NaN (empty group / missing values) -> None, as JSON has no NaN."""
+    return None if value is None or math.isnan(value) else float(value)
+
+
+def refresh_peer_stats():
+    """
+    Rebuild PlayerPeerStat: the mean of every feature over each peer group of a player, and the
+    player's percentile rank (0-100) in that group. One pass over all PlayerStat rows replaces the
+    per-request aggregate queries of the graph view.
+    Rows get a new generation number, which invalidates the graphs cached for the previous data.
+    """
+    stats = pd.DataFrame.from_records(
+        PlayerStat.objects.values("id", *set(PEER_GROUPS.values()), *PEER_FEATURES)
+    )
+    generation = (PlayerPeerStat.objects.aggregate(Max("generation"))["generation__max"] or 0) + 1
+
+    peer_stats = []
+    if not stats.empty:
+        features = stats[PEER_FEATURES].astype(float)
+        group_averages = {}
+        group_percentiles = {}
+        for group, lookup in PEER_GROUPS.items():
+            grouped = features.groupby(stats[lookup], dropna=False)
+            group_averages[group] = grouped.transform("mean").to_numpy()
+            group_percentiles[group] = (grouped.rank(pct=True) * 100).to_numpy()
+
+        for row, player_stat_id in enumerate(stats["id"].tolist()):
+            comparisons = {
+                feature: {
+                    group: {
+                        "avg": _json_number(group_averages[group][row, column]),
+                        "percentile": _json_number(group_percentiles[group][row, column]),
+                    }
+                    for group in PEER_GROUPS
+                }
+                for column, feature in enumerate(PEER_FEATURES)
+            }
+            peer_stats.append(
+                PlayerPeerStat(
+                    player_stat_id=player_stat_id,
+                    comparisons=comparisons,
+                    generation=generation,
+                )
+            )
+
+    with transaction.atomic():
+        PlayerPeerStat.objects.all().delete()
+        PlayerPeerStat.objects.bulk_create(peer_stats, batch_size=500)
+
+    print(f"Peer stats refreshed for {len(peer_stats)} players (generation {generation}).")
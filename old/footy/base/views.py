@@ -1,9 +1,20 @@
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render
-from .models import Player, Club, PlayerStat
-from django.db.models import Avg
+from django.core.cache import cache
+from .models import Player, Club, PlayerStat, PlayerPeerStat
+from .peer_stats import PEER_FEATURES
 import plotly.graph_objs as go
 
+# Peer groups shown in the comparison graph (see base.peer_stats.PEER_GROUPS)
+PEER_GROUP_LABELS = {
+    "competition": "League Avg",
+    "age": "Age Group Avg",
+    "position": "Position Avg",
+    "nationality": "Nationality Avg",
+}
+# Generated graphs are also invalidated by a new import (generation in the cache key)
+GRAPH_CACHE_TIMEOUT = 60 * 60 * 24
+
 # matplotlib.use("Agg")  # Ensure non-GUI backend for rendering on macOS
 # Create your views here.
 
@@ -67,41 +78,54 @@ def generate_graph(request, slug):
     if not feature:
         return JsonResponse({"error": "Feature is required"}, status=400)
 
-    # Fetch the player's stats and necessary attributes using get_object_or_404
-    player_stat = get_object_or_404(PlayerStat, player__slug=slug)
-    player = player_stat.player
     feature_field = feature.lower().replace(" ", "_")
-    player_value = getattr(player_stat, feature_field, None)
+    if feature_field not in PEER_FEATURES:
+        return JsonResponse({"error": "Feature not found for player"}, status=400)
 
+    # One row: the player's stats and their precomputed peer group averages / percentiles
+    peer_stat = get_object_or_404(
+        PlayerPeerStat.objects.select_related("player_stat__player"),
+        player_stat__player__slug=slug,
+    )
+    player_value = getattr(peer_stat.player_stat, feature_field, None)
     if player_value is None:
         return JsonResponse({"error": "Feature not found for player"}, status=400)
 
-    # Calculate the averages based on competition, age, position, and nationality
-    league_avg = PlayerStat.objects.filter(
-        competition=player_stat.competition
-    ).aggregate(avg_value=Avg(feature_field))["avg_value"]
-
-    age_group_avg = PlayerStat.objects.filter(player__age=player.age).aggregate(
-        avg_value=Avg(feature_field)
-    )["avg_value"]
+    # Figures are cached per (player, feature), for the current import generation
+    cache_key = f"player-graph:{peer_stat.generation}:{slug}:{feature_field}"
+    graph_json = cache.get(cache_key)
+    if graph_json is None:
+        graph_json = _build_graph_json(
+            peer_stat.player_stat.player.name,
+            feature,
+            player_value,
+            peer_stat.comparisons[feature_field],
+        )
+        cache.set(cache_key, graph_json, GRAPH_CACHE_TIMEOUT)
 
-    position_avg = PlayerStat.objects.filter(
-        player__position=player.position
-    ).aggregate(avg_value=Avg(feature_field))["avg_value"]
+    return JsonResponse({"graph_json": graph_json})
 
-    nationality_avg = PlayerStat.objects.filter(player__nation=player.nation).aggregate(
-        avg_value=Avg(feature_field)
-    )["avg_value"]
 
+def _build_graph_json(player_name, feature, player_value, comparison) -> str:
+    """
+    Plotly bar graph of a player's value next to their peer group averages.
+    @param player_name: Name of the player
+    @param feature: Feature name as requested
+    @param player_value: Player's value of the feature
+    @param comparison: {group: {"avg": ..., "percentile": ...}} (see PlayerPeerStat)
+    @return: Figure JSON
+    """
     # Prepare data for the graph
-    categories = [
-        "Player",
-        "League Avg",
-        "Age Group Avg",
-        "Position Avg",
-        "Nationality Avg",
+    categories = ["Player"] + list(PEER_GROUP_LABELS.values())
+    values = [player_value] + [comparison[group]["avg"] for group in PEER_GROUP_LABELS]
+    hover_texts = [""] + [
+        (
+            f"Percentile: {comparison[group]['percentile']:.0f}"
+            if comparison[group]["percentile"] is not None
+            else ""
+        )
+        for group in PEER_GROUP_LABELS
     ]
-    values = [player_value, league_avg, age_group_avg, position_avg, nationality_avg]
     # Create the Plotly bar graph
     fig = go.Figure()
 
@@ -114,24 +138,23 @@ def generate_graph(request, slug):
                 y=[value],
                 name=category,
                 marker_color=colors[i],
-                text=[f"{value:.2f}"],  # Display value on hover
+                text=[f"{value:.2f}" if value is not None else ""],  # Display value on hover
                 textposition="auto",  # Position text labels on top of bars
+                hovertext=[hover_texts[i]],
                 width=0.5,
             )
         )
 
     # Update layout for better interaction
     fig.update_layout(
-        title=f"{player.name} - {feature} Comparison",
+        title=f"{player_name} - {feature} Comparison",
         xaxis_title="Category",
         yaxis_title="Value",
         barmode="group",
         hovermode="x unified",
     )
 
-    # Convert the figure to a PNG image and encode it as base64
-    graph_json = fig.to_json()
-    return JsonResponse({"graph_json": graph_json})
+    return fig.to_json()
     # # Convert the graph to a PNG image and encode it as base64
     # buffer = io.BytesIO()
     # plt.savefig(buffer, format="png")
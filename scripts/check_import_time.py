@@ -0,0 +1,95 @@
+"""
+Import-time regression check of the footy-cli entry point.
+
+Imports `footy.main` in a fresh interpreter with `python -X importtime`, prints the slowest
+imports and fails (exit code 1) if the import takes longer than the budget or loads a subsystem
+the menu does not need. Interpreter start-up (site, encodings, ...) is not counted.
+
+Usage: python scripts/check_import_time.py [--budget-ms 100] [--top 15]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+ROOT = Path(__file__).resolve().parents[1]
+ENTRY_MODULE = "footy.main"
+# Milliseconds `import footy.main` may take (cumulative, as reported by -X importtime)
+BUDGET_MS = 100.0
+# Imported by the commands that use them, never at start-up
+FORBIDDEN_MODULES = (
+    "sqlalchemy",
+    "pandas",
+    "numpy",
+    "scipy",
+    "psycopg",
+    "httpx",
+    "multiprocessing.pool",
+)
+
+
+def measure_imports(module: str = ENTRY_MODULE) -> Dict[str, float]:
+    """
+    Import a module in a fresh interpreter and read the -X importtime report.
+    @param module: Module to import
+    @return: Cumulative import time (ms) of every module imported, in import order
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT / "src"), env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines: "import time: <self us> | <cumulative us> | <indented module name>"
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        timings[name.strip()] = int(cumulative) / 1000
+    return timings
+
+
+def check_import_time(budget_ms: float = BUDGET_MS, top: int = 15) -> bool:
+    """
+    Print the slowest imports of the entry point and check it against the budget.
+    @param budget_ms: Allowed import time of the entry point (ms)
+    @param top: Number of slowest imports printed
+    @return: Whether the check passed
+    """
+    timings = measure_imports()
+    total = timings[ENTRY_MODULE]
+    print(f"Slowest imports of {ENTRY_MODULE} (cumulative ms):")
+    for name, ms in sorted(timings.items(), key=lambda item: -item[1])[:top]:
+        print(f"{ms:10.1f}  {name}")
+
+    passed = True
+    if total > budget_ms:
+        print(f"FAIL: importing {ENTRY_MODULE} took {total:.1f}ms (budget {budget_ms:.0f}ms).")
+        passed = False
+    forbidden = [
+        module
+        for module in FORBIDDEN_MODULES
+        if any(name == module or name.startswith(module + ".") for name in timings)
+    ]
+    if forbidden:
+        print(f"FAIL: {ENTRY_MODULE} imports {', '.join(forbidden)} at start-up.")
+        passed = False
+    if passed:
+        print(f"OK: importing {ENTRY_MODULE} took {total:.1f}ms (budget {budget_ms:.0f}ms).")
+    return passed
+
+
+# Usage
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    sys.exit(0 if check_import_time(args.budget_ms, args.top) else 1)
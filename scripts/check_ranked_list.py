@@ -0,0 +1,130 @@
+"""
+Randomized consistency check of the leaderboard structures (footy.player_elo.leaderboards).
+
+Applies random inserts and removals to RankedList, with small block sizes so blocks are split
+and emptied often, and compares every query (iteration, len, select, rank, iter_from) with a
+plain sorted list. Also checks the order and ranks of Leaderboard. Fails (exit code 1) on the
+first mismatch, printing the seed, block size and step to reproduce it.
+
+Usage: python scripts/check_ranked_list.py [--seed 1] [--steps 5000]
+"""
+
+import argparse
+import bisect
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from footy.player_elo.leaderboards import Leaderboard, RankedList  # noqa: E402
+
+# Block sizes checked: tiny ones split / empty blocks every few operations
+BLOCK_SIZES = (1, 2, 3, 8, 64)
+# Steps between two full comparisons with the reference list
+CHECK_EVERY = 97
+
+
+def _compare(ranked: RankedList, reference: list, rng: random.Random) -> None:
+    """Compare every query of a RankedList with a sorted reference list."""
+    assert len(ranked) == len(reference), f"len {len(ranked)} != {len(reference)}"
+    assert list(ranked.iter_from(0)) == reference, "keys differ"
+    for position in rng.sample(range(len(reference)), min(20, len(reference))):
+        assert ranked[position] == reference[position], f"select({position})"
+    for _ in range(5):
+        start = rng.randint(0, len(reference))
+        assert list(ranked.iter_from(start)) == reference[start:], f"iter_from({start})"
+    for key in rng.sample(range(-60, 1110), 30):
+        expected = bisect.bisect_left(reference, key)
+        assert ranked.rank(key) == expected, f"rank({key}) {ranked.rank(key)} != {expected}"
+    for position in (-1, len(reference)):
+        try:
+            ranked[position]
+        except IndexError:
+            continue
+        raise AssertionError(f"select({position}) out of range did not raise")
+
+
+def check_ranked_list(block_size: int, seed: int, steps: int) -> None:
+    """
+    Random operations on a RankedList, compared with a sorted list.
+    @param block_size: Block size of the RankedList
+    @param seed: Random seed
+    @param steps: Number of inserts / removals
+    @raise AssertionError: On the first mismatch
+    """
+    rng = random.Random(seed)
+    ranked = RankedList([rng.randint(0, 1000) for _ in range(200)], block_size=block_size)
+    reference = sorted(ranked.iter_from(0))
+    _compare(ranked, reference, rng)
+    for step in range(steps):
+        operation = rng.random()
+        try:
+            if operation < 0.45 or not reference:
+                key = rng.randint(-50, 1100)
+                ranked.add(key)
+                bisect.insort(reference, key)
+            elif operation < 0.9:
+                key = rng.choice(reference)
+                ranked.remove(key)
+                reference.remove(key)
+            else:
+                try:
+                    ranked.remove(-999)
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError("removing a missing key did not raise")
+            if step % CHECK_EVERY == 0:
+                _compare(ranked, reference, rng)
+        except AssertionError as e:
+            raise AssertionError(f"block size {block_size}, seed {seed}, step {step}: {e}")
+
+    # Drain, then reuse the emptied list
+    for key in list(reference):
+        ranked.remove(key)
+    assert len(ranked) == 0 and list(ranked.iter_from(0)) == [], "not empty after draining"
+    ranked.add(5)
+    assert ranked[0] == 5 and ranked.rank(5) == 0, "emptied list not reusable"
+
+
+def check_leaderboard() -> None:
+    """
+    Order (descending ELO, ties by player ID), ranks and updates of a Leaderboard.
+    @raise AssertionError: On a mismatch
+    """
+    board = Leaderboard({1: 1500.0, 2: 1600.0, 3: 1500.0})
+    assert board.top(3) == [(2, 1600.0), (1, 1500.0), (3, 1500.0)], "initial order"
+    assert board.rank(3) == 3 and board.rank(9) is None, "initial ranks"
+    board.set(3, 1700.0)
+    board.set(4, 1000.0)
+    assert board.top(2) == [(3, 1700.0), (2, 1600.0)], "order after updates"
+    assert board.rank(4) == 4 and board.top(2, offset=3) == [(4, 1000.0)], "ranks after updates"
+
+
+def run_checks(seed: int = 1, steps: int = 5000) -> bool:
+    """
+    Run every check.
+    @param seed: Random seed
+    @param steps: Operations per block size
+    @return: Whether all checks passed
+    """
+    try:
+        for block_size in BLOCK_SIZES:
+            check_ranked_list(block_size, seed, steps)
+        check_leaderboard()
+    except AssertionError as e:
+        print(f"FAIL: {e}")
+        return False
+    print(f"OK: RankedList (block sizes {BLOCK_SIZES}, {steps} steps each) and Leaderboard.")
+    return True
+
+
+# Usage
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=5000)
+    args = parser.parse_args()
+    sys.exit(0 if run_checks(args.seed, args.steps) else 1)
@@ -1,10 +1,7 @@
 import subprocess
-import sys
-from pathlib import Path
-from footy.player_elo.game_validator import validate_games
-from footy.player_elo.reset_players_elo import reset_init_players_elo_db
-from footy.player_elo.init_sql import init_sql_db
-from footy.player_elo.elo_updater import update_elo
+
+# Subsystems (SQLAlchemy, pandas, psycopg, multiprocessing) are imported by the command that uses
+# them, so the menu shows up without loading any of them (see scripts/check_import_time.py).
 
 
 def reset_db():
@@ -15,6 +12,11 @@ def reset_db():
     # which had to be runned only ONCE, for entire development! So we don't have to run it again
     # when program is actually used.
 
+    from footy.player_elo.club_elo import calculate_clubs_elo
+    from footy.player_elo.game_features import materialize_game_features
+    from footy.player_elo.game_validator import validate_games
+    from footy.player_elo.init_sql import init_sql_db
+
     try:
         print("\nResetting database...")
         # subprocess.run([sys.executable, str(script_init_path)], check=True)
@@ -22,6 +24,8 @@ def reset_db():
         # reset_init_players_elo_db()
         init_sql_db()
         validate_games()
+        materialize_game_features()
+        calculate_clubs_elo()
         # subprocess.run([sys.executable, str(script_reset_path)], check=True)
         print("Database reset successfully!\n")
     except ValueError as e:
@@ -32,6 +36,8 @@ def reset_players_elo():
     """
     Resets the players ELO table of Postgresql DB
     """
+    from footy.player_elo.reset_players_elo import reset_init_players_elo_db
+
     # Build the absolute path to init_player_elo.py
     try:
         print("\nResetting Players ELO table...")
@@ -43,6 +49,8 @@ def reset_players_elo():
 
 
 def run_analysis():
+    from footy.player_elo.elo_updater import update_elo
+
     try:
         print("\nRunning analysis...")
         update_elo()
@@ -51,6 +59,22 @@ def run_analysis():
         print(f"Error during analysis: {e}\n")
 
 
+def export_elo():
+    import sqlite3
+
+    import psycopg
+
+    from footy.player_elo.elo_export import export_elo_parquet
+
+    try:
+        print("\nExporting ELO results...")
+        export_elo_parquet()
+        print("Export completed successfully!\n")
+    # pyarrow missing, tables missing (database not reset yet), database down, disk errors
+    except (ImportError, psycopg.Error, sqlite3.Error, OSError) as e:
+        print(f"Error during export: {e}\n")
+
+
 def start_app():
     """
     Main function to display menu and handle user input.
@@ -63,9 +87,13 @@ def start_app():
         )
         print("2. Reset Players ELO : Re-init. players ELO (Takes less than a minute)")
         print("3. Run Analysis : Continue on analysing ELO.")
-        print("4. Exit")
+        print(
+            "4. Export ELO : Write ratings and rating history to Parquet files "
+            "(data/parquet, one directory per season)."
+        )
+        print("5. Exit")
 
-        choice = input("Enter your choice (1/2/3/4): ").strip()
+        choice = input("Enter your choice (1/2/3/4/5): ").strip()
 
         if choice == "1":
             confirm = input("Do you really want to reset database? (y/n): ").strip()
@@ -78,6 +106,8 @@ def start_app():
         elif choice == "3":
             run_analysis()
         elif choice == "4":
+            export_elo()
+        elif choice == "5":
             print("Exiting the program. Goodbye!")
             break
         else:
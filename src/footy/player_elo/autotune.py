@@ -0,0 +1,244 @@
+import logging
+import os
+from typing import Dict, Optional
+
+# Default bounds of the tuned settings
+MIN_CHUNKSIZE = 1
+MAX_CHUNKSIZE = 50
+MIN_FLUSH_LIMIT = 500
+MAX_FLUSH_LIMIT = 50000
+MIN_WORKERS = 1
+
+
+class EloAutoTuner:
+    """
+    Tune the ELO replay settings while it runs: games per task sent to a worker (chunksize of the
+    pool's map), player ELO updates kept before a flush and number of worker processes.
+
+    The batch size is not tuned: the games of a batch read the ratings of the batch start, so it
+    sets which ratings a game sees. Tuning it on wall time would make the ELOs depend on the speed
+    of the machine; the tuned settings only change how fast a batch is replayed.
+
+    The updater reports every batch (games, wall time, time the workers spent on games) and every
+    flush (updates, time). Every `window` batches the tuner compares the window's throughput
+    (games/s) with the previous window's and adjusts one setting:
+    - flushes taking more than `flush_share` of the wall time: flush less often (bigger flushes),
+      taking less than a quarter of it: flush more often (less memory, smaller loss on a crash),
+    - workers idle for more than `idle_share` of their time (waiting for the slowest chunk of the
+      batch): smaller chunks, which spread the batch more evenly,
+    - otherwise hill climbing, alternating between chunksize and workers (by a factor of
+      `step`): the last change is kept and pushed further if throughput did not drop, reverted
+      and reversed if it did. A reverted setting is left alone for `settle` decisions, so a
+      tuned run does not keep resizing its pool.
+    Every decision is logged with the measurements behind it.
+
+    Attributes:
+        chunksize: Games per task sent to a worker.
+        flush_limit: Player ELO updates kept before a flush.
+        n_workers: Worker processes.
+    """
+
+    def __init__(
+        self,
+        chunksize: int = 5,
+        flush_limit: int = 1000,
+        n_workers: int = 4,
+        min_chunksize: int = MIN_CHUNKSIZE,
+        max_chunksize: int = MAX_CHUNKSIZE,
+        min_flush_limit: int = MIN_FLUSH_LIMIT,
+        max_flush_limit: int = MAX_FLUSH_LIMIT,
+        min_workers: int = MIN_WORKERS,
+        max_workers: Optional[int] = None,
+        window: int = 3,
+        settle: int = 5,
+        step: float = 1.5,
+        tolerance: float = 0.05,
+        flush_share: float = 0.1,
+        idle_share: float = 0.25,
+        enabled: bool = True,
+    ):
+        """
+        @param chunksize: Initial games per task
+        @param flush_limit: Initial updates kept before a flush
+        @param n_workers: Initial worker processes
+        @param min_chunksize: Lower bound of chunksize
+        @param max_chunksize: Upper bound of chunksize
+        @param min_flush_limit: Lower bound of flush_limit
+        @param max_flush_limit: Upper bound of flush_limit
+        @param min_workers: Lower bound of n_workers
+        @param max_workers: Upper bound of n_workers (default: twice the CPU count, as workers
+            also wait for the database)
+        @param window: Batches measured between two decisions
+        @param settle: Decisions a reverted setting is left alone (it is at its best value)
+        @param step: Factor a setting is multiplied / divided by (workers move by one at least)
+        @param tolerance: Relative throughput drop still counted as no change (noise)
+        @param flush_share: Share of wall time flushes may take
+        @param idle_share: Share of worker time that may be spent idle
+        @param enabled: False keeps the initial settings (measurements are still logged)
+        """
+        max_workers = max_workers or max(2 * (os.cpu_count() or 1), n_workers)
+        self.bounds = {
+            "chunksize": (min_chunksize, max_chunksize),
+            "flush_limit": (min_flush_limit, max_flush_limit),
+            "n_workers": (min_workers, max(max_workers, min_workers)),
+        }
+        self.settings = {
+            "chunksize": self._clamp("chunksize", chunksize),
+            "flush_limit": self._clamp("flush_limit", flush_limit),
+            "n_workers": self._clamp("n_workers", n_workers),
+        }
+        self.window = window
+        self.settle = settle
+        self.step = step
+        self.tolerance = tolerance
+        self.flush_share = flush_share
+        self.idle_share = idle_share
+        self.enabled = enabled
+
+        # Hill climbing: setting to move next, direction of each setting, last move (to revert)
+        self._next_setting = "chunksize"
+        self._directions = {"chunksize": 1, "n_workers": 1}
+        self._last_move = None
+        self._last_throughput = None
+        # Setting -> decisions left before it is explored again
+        self._settling = {"chunksize": 0, "n_workers": 0}
+        self._reset_window()
+
+    @property
+    def chunksize(self) -> int:
+        return self.settings["chunksize"]
+
+    @property
+    def flush_limit(self) -> int:
+        return self.settings["flush_limit"]
+
+    @property
+    def n_workers(self) -> int:
+        return self.settings["n_workers"]
+
+    def _clamp(self, setting: str, value: float) -> int:
+        low, high = self.bounds[setting]
+        return int(min(max(round(value), low), high))
+
+    def _reset_window(self) -> None:
+        self._batches = 0
+        self._games = 0
+        self._seconds = 0.0
+        self._busy_seconds = 0.0
+        self._worker_seconds = 0.0
+        self._flush_seconds = 0.0
+        self._flushed_updates = 0
+
+    def record_batch(self, games: int, seconds: float, busy_seconds: float) -> None:
+        """
+        Measure a batch (from the pool call to the end of its bookkeeping, flushes included).
+        @param games: Games processed
+        @param seconds: Wall time of the batch
+        @param busy_seconds: Sum of the workers' processing time of its games
+        @return: None
+        """
+        self._batches += 1
+        self._games += games
+        self._seconds += seconds
+        self._busy_seconds += busy_seconds
+        self._worker_seconds += seconds * self.n_workers
+
+    def record_flush(self, updates: int, seconds: float) -> None:
+        """
+        Measure a flush of player ELO updates.
+        @param updates: Updates flushed
+        @param seconds: Time of the flush
+        @return: None
+        """
+        self._flushed_updates += updates
+        self._flush_seconds += seconds
+
+    def _set(self, setting: str, value: float, reason: str) -> bool:
+        """Change a setting within its bounds and log it. @return: Whether it changed"""
+        value = self._clamp(setting, value)
+        old_value = self.settings[setting]
+        if value == old_value:
+            return False
+        self.settings[setting] = value
+        logging.info(f"Autotune: {setting} {old_value} -> {value} ({reason})")
+        return True
+
+    def _move(self, setting: str, direction: int) -> bool:
+        """One hill climbing step of a setting. @return: Whether it changed"""
+        value = self.settings[setting]
+        new_value = value * self.step if direction > 0 else value / self.step
+        if setting == "n_workers":
+            # At least one worker more / less
+            new_value = max(value + 1, new_value) if direction > 0 else min(value - 1, new_value)
+        return self._set(setting, new_value, "exploring")
+
+    def update(self) -> Dict[str, int]:
+        """
+        Decide on new settings once `window` batches have been measured.
+        @return: Settings that changed (setting -> new value), empty if none
+        """
+        if self._batches < self.window or self._seconds <= 0:
+            return {}
+
+        before = dict(self.settings)
+        throughput = self._games / self._seconds
+        idle = 1 - self._busy_seconds / self._worker_seconds if self._worker_seconds else 0.0
+        flush = self._flush_seconds / self._seconds
+        measurements = (
+            f"{throughput:.1f} games/s, workers idle {idle:.0%}, flushes {flush:.0%} of time"
+        )
+        logging.info(f"Autotune: {measurements} with {self.settings}")
+
+        if self.enabled:
+            previous = self._last_throughput
+            if flush > self.flush_share:
+                self._set(
+                    "flush_limit",
+                    self.flush_limit * self.step,
+                    f"flushes take {flush:.0%} of time",
+                )
+            elif flush < self.flush_share / 4 and self._flushed_updates:
+                self._set(
+                    "flush_limit",
+                    self.flush_limit / self.step,
+                    f"flushes take {flush:.0%} of time",
+                )
+
+            if self._last_move and previous and throughput < previous * (1 - self.tolerance):
+                # The last move made things worse: undo it and explore the other way next time
+                setting, old_value = self._last_move
+                self._set(
+                    setting,
+                    old_value,
+                    f"reverted, {throughput:.1f} < {previous:.1f} games/s",
+                )
+                self._directions[setting] *= -1
+                self._settling[setting] = self.settle
+                self._last_move = None
+                # Measure the reverted settings before moving again
+                throughput = previous
+            elif idle > self.idle_share and self.chunksize > self.bounds["chunksize"][0]:
+                old_value = self.chunksize
+                if self._set("chunksize", self.chunksize / self.step, f"workers idle {idle:.0%}"):
+                    self._last_move = ("chunksize", old_value)
+            else:
+                self._last_move = None
+                first = self._next_setting
+                second = "n_workers" if first == "chunksize" else "chunksize"
+                self._next_setting = second
+                for setting in (first, second):
+                    if self._settling[setting] > 0:
+                        self._settling[setting] -= 1
+                        continue
+                    old_value = self.settings[setting]
+                    if self._move(setting, self._directions[setting]):
+                        self._last_move = (setting, old_value)
+                        break
+                    # At a bound: explore the other way next time, move the other setting now
+                    self._directions[setting] *= -1
+            self._last_throughput = throughput
+
+        self._reset_window()
+        return {
+            setting: value for setting, value in self.settings.items() if before[setting] != value
+        }
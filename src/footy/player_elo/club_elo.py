@@ -0,0 +1,275 @@
+import time
+from typing import Dict
+
+import numpy as np
+
+from footy.player_elo.database_connection import DatabaseConnection, backend_of
+
+BASE_CLUB_ELO = 1500
+CLUB_ELO_K = 20
+
+
+def expected_home_score(home_elo, away_elo):
+    """
+    Expected score of the home club (chance of success E_home).
+    @param home_elo: ELO of the home club (float or array)
+    @param away_elo: ELO of the away club (float or array)
+    @return: Expected score in [0, 1]
+    """
+    return 1 / (1 + 10 ** ((away_elo - home_elo) / 400))
+
+
+class ClubEloCalculator:
+    """
+    Compute club ELOs from scratch by replaying `club_games` chronologically.
+
+    Club IDs are mapped once to dense array indices, so reading and writing a club's rating is an
+    O(1) index instead of a scan of all clubs, and every game is replayed exactly once from its
+    home club's row. Ratings before and after each game are kept as the club ELO history.
+
+    Results are stored in `clubs_elo` (current rating per club) and `club_elo_history`
+    (rating of both clubs before / after every game), next to `players_elo`.
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+        base_elo: Initial ELO of every club.
+        k: ELO K factor.
+    """
+
+    def __init__(self, conn, base_elo: float = BASE_CLUB_ELO, k: float = CLUB_ELO_K):
+        """
+        Initialize the ClubEloCalculator class.
+
+        Args:
+            conn: Database connection object for creating cursors.
+            base_elo: Initial ELO of every club.
+            k: ELO K factor.
+        """
+        self.conn = conn
+        self.backend = backend_of(conn)
+        self.base_elo = base_elo
+        self.k = k
+
+    def fetch_club_games(self) -> Dict[str, np.ndarray]:
+        """
+        Fetch every game with a result, one row per game (its home club's row), in replay order.
+        @return: Arrays game_id, date, home_club_id, away_club_id, home_goals, away_goals
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT g.game_id, g.date, cg.club_id, cg.opponent_id,
+                       cg.own_goals, cg.opponent_goals
+                FROM club_games cg
+                JOIN games g ON g.game_id = cg.game_id
+                WHERE cg.hosting = 'Home'
+                  AND g.date IS NOT NULL
+                  AND cg.club_id IS NOT NULL AND cg.opponent_id IS NOT NULL
+                  AND cg.own_goals IS NOT NULL AND cg.opponent_goals IS NOT NULL
+                ORDER BY g.date, g.game_id;
+            """
+            )
+            rows = cur.fetchall()
+
+        columns = list(zip(*rows)) if rows else [()] * 6
+        return {
+            "game_id": np.asarray(columns[0], dtype=np.int64),
+            "date": np.asarray(columns[1], dtype="datetime64[D]"),
+            "home_club_id": np.asarray(columns[2], dtype=np.int64),
+            "away_club_id": np.asarray(columns[3], dtype=np.int64),
+            "home_goals": np.asarray(columns[4], dtype=np.int64),
+            "away_goals": np.asarray(columns[5], dtype=np.int64),
+        }
+
+    def replay(self, games: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Replay the games in order and compute every club's ELO.
+
+        @param games: Arrays as returned by `fetch_club_games`, sorted chronologically
+        @return: Arrays club_id, elo, games_played (one entry per club) and
+            home_elo_before, away_elo_before, home_elo_after, away_elo_after (one entry per game)
+        """
+        # Club ID -> dense index: home clubs are the first n_games entries of the inverse
+        n_games = len(games["game_id"])
+        club_ids, club_index = np.unique(
+            np.concatenate([games["home_club_id"], games["away_club_id"]]),
+            return_inverse=True,
+        )
+        home_index = club_index[:n_games]
+        away_index = club_index[n_games:]
+
+        # Actual score of the home club: 1 win, 0.5 draw, 0 loss
+        home_score = (
+            np.sign(games["home_goals"] - games["away_goals"]).astype(np.float64) + 1
+        ) / 2
+
+        # Ratings live in a list while replaying: scalar reads/writes are cheaper than on arrays
+        ratings = [float(self.base_elo)] * len(club_ids)
+        home_before = np.empty(n_games)
+        away_before = np.empty(n_games)
+        home_after = np.empty(n_games)
+        away_after = np.empty(n_games)
+        k = self.k
+        for i, (home, away, score) in enumerate(
+            zip(home_index.tolist(), away_index.tolist(), home_score.tolist())
+        ):
+            home_elo = ratings[home]
+            away_elo = ratings[away]
+            change = k * (score - expected_home_score(home_elo, away_elo))
+            ratings[home] = home_elo + change
+            ratings[away] = away_elo - change
+            home_before[i] = home_elo
+            away_before[i] = away_elo
+            home_after[i] = ratings[home]
+            away_after[i] = ratings[away]
+
+        return {
+            "club_id": club_ids,
+            "elo": np.asarray(ratings),
+            "games_played": np.bincount(club_index, minlength=len(club_ids)),
+            "home_elo_before": home_before,
+            "away_elo_before": away_before,
+            "home_elo_after": home_after,
+            "away_elo_after": away_after,
+        }
+
+    def _write_rows(self, cur, table: str, columns: tuple, rows) -> None:
+        """
+        Bulk-insert rows into a table (COPY on Postgres, executemany on SQLite).
+        @param cur: Database cursor
+        @param table: Table name
+        @param columns: Column names
+        @param rows: Iterable of row tuples
+        @return: None
+        """
+        column_list = ", ".join(columns)
+        if self.backend == "postgres":
+            with cur.copy(f"COPY {table} ({column_list}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            placeholders = ", ".join(["%s"] * len(columns))
+            cur.executemany(
+                f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})", rows
+            )
+
+    def store(self, games: Dict[str, np.ndarray], result: Dict[str, np.ndarray]):
+        """
+        (Re)build `clubs_elo` and `club_elo_history` from a replay, in one transaction.
+        @param games: Replayed games (see `fetch_club_games`)
+        @param result: Replay result (see `replay`)
+        @return: None
+        """
+        # Last game date of every club
+        n_games = len(games["game_id"])
+        club_index = np.searchsorted(
+            result["club_id"],
+            np.concatenate([games["home_club_id"], games["away_club_id"]]),
+        )
+        last_game = np.full(len(result["club_id"]), -1)
+        np.maximum.at(last_game, club_index, np.tile(np.arange(n_games), 2))
+        last_game_date = games["date"][last_game].astype(object)
+
+        club_rows = zip(
+            result["club_id"].tolist(),
+            result["elo"].tolist(),
+            result["games_played"].tolist(),
+            last_game_date.tolist(),
+        )
+        dates = games["date"].astype(object).tolist()
+        game_ids = games["game_id"].tolist()
+        history_rows = [
+            row
+            for side in ("home", "away")
+            for row in zip(
+                game_ids,
+                games[f"{side}_club_id"].tolist(),
+                dates,
+                result[f"{side}_elo_before"].tolist(),
+                result[f"{side}_elo_after"].tolist(),
+            )
+        ]
+
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    """
+                    DROP TABLE IF EXISTS clubs_elo;
+                    CREATE TABLE clubs_elo (
+                        club_id INTEGER PRIMARY KEY,
+                        elo DOUBLE PRECISION NOT NULL,
+                        games_played INTEGER NOT NULL,
+                        last_game_date DATE
+                    );
+
+                    DROP TABLE IF EXISTS club_elo_history;
+                    CREATE TABLE club_elo_history (
+                        game_id INTEGER NOT NULL,
+                        club_id INTEGER NOT NULL,
+                        date DATE NOT NULL,
+                        elo_before DOUBLE PRECISION NOT NULL,
+                        elo_after DOUBLE PRECISION NOT NULL
+                    );
+                """
+                )
+                self._write_rows(
+                    cur,
+                    "clubs_elo",
+                    ("club_id", "elo", "games_played", "last_game_date"),
+                    club_rows,
+                )
+                self._write_rows(
+                    cur,
+                    "club_elo_history",
+                    ("game_id", "club_id", "date", "elo_before", "elo_after"),
+                    history_rows,
+                )
+                # Keys are added after loading, which is faster than maintaining them per row
+                cur.execute(
+                    """
+                    CREATE UNIQUE INDEX club_elo_history_pk
+                        ON club_elo_history (game_id, club_id);
+                    CREATE INDEX club_elo_history_club_date_idx
+                        ON club_elo_history (club_id, date);
+                    ANALYZE clubs_elo;
+                    ANALYZE club_elo_history;
+                """
+                )
+                self.conn.commit()
+        except Exception as e:
+            print(f"Error storing club ELOs: {e}")
+            self.conn.rollback()
+            raise
+
+    def calculate_clubs_elo(self):
+        """Main function: fetch, replay and store club ELOs, printing the time of each step."""
+        start_time = time.perf_counter()
+        games = self.fetch_club_games()
+        fetched_time = time.perf_counter()
+        print(
+            f"Fetched {len(games['game_id'])} club games. ({fetched_time - start_time:.2f}s)"
+        )
+
+        result = self.replay(games)
+        replayed_time = time.perf_counter()
+        print(
+            f"Replayed club ELOs of {len(result['club_id'])} clubs. "
+            f"({replayed_time - fetched_time:.2f}s)"
+        )
+
+        self.store(games, result)
+        print(f"Club ELOs stored. ({time.perf_counter() - replayed_time:.2f}s)")
+
+
+def calculate_clubs_elo():
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        calculator = ClubEloCalculator(conn)
+        calculator.calculate_clubs_elo()
+
+
+# Usage
+if __name__ == "__main__":
+    calculate_clubs_elo()
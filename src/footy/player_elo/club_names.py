@@ -0,0 +1,272 @@
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from footy.player_elo.database_connection import DATA_DIR, DatabaseConnection
+
+# Words that do not tell clubs apart ("Liverpool FC" is "Liverpool Football Club" is "Liverpool")
+STOP_WORDS = {
+    "fc", "cf", "afc", "sc", "ac", "as", "ss", "us", "cd", "sd", "ud", "rc", "fk", "pfk", "sk",
+    "bk", "if", "ik", "kv", "krc", "sv", "vfb", "vfl", "tsg", "bsc", "ssc", "ssd", "sad", "spa",
+    "club", "football", "futbol", "futebol", "fussball", "calcio", "de", "del", "da", "do", "the",
+    "associazione", "sportiva", "sporting", "unione", "societa", "deportiva",
+    "athletic", "athletico", "sportclub", "clube", "real", "spor", "kulubu", "fodbold", "1", "e", "v",
+}  # fmt: skip
+# ClubElo short forms
+ABBREVIATIONS = {
+    "man": "manchester",
+    "utd": "united",
+    "st": "saint",
+    "sp": "sporting",
+    "dep": "deportivo",
+    "ath": "athletic",
+    "atl": "atletico",
+}
+# ClubElo country -> prefix of Transfermarkt domestic competition IDs (clubs.domestic_competition_id)
+COUNTRY_COMPETITIONS = {
+    "ENG": "GB",
+    "ESP": "ES",
+    "ITA": "IT",
+    "GER": "L",
+    "FRA": "FR",
+    "POR": "PO",
+    "NED": "NL",
+    "BEL": "BE",
+    "TUR": "TR",
+    "SCO": "SC",
+    "RUS": "RU",
+    "UKR": "UKR",
+    "GRE": "GR",
+    "DEN": "DK",
+}
+
+NGRAM_SIZE = 3
+# Words closer than this (difflib ratio) count as the same word ("kryliya" / "krylya")
+WORD_MATCH_RATIO = 0.8
+
+
+def normalize_club_name(name: str) -> str:
+    """
+    Canonical form of a club name: no accents, case or punctuation, short forms expanded and
+    generic words ("FC", "Football Club", ...) removed.
+    @param name: Club name
+    @return: Normalized name (falls back to all words if they are all generic)
+    """
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode()
+    text = re.sub(r"\(.*?\)", " ", text.lower()).replace("&", " and ")
+    words = [ABBREVIATIONS.get(word, word) for word in re.findall(r"[a-z0-9]+", text)]
+    meaningful = [word for word in words if word not in STOP_WORDS]
+    return " ".join(meaningful or words)
+
+
+def _ngrams(text: str) -> set:
+    """Character n-grams of a normalized name, padded so word starts and ends count."""
+    padded = f" {text} "
+    return {padded[i : i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+def name_similarity(a: str, b: str) -> float:
+    """
+    Similarity (0-100) of two normalized names: the best of their edit-based ratio and, when every
+    word of the shorter name is close to a word of the longer one ("tottenham" / "tottenham
+    hotspur"), the word similarity discounted by the share of words left out.
+    """
+    score = SequenceMatcher(None, a, b).ratio()
+    shorter, longer = sorted((a.split(), b.split()), key=len)
+    if shorter:
+        word_scores = [
+            max(SequenceMatcher(None, word, other).ratio() for other in longer)
+            for word in shorter
+        ]
+        if min(word_scores) >= WORD_MATCH_RATIO:
+            coverage = len(shorter) / len(longer)
+            score = max(score, sum(word_scores) / len(shorter) * (0.85 + 0.15 * coverage))
+    return 100 * score
+
+
+class ClubNameMatcher:
+    """
+    Resolve club names from other sources (ClubElo, fbref, ...) to `clubs.club_id`.
+
+    Club names are normalized and indexed by character trigrams (inverted index: trigram ->
+    clubs). A name is only scored against the shortlist of clubs sharing the most trigrams with
+    it, not against every club. Accepted matches are stored in the `club_aliases` table (name ->
+    club_id) and resolved with a dictionary lookup from then on.
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+        threshold: Minimum similarity (0-100) of an accepted match.
+    """
+
+    SHORTLIST_SIZE = 10
+
+    def __init__(self, conn, threshold: float = 85, shortlist_size: int = SHORTLIST_SIZE):
+        """
+        Initialize the ClubNameMatcher class: load the clubs and aliases and build the index.
+
+        Args:
+            conn: Database connection object for creating cursors.
+            threshold: Minimum similarity (0-100) of an accepted match.
+            shortlist_size: Clubs scored per name.
+        """
+        self.conn = conn
+        self.threshold = threshold
+        self.shortlist_size = shortlist_size
+        self._new_aliases = {}
+
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS club_aliases (
+                    alias TEXT PRIMARY KEY,
+                    club_id INTEGER NOT NULL,
+                    score DOUBLE PRECISION
+                );
+            """
+            )
+            cur.execute(
+                "SELECT club_id, name, domestic_competition_id FROM clubs WHERE name IS NOT NULL"
+            )
+            clubs = cur.fetchall()
+            cur.execute("SELECT alias, club_id FROM club_aliases")
+            self.aliases: Dict[str, int] = dict(cur.fetchall())
+        self.conn.commit()
+
+        self.club_ids = [club_id for club_id, _, _ in clubs]
+        self.names = [normalize_club_name(name) for _, name, _ in clubs]
+        self.competitions = [competition or "" for _, _, competition in clubs]
+        self.index: Dict[str, List[int]] = defaultdict(list)
+        self._ngram_counts = []
+        for position, name in enumerate(self.names):
+            ngrams = _ngrams(name)
+            self._ngram_counts.append(len(ngrams))
+            for ngram in ngrams:
+                self.index[ngram].append(position)
+
+    def _shortlist(self, name: str, country: Optional[str]) -> List[int]:
+        """
+        Clubs sharing the most trigrams with a normalized name (Dice coefficient).
+        @param name: Normalized name
+        @param country: ClubElo country code, restricting clubs to its competitions if known
+        @return: Positions of the shortlisted clubs
+        """
+        ngrams = _ngrams(name)
+        shared = Counter(position for ngram in ngrams for position in self.index.get(ngram, ()))
+        prefix = COUNTRY_COMPETITIONS.get(country) if country else None
+        if prefix:
+            shared = {
+                position: count
+                for position, count in shared.items()
+                if self.competitions[position].startswith(prefix)
+            }
+        return sorted(
+            shared,
+            key=lambda position: -2 * shared[position]
+            / (len(ngrams) + self._ngram_counts[position]),
+        )[: self.shortlist_size]
+
+    def match(self, name: str, country: Optional[str] = None) -> Tuple[Optional[int], float]:
+        """
+        Best club for a name, scoring only the shortlist (the alias table is not used).
+        @param name: Club name
+        @param country: ClubElo country code (optional)
+        @return: (club_id, similarity), club_id is None below the threshold
+        """
+        normalized = normalize_club_name(name)
+        best_position, best_score = None, 0.0
+        for position in self._shortlist(normalized, country):
+            score = name_similarity(normalized, self.names[position])
+            if score > best_score:
+                best_position, best_score = position, score
+        if best_position is None or best_score < self.threshold:
+            return None, best_score
+        return self.club_ids[best_position], best_score
+
+    def resolve(self, name: str, country: Optional[str] = None) -> Optional[int]:
+        """
+        Club ID of a name: from the alias table, else matched and added to the aliases.
+        @param name: Club name
+        @param country: ClubElo country code (optional)
+        @return: club_id, or None if no club is similar enough
+        """
+        club_id = self.aliases.get(name)
+        if club_id is not None:
+            return club_id
+        club_id, score = self.match(name, country)
+        if club_id is not None:
+            self.aliases[name] = club_id
+            self._new_aliases[name] = (club_id, score)
+        return club_id
+
+    def save_aliases(self) -> int:
+        """
+        Store the aliases accepted since the last save in `club_aliases`.
+        @return: Number of aliases stored
+        """
+        rows = [(alias, club_id, score) for alias, (club_id, score) in self._new_aliases.items()]
+        if rows:
+            with self.conn.cursor() as cur:
+                cur.executemany(
+                    """
+                    INSERT INTO club_aliases (alias, club_id, score) VALUES (%s, %s, %s)
+                    ON CONFLICT (alias) DO UPDATE
+                    SET club_id = EXCLUDED.club_id, score = EXCLUDED.score
+                    """,
+                    rows,
+                )
+            self.conn.commit()
+        self._new_aliases = {}
+        return len(rows)
+
+    def resolve_frame(
+        self, df: pd.DataFrame, name_column: str = "Club", country_column: str = "Country"
+    ) -> pd.Series:
+        """
+        Resolve every row of a DataFrame (e.g. a ClubElo snapshot) and save the new aliases.
+        @param df: DataFrame with club names
+        @param name_column: Column of the names
+        @param country_column: Column of the ClubElo country codes (ignored if missing)
+        @return: club_id per row (<NA> if unmatched)
+        """
+        countries = (
+            df[country_column] if country_column in df.columns else [None] * len(df)
+        )
+        club_ids = [
+            self.resolve(name, country) for name, country in zip(df[name_column], countries)
+        ]
+        self.save_aliases()
+        return pd.Series(club_ids, index=df.index, dtype="Int64", name="club_id")
+
+
+def match_club_elo_snapshot(
+    csv_path: Union[str, Path] = DATA_DIR / "club_elo_2024-09-21.csv",
+) -> pd.DataFrame:
+    """
+    Match a ClubElo snapshot to `clubs` and print how many clubs were matched.
+    @param csv_path: ClubElo CSV (Rank, Club, Country, Level, Elo, ...)
+    @return: Snapshot with a club_id column
+    """
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    snapshot = pd.read_csv(csv_path)
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        start_time = time.perf_counter()
+        matcher = ClubNameMatcher(conn)
+        snapshot["club_id"] = matcher.resolve_frame(snapshot)
+    print(
+        f"Matched {snapshot['club_id'].notna().sum()}/{len(snapshot)} clubs. "
+        f"({time.perf_counter() - start_time:.2f}s)"
+    )
+    return snapshot
+
+
+# Usage
+if __name__ == "__main__":
+    match_club_elo_snapshot()
@@ -0,0 +1,305 @@
+import struct
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from psycopg import NotSupportedError, pq
+
+from footy.player_elo.database_connection import DatabaseConnection, backend_of
+
+# Binary COPY framing (https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4)
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+COPY_HEADER_SIZE = len(COPY_SIGNATURE) + 4 + 4  # signature, flags, extension length
+COPY_TRAILER = b"\xff\xff"  # field count -1
+
+# Fixed-width Postgres types: OID -> (big-endian wire dtype, native result dtype)
+# Dates and timestamps are sent as days / microseconds since 2000-01-01.
+PG_FIXED_WIDTH_TYPES = {
+    16: ("?", "bool"),  # bool
+    21: (">i2", "int16"),  # int2
+    23: (">i4", "int32"),  # int4
+    20: (">i8", "int64"),  # int8
+    700: (">f4", "float32"),  # float4
+    701: (">f8", "float64"),  # float8
+    1082: (">i4", "datetime64[D]"),  # date
+    1114: (">i8", "datetime64[us]"),  # timestamp
+}
+# Typed zero sent instead of a NULL, per type OID (see _null_safe_query)
+PG_ZERO_LITERALS = {
+    16: "false",
+    21: "0::int2",
+    23: "0::int4",
+    20: "0::int8",
+    700: "0::float4",
+    701: "0::float8",
+    1082: "'2000-01-01'::date",
+    1114: "'2000-01-01'::timestamp",
+}
+PG_EPOCH_DAYS = np.datetime64("2000-01-01", "D").astype(np.int64)
+PG_EPOCH_MICROSECONDS = np.datetime64("2000-01-01", "us").astype(np.int64)
+
+
+class BinaryCopyReader:
+    """
+    Bulk-load query results into NumPy arrays with `COPY (...) TO STDOUT (FORMAT binary)`.
+
+    A regular cursor builds a Python tuple (and one object per value) for every row. Here the
+    raw COPY payload is kept as one buffer and each column is decoded with a single vectorized
+    NumPy conversion, so no per-row Python objects are created. Only fixed-width column types are
+    supported (see PG_FIXED_WIDTH_TYPES); cast or leave out text/numeric columns in the query.
+
+    A NULL field has no value bytes, which would give rows different sizes. So the query is
+    wrapped to send every column as a typed zero instead of NULL plus a bool "is NULL" column
+    (see _null_safe_query): every row has the same size, and the whole payload is viewed as a
+    structured array. The flags give the NULL masks: NULLs become NaN / NaT for float and date
+    columns, and are masked for int/bool columns.
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+    """
+
+    def __init__(self, conn):
+        """
+        Initialize the BinaryCopyReader class.
+
+        Args:
+            conn: Database connection object for creating cursors.
+
+        Raises:
+            ValueError: If the connection is not to a PostgreSQL database.
+        """
+        if backend_of(conn) != "postgres":
+            raise ValueError("Binary COPY is only available with the postgres backend.")
+        self.conn = conn
+
+    def column_types(self, query: str, params=None) -> List[Tuple[str, int]]:
+        """
+        Get the name and type OID of each column of the query, without fetching any rows.
+
+        @param query: SELECT query
+        @param params: Query parameters
+        @return: [(column_name, type_oid), ...]
+        @raise ValueError: If a column is not of a supported fixed-width type
+        @raise psycopg.NotSupportedError: If the connection is in pipeline mode (no COPY there)
+        """
+        if self.conn.pgconn.pipeline_status != pq.PipelineStatus.OFF:
+            raise NotSupportedError("Binary COPY cannot run in pipeline mode.")
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT * FROM ({query}) AS q LIMIT 0", params)
+            columns = [(column.name, column.type_code) for column in cur.description]
+
+        unsupported = [
+            name for name, oid in columns if oid not in PG_FIXED_WIDTH_TYPES
+        ]
+        if unsupported:
+            raise ValueError(
+                f"Columns {unsupported} are not of a fixed-width type supported by binary COPY "
+                f"decoding (OIDs {sorted(PG_FIXED_WIDTH_TYPES)})."
+            )
+        return columns
+
+    def _copy_payload(self, query: str, params=None) -> bytes:
+        """
+        Run the binary COPY of the query and collect its raw payload.
+        Postgres sends one CopyData message per row: they are read through psycopg's COPY, which
+        keeps the connection's transaction and error state, and joined once, without decoding
+        anything per row.
+
+        @param query: SELECT query
+        @param params: Query parameters (bound client-side by psycopg)
+        @return: The COPY payload (header, tuples and trailer)
+        @raise psycopg.Error: If the COPY fails
+        """
+        with self.conn.cursor() as cur:
+            with cur.copy(f"COPY ({query}) TO STDOUT (FORMAT binary)", params) as copy:
+                return b"".join(copy)
+
+    @staticmethod
+    def _tuples_start(payload) -> int:
+        """
+        Check the COPY header and get the offset of the first tuple.
+
+        @param payload: The COPY payload
+        @return: Offset of the first tuple
+        @raise ValueError: If the payload is not a binary COPY payload
+        """
+        if payload[: len(COPY_SIGNATURE)] != COPY_SIGNATURE:
+            raise ValueError("Not a binary COPY payload.")
+        (extension_length,) = struct.unpack_from(">i", payload, COPY_HEADER_SIZE - 4)
+        return COPY_HEADER_SIZE + extension_length
+
+    @staticmethod
+    def _null_safe_query(query: str, columns: List[Tuple[str, int]]) -> str:
+        """
+        Wrap a query so no field is NULL: each column is sent as its value or a typed zero,
+        followed by a bool column telling whether it was NULL.
+
+        @param query: SELECT query
+        @param columns: [(column_name, type_oid), ...] of the query
+        @return: Query with two columns (value, is NULL) per column of the query
+        """
+        fields = []
+        for name, oid in columns:
+            column = 'q."' + name.replace('"', '""') + '"'
+            fields.append(f"COALESCE({column}, {PG_ZERO_LITERALS[oid]}), {column} IS NULL")
+        return f"SELECT {', '.join(fields)} FROM ({query}) AS q"
+
+    @staticmethod
+    def _decode_fixed_rows(buffer, n_rows: int, widths: List[int], wire_dtypes):
+        """
+        View the tuples as a structured array (no value may be NULL).
+
+        @param buffer: The tuples of the payload (without header and trailer)
+        @param n_rows: Number of tuples
+        @param widths: Byte width of each column
+        @param wire_dtypes: Big-endian dtype of each column
+        @return: List of wire-dtype column arrays, or None if the tuples are not all full-width
+        """
+        n_columns = len(widths)
+        row_dtype = np.dtype(
+            [("n_fields", ">i2")]
+            + [
+                field
+                for i, wire_dtype in enumerate(wire_dtypes)
+                for field in ((f"length_{i}", ">i4"), (f"value_{i}", wire_dtype))
+            ]
+        )
+        rows = np.frombuffer(buffer, dtype=row_dtype, count=n_rows)
+        if not np.all(rows["n_fields"] == n_columns):
+            return None
+        for i, width in enumerate(widths):
+            if not np.all(rows[f"length_{i}"] == width):
+                return None
+        return [rows[f"value_{i}"] for i in range(n_columns)]
+
+    @staticmethod
+    def _to_native(values: np.ndarray, oid: int) -> np.ndarray:
+        """
+        Convert a column from its wire representation to its native NumPy dtype.
+
+        @param values: Big-endian column array
+        @param oid: Postgres type OID of the column
+        @return: Native column array
+        """
+        _, native_dtype = PG_FIXED_WIDTH_TYPES[oid]
+        if oid == 1082:
+            return (values.astype(np.int64) + PG_EPOCH_DAYS).astype(native_dtype)
+        if oid == 1114:
+            return (values.astype(np.int64) + PG_EPOCH_MICROSECONDS).astype(native_dtype)
+        return values.astype(native_dtype)
+
+    def _read_columns(self, query: str, params=None):
+        """
+        Run the binary COPY of the query and decode its columns.
+
+        @param query: SELECT query
+        @param params: Query parameters
+        @return: {column_name: (native array, NULL mask or None)}
+        """
+        columns = self.column_types(query, params)
+        # (value, is NULL) per column
+        wire_dtypes = [
+            dtype
+            for _, oid in columns
+            for dtype in (np.dtype(PG_FIXED_WIDTH_TYPES[oid][0]), np.dtype("?"))
+        ]
+        widths = [wire_dtype.itemsize for wire_dtype in wire_dtypes]
+
+        payload = self._copy_payload(self._null_safe_query(query, columns), params)
+        start = self._tuples_start(payload)
+        if payload[-len(COPY_TRAILER) :] != COPY_TRAILER:
+            raise ValueError("Binary COPY payload is missing its trailer.")
+        buffer = memoryview(payload)[start : -len(COPY_TRAILER)]
+
+        row_size = 2 + sum(4 + width for width in widths)
+        fields = None
+        if len(buffer) % row_size == 0:
+            fields = self._decode_fixed_rows(
+                buffer, len(buffer) // row_size, widths, wire_dtypes
+            )
+        if fields is None:
+            raise ValueError("Binary COPY tuples do not match the expected columns.")
+        values, nulls = fields[0::2], fields[1::2]
+
+        decoded = {}
+        for (name, oid), column_values, null_mask in zip(columns, values, nulls):
+            null_mask = np.asarray(null_mask, dtype=bool)
+            if not null_mask.any():
+                null_mask = None
+            decoded[name] = (self._to_native(column_values, oid), null_mask)
+        return decoded
+
+    def read_arrays(self, query: str, params=None) -> Dict[str, np.ndarray]:
+        """
+        Load the query results into one NumPy array per column.
+        NULLs become NaN (float), NaT (date/timestamp) or masked values (int/bool).
+
+        @param query: SELECT query with fixed-width columns only
+        @param params: Query parameters
+        @return: {column_name: array}
+        """
+        arrays = {}
+        for name, (values, null_mask) in self._read_columns(query, params).items():
+            if null_mask is None:
+                arrays[name] = values
+            elif values.dtype.kind == "f":
+                values[null_mask] = np.nan
+                arrays[name] = values
+            elif values.dtype.kind == "M":
+                values[null_mask] = np.datetime64("NaT")
+                arrays[name] = values
+            else:
+                arrays[name] = np.ma.masked_array(values, mask=null_mask)
+        return arrays
+
+    def read_dataframe(self, query: str, params=None) -> pd.DataFrame:
+        """
+        Load the query results into a DataFrame.
+        NULLs become NaN (float), NaT (date/timestamp) or <NA> in nullable Int/boolean columns.
+
+        @param query: SELECT query with fixed-width columns only
+        @param params: Query parameters
+        @return: DataFrame with one column per query column
+        """
+        data = {}
+        for name, (values, null_mask) in self._read_columns(query, params).items():
+            if null_mask is None:
+                data[name] = values
+            elif values.dtype.kind == "f":
+                values[null_mask] = np.nan
+                data[name] = values
+            elif values.dtype.kind == "M":
+                values[null_mask] = np.datetime64("NaT")
+                data[name] = values
+            elif values.dtype.kind == "b":
+                data[name] = pd.arrays.BooleanArray(values, null_mask)
+            else:
+                data[name] = pd.arrays.IntegerArray(values, null_mask)
+        return pd.DataFrame(data)
+
+
+def read_dataframe(query: str, params=None) -> pd.DataFrame:
+    """
+    Load the results of a query into a DataFrame through binary COPY.
+    @param query: SELECT query with fixed-width columns only
+    @param params: Query parameters
+    @return: DataFrame with one column per query column
+    """
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        reader = BinaryCopyReader(conn)
+        return reader.read_dataframe(query, params)
+
+
+# Usage
+if __name__ == "__main__":
+    appearances = read_dataframe(
+        """
+        SELECT game_id, player_id, player_club_id, date, minutes_played
+        FROM appearances
+        """
+    )
+    print(appearances.dtypes)
+    print(f"Loaded {len(appearances)} appearances.")
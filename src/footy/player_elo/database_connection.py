@@ -1,31 +1,71 @@
+import os
 from pathlib import Path
 from typing import Dict
 
 import psycopg
 
+from footy.player_elo.sqlite_backend import SQLiteConnection
+
 DATA_DIR = Path(__file__).resolve().parents[2] / "data"
 
+BACKENDS = ("postgres", "sqlite")
 
+# Storage backend, chosen with FOOTY_DB_BACKEND:
+# - "postgres": PostgreSQL server (default),
+# - "sqlite": embedded single-file database at FOOTY_SQLITE_PATH, no server needed.
 DATABASE_CONFIG = {
-    "dbname": "football",
-    "user": "postgres",
-    "password": "1234",
-    "host": "localhost",
-    "port": "5432",
+    "backend": os.environ.get("FOOTY_DB_BACKEND", "postgres"),
+    "dbname": os.environ.get("FOOTY_DB_NAME", "football"),
+    "user": os.environ.get("FOOTY_DB_USER", "postgres"),
+    "password": os.environ.get("FOOTY_DB_PASSWORD", "1234"),
+    "host": os.environ.get("FOOTY_DB_HOST", "localhost"),
+    "port": os.environ.get("FOOTY_DB_PORT", "5432"),
+    "path": os.environ.get("FOOTY_SQLITE_PATH", str(DATA_DIR / "football.sqlite3")),
 }
 
+# Config keys that are not psycopg connection parameters
+_BACKEND_KEYS = ("backend", "path")
+
+
+def backend_of(conn) -> str:
+    """
+    Get the storage backend of a connection, to pick the queries written for it.
+    @param conn: psycopg connection or SQLiteConnection
+    @return: "postgres" or "sqlite"
+    """
+    return getattr(conn, "backend", "postgres")
+
 
 class DatabaseConnection:
     """
-    Set up connection with PostgreSQL database
+    Set up connection with the configured database (PostgreSQL or embedded SQLite)
     """
 
     def __init__(self, config: Dict[str, str]):
         self.config = config
         self.conn = None
 
+    def connect(self):
+        """
+        Open a new connection with the configured database.
+        @return: psycopg connection, or SQLiteConnection for the sqlite backend
+        @raise ValueError: If the configured backend is unknown
+        """
+        backend = self.config.get("backend", "postgres")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown database backend {backend!r}, use one of {BACKENDS}.")
+        if backend == "sqlite":
+            return SQLiteConnection(self.config["path"])
+        return psycopg.connect(
+            **{
+                key: value
+                for key, value in self.config.items()
+                if key not in _BACKEND_KEYS
+            }
+        )
+
     def __enter__(self):
-        self.conn = psycopg.connect(**self.config)
+        self.conn = self.connect()
         return self.conn
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -0,0 +1,288 @@
+import shutil
+import time
+from itertools import groupby, islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from footy.player_elo.database_connection import DATA_DIR, DatabaseConnection, backend_of
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only the export needs it
+    pa = pq = None
+
+# Rows fetched from the cursor and written as one Parquet row group
+BATCH_ROWS = 50_000
+EXPORT_DIR = DATA_DIR / "parquet"
+
+# Typing
+# Dataset -> (query, [(column, arrow type name)], partitioned by season)
+ExportSpec = Tuple[str, List[Tuple[str, str]], bool]
+
+
+class EloParquetExporter:
+    """
+    Export ELO results into Parquet datasets for notebooks (`pd.read_parquet`), instead of
+    row-wise queries and CSV dumps:
+    - player_ratings: `players_elo` (one row per player and season) with player metadata,
+    - club_rating_history: `club_elo_history` (both clubs before / after every game),
+    - club_ratings: `clubs_elo` (current rating per club).
+
+    Season datasets are partitioned Hive-style (`player_ratings/season=2012/part-0.parquet`), so
+    loading a season reads one file and `filters=[("season", "=", 2012)]` skips the others.
+    String columns are dictionary encoded (names, positions, countries repeat a lot) and come back
+    as categoricals.
+
+    Rows are streamed: read in batches of `batch_rows` from a server-side (named) cursor, ordered
+    by season so only one file is open at a time, and written as one row group per batch. Memory
+    stays flat whatever the size of the tables. A dataset is written next to the previous export
+    and swapped in when complete, so readers never see half an export.
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+        batch_rows: Rows per fetched batch / row group.
+    """
+
+    # Column types: "dict" is a dictionary-encoded string (see _schema)
+    EXPORTS: Dict[str, ExportSpec] = {
+        "player_ratings": (
+            """
+            SELECT pe.season, pe.player_id, pe.elo, pe.name, pe.first_name, pe.last_name,
+                   pe.player_code, pe.date_of_birth, pe.country_of_birth,
+                   p.country_of_citizenship, p.position, p.sub_position, p.foot, p.height_in_cm,
+                   p.current_club_id, p.current_club_name, p.market_value_in_eur
+            FROM players_elo pe
+            LEFT JOIN players p ON p.player_id = pe.player_id
+            WHERE pe.season IS NOT NULL
+            ORDER BY pe.season, pe.player_id
+            """,
+            [
+                ("season", "int32"),
+                ("player_id", "int64"),
+                ("elo", "float64"),
+                ("name", "dict"),
+                ("first_name", "dict"),
+                ("last_name", "dict"),
+                ("player_code", "dict"),
+                ("date_of_birth", "date"),
+                ("country_of_birth", "dict"),
+                ("country_of_citizenship", "dict"),
+                ("position", "dict"),
+                ("sub_position", "dict"),
+                ("foot", "dict"),
+                ("height_in_cm", "float64"),
+                ("current_club_id", "int64"),
+                ("current_club_name", "dict"),
+                ("market_value_in_eur", "float64"),
+            ],
+            True,
+        ),
+        "club_rating_history": (
+            """
+            SELECT g.season, h.game_id, h.club_id, c.name AS club_name, g.competition_id,
+                   h.date, h.elo_before, h.elo_after
+            FROM club_elo_history h
+            JOIN games g ON g.game_id = h.game_id
+            LEFT JOIN clubs c ON c.club_id = h.club_id
+            WHERE g.season IS NOT NULL
+            ORDER BY g.season, h.date, h.game_id, h.club_id
+            """,
+            [
+                ("season", "int32"),
+                ("game_id", "int64"),
+                ("club_id", "int64"),
+                ("club_name", "dict"),
+                ("competition_id", "dict"),
+                ("date", "date"),
+                ("elo_before", "float64"),
+                ("elo_after", "float64"),
+            ],
+            True,
+        ),
+        "club_ratings": (
+            """
+            SELECT ce.club_id, c.name AS club_name, c.domestic_competition_id, ce.elo,
+                   ce.games_played, ce.last_game_date
+            FROM clubs_elo ce
+            LEFT JOIN clubs c ON c.club_id = ce.club_id
+            ORDER BY ce.club_id
+            """,
+            [
+                ("club_id", "int64"),
+                ("club_name", "dict"),
+                ("domestic_competition_id", "dict"),
+                ("elo", "float64"),
+                ("games_played", "int32"),
+                ("last_game_date", "date"),
+            ],
+            False,
+        ),
+    }
+
+    def __init__(self, conn, batch_rows: int = BATCH_ROWS):
+        """
+        Initialize the EloParquetExporter class.
+
+        Args:
+            conn: Database connection object for creating cursors.
+            batch_rows: Rows per fetched batch / row group.
+
+        Raises:
+            ImportError: If pyarrow is not installed.
+        """
+        if pa is None:
+            raise ImportError("The Parquet export needs the pyarrow package (pip install pyarrow).")
+        self.conn = conn
+        self.backend = backend_of(conn)
+        self.batch_rows = batch_rows
+
+    def _schema(self, columns: List[Tuple[str, str]]) -> "pa.Schema":
+        """Arrow schema of a dataset's columns."""
+        types = {
+            "int32": pa.int32(),
+            "int64": pa.int64(),
+            "float64": pa.float64(),
+            "date": pa.date32(),
+            "dict": pa.dictionary(pa.int32(), pa.string()),
+        }
+        return pa.schema([(name, types[kind]) for name, kind in columns])
+
+    def _cursor(self, name: str):
+        """
+        Cursor streaming a query's rows: server-side (named) with postgres, so the result is
+        fetched `batch_rows` at a time instead of all at once. SQLite cursors already step lazily.
+        """
+        if self.backend == "postgres":
+            cur = self.conn.cursor(name=f"export_{name}")
+            cur.itersize = self.batch_rows
+            return cur
+        return self.conn.cursor()
+
+    def _record_batch(self, rows: List[tuple], schema: "pa.Schema") -> "pa.RecordBatch":
+        """
+        Columnar batch of rows, typed by the schema.
+        @param rows: Rows of the batch (columns in schema order)
+        @param schema: Schema of the batch
+        @return: RecordBatch
+        """
+        arrays = []
+        for values, field in zip(zip(*rows), schema):
+            if pa.types.is_date(field.type) and self.backend == "sqlite":
+                # SQLite returns dates as ISO text
+                arrays.append(pa.array(values, pa.string()).cast(field.type))
+            else:
+                arrays.append(pa.array(values, field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def export(self, name: str, output_dir: Union[str, Path] = EXPORT_DIR) -> int:
+        """
+        Export one dataset, replacing its previous export.
+        @param name: Dataset (key of EXPORTS)
+        @param output_dir: Directory of the datasets
+        @return: Number of rows exported
+        @raise KeyError: If the dataset is unknown
+        """
+        query, columns, partitioned = self.EXPORTS[name]
+        schema = self._schema(columns)
+        # The season is in the directory name of its partition, not in the files
+        file_schema = schema.remove(0) if partitioned else schema
+        dictionary_columns = [column for column, kind in columns if kind == "dict"]
+
+        output_dir = Path(output_dir)
+        target = output_dir / (name if partitioned else f"{name}.parquet")
+        staging = output_dir / f".{target.name}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        if partitioned:
+            staging.mkdir(parents=True)
+        else:
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+        n_rows = 0
+        writer, writer_season = None, None
+        try:
+            with self._cursor(name) as cur:
+                cur.execute(query)
+                rows = iter(cur)
+                while batch := list(islice(rows, self.batch_rows)):
+                    n_rows += len(batch)
+                    if not partitioned:
+                        if writer is None:
+                            writer = pq.ParquetWriter(
+                                staging, file_schema, use_dictionary=dictionary_columns
+                            )
+                        writer.write_batch(self._record_batch(batch, file_schema))
+                        continue
+                    # Rows come ordered by season: one writer open at a time
+                    for season, season_rows in groupby(batch, key=itemgetter(0)):
+                        if season != writer_season:
+                            if writer is not None:
+                                writer.close()
+                            partition = staging / f"season={season}"
+                            partition.mkdir()
+                            writer = pq.ParquetWriter(
+                                partition / "part-0.parquet",
+                                file_schema,
+                                use_dictionary=dictionary_columns,
+                            )
+                            writer_season = season
+                        writer.write_batch(
+                            self._record_batch([row[1:] for row in season_rows], file_schema)
+                        )
+            self.conn.commit()
+            if writer is None and not partitioned:
+                # Empty table: still write a file with the schema
+                pq.write_table(file_schema.empty_table(), staging)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(staging, ignore_errors=True)
+            if staging.is_file():
+                staging.unlink()
+            raise
+        if writer is not None:
+            writer.close()
+
+        if target.is_dir():
+            shutil.rmtree(target)
+        elif target.exists():
+            target.unlink()
+        staging.rename(target)
+        return n_rows
+
+    def export_all(self, output_dir: Union[str, Path] = EXPORT_DIR) -> Dict[str, int]:
+        """
+        Export every dataset of EXPORTS.
+        @param output_dir: Directory of the datasets
+        @return: Rows exported per dataset
+        """
+        exported = {}
+        for name in self.EXPORTS:
+            start_time = time.perf_counter()
+            exported[name] = self.export(name, output_dir)
+            print(
+                f"Exported {exported[name]} rows of {name}. "
+                f"({time.perf_counter() - start_time:.2f}s)"
+            )
+        return exported
+
+
+def export_elo_parquet(output_dir: Union[str, Path] = EXPORT_DIR) -> Dict[str, int]:
+    """
+    Export the ELO results of the configured database into Parquet datasets.
+    @param output_dir: Directory of the datasets
+    @return: Rows exported per dataset
+    """
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        exported = EloParquetExporter(conn).export_all(output_dir)
+    print(f"ELO results exported to {output_dir}.")
+    return exported
+
+
+# Usage
+if __name__ == "__main__":
+    export_elo_parquet()
@@ -1,31 +1,117 @@
 import logging
 import sys
+import time
 from functools import partial
-from logging.handlers import RotatingFileHandler
+from itertools import groupby
 from multiprocessing import Pool
+from multiprocessing.util import Finalize
 from pathlib import Path
 
+from footy.player_elo.autotune import EloAutoTuner
 from footy.player_elo.club_analysis import ClubAnalysis
 from footy.player_elo.database_connection import DatabaseConnection, DATABASE_CONFIG
 from footy.player_elo.game_analysis import GameAnalysis
+from footy.player_elo.game_features import game_features_available
+from footy.player_elo.leaderboards import LeaderboardIndex
 from footy.player_elo.player_analysis import PlayerAnalysis
+from footy.player_elo.rating_queries import (
+    RatingQueries,
+    invalidate_rating_cache,
+    print_leaderboard,
+)
+from footy.player_elo.rating_store import SharedRatingStore
+from footy.player_elo.run_logging import (
+    SUMMARY_INTERVAL,
+    ProgressReporter,
+    configure_worker_logging,
+    start_queue_logging,
+)
 
 # Add the src directory to sys.path
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.append(str(BASE_DIR))
 
+# Connection of the current worker process, kept open across games (see `_get_worker_connection`)
+_worker_connection = None
+# Shared player ELOs the worker reads instead of `players_elo` (see `_init_worker`)
+_worker_rating_store = None
+
+
+def _get_worker_connection(db_config):
+    """
+    Get the database connection of the current worker process, opening it on first use.
+    Server-side prepared statements live as long as their connection, so reusing one connection
+    per worker lets every game after the first skip parsing and planning its queries.
+
+    @param db_config: Database Config
+    @return: psycopg connection (autocommit, the worker only reads)
+    """
+    global _worker_connection
+    if _worker_connection is None or _worker_connection.closed:
+        _worker_connection = DatabaseConnection(db_config).connect()
+        _worker_connection.autocommit = True
+        # Close the connection when the worker process exits
+        Finalize(None, _worker_connection.close, exitpriority=10)
+    return _worker_connection
+
+
+def _init_worker(name, log_queue=None, log_level=logging.INFO):
+    """
+    Pool initializer: open the coordinator's SharedRatingStore in the worker process, and send
+    its logs to the coordinator's log queue (see run_logging.py).
+    @param name: Shared memory name of the store
+    @param log_queue: Log queue of the coordinator (None keeps the inherited logging setup)
+    @param log_level: Level of the worker's root logger
+    @return: None
+    """
+    global _worker_rating_store
+    if log_queue is not None:
+        configure_worker_logging(log_queue, log_level)
+    _worker_rating_store = SharedRatingStore.attach(name)
+    Finalize(None, _worker_rating_store.close, exitpriority=10)
+
 
 class EloUpdater:
     """Class for updating ELOs based on game data."""
 
+    # Games of a batch read the ratings of the batch start: fixed, so the ELOs do not depend on
+    # the tuning (or the speed of the machine)
     BATCH_SIZE = 100  # Number of games processed per batch
+    # Initial settings, tuned during the run by the EloAutoTuner
+    CHUNKSIZE = 5  # Games per task sent to a worker
     PLAYER_BATCH_LIMIT = 1000  # Maximum player ELO updates before flushing
-
-    def __init__(self, cur, max_games_to_process=1000):
+    N_WORKERS = 4  # Worker processes
+
+    def __init__(
+        self,
+        cur,
+        max_games_to_process=1000,
+        tuner: EloAutoTuner = None,
+        log_queue=None,
+        summary_interval: float = SUMMARY_INTERVAL,
+        leaderboards: LeaderboardIndex = None,
+    ):
+        """
+        @param cur: Database cursor
+        @param max_games_to_process: Games processed by this run
+        @param tuner: Tuner of the chunksize, flush limit and workers (default: starts from the
+            class settings, bounded by the CPU count)
+        @param log_queue: Log queue the workers send their logs to (see start_queue_logging)
+        @param summary_interval: Seconds between two progress summaries
+        @param leaderboards: Leaderboards kept up to date with every flush and rollover (optional)
+        """
         self.cur = cur
         self.current_game_id = None  # Track the current game ID being processed
         self.games_processed = 0  # Counter for the total games processed
         self.MAX_GAMES_TO_PROCESS = max_games_to_process
+        self.log_queue = log_queue
+        self.summary_interval = summary_interval
+        self.leaderboards = leaderboards
+        self.tuner = tuner or EloAutoTuner(
+            chunksize=self.CHUNKSIZE,
+            flush_limit=self.PLAYER_BATCH_LIMIT,
+            n_workers=self.N_WORKERS,
+        )
 
     def _get_last_processed_game(self) -> tuple:
         """
@@ -75,7 +161,7 @@ class EloUpdater:
             self.cur.execute(
                 """
                                 SELECT COUNT(*) FROM valid_games
-                                WHERE (date::DATE >  %s::DATE OR (date::DATE = %s::DATE AND game_id > %s));""",
+                                WHERE (date >  %s OR (date = %s AND game_id > %s));""",
                 (last_processed_date, last_processed_date, last_processed_game_id),
             )
             logging.info(f"Remaining games to analyse: {self.cur.fetchone()[0]}")
@@ -85,7 +171,7 @@ class EloUpdater:
                 """
                     SELECT game_id, date 
                     FROM valid_games 
-                    WHERE (date::DATE > %s::DATE OR (date::DATE = %s::DATE AND game_id > %s))
+                    WHERE (date > %s OR (date = %s AND game_id > %s))
                     ORDER BY date, game_id ASC
                     LIMIT %s;
                 """,
@@ -114,56 +200,71 @@ class EloUpdater:
         return self.cur.fetchall()
 
     @staticmethod
-    def process_game(game, db_config):
+    def process_game(game, db_config, use_game_features=False):
         """
         Static method to process a SINGLE game and return player ELO updates.
 
         @param game: (game_id, game_date)
         @param db_config: Database Config
-        @return: Tuple (game_id, game_date, player_elo_updates) or None if there's an error
+        @param use_game_features: Read the game from the materialized `game_features` table
+        @return: Tuple (game_id, game_date, player_elo_updates, fetch_latency, process_time)
+            or None if there's an error
         """
+        start_time = time.perf_counter()
         game_id, game_date = game
         player_elo_updates = []
         try:
-            # Each process opens its own database connection
-            with DatabaseConnection(db_config) as conn:
-                with conn.cursor() as cur:
-                    logging.info(f"Processing game {game_id} on date {game_date}")
+            # Each process keeps its own database connection
+            conn = _get_worker_connection(db_config)
+            with conn.cursor() as cur:
+                # Lazy formatting: skipped entirely unless debug logs are on
+                logging.debug("Processing game %s on date %s", game_id, game_date)
+
+                game_analysis = GameAnalysis(
+                    cur,
+                    game_id=game_id,
+                    use_game_features=use_game_features,
+                    rating_store=_worker_rating_store,
+                )
 
-                    game_analysis = GameAnalysis(cur, game_id=game_id)
+                # Club analysis
+                home_club_analysis = ClubAnalysis(
+                    game_analysis, game_analysis.home_club_id
+                )
+                away_club_analysis = ClubAnalysis(
+                    game_analysis, game_analysis.away_club_id
+                )
 
-                    # Club analysis
-                    home_club_analysis = ClubAnalysis(
-                        game_analysis, game_analysis.home_club_id
+                # Calculate new ELOs
+                new_home_club_elo = home_club_analysis.new_elo()
+                new_away_club_elo = away_club_analysis.new_elo()
+
+                # Update players' ELO
+                for player_id in game_analysis.players_list:
+                    # Case where player_id is null
+                    # Log and skip.
+                    if player_id is None:
+                        logging.error(
+                            f"Game {game_id} contains a player with NULL player id."
+                        )
+                    player_analysis = PlayerAnalysis(game_analysis, player_id)
+                    team_change = (
+                        new_home_club_elo
+                        if player_analysis.club_id == game_analysis.home_club_id
+                        else new_away_club_elo
                     )
-                    away_club_analysis = ClubAnalysis(
-                        game_analysis, game_analysis.away_club_id
+                    new_player_elo = player_analysis.new_elo(team_change)
+                    player_elo_updates.append(
+                        (player_id, game_analysis.season, new_player_elo)
                     )
 
-                    # Calculate new ELOs
-                    new_home_club_elo = home_club_analysis.new_elo()
-                    new_away_club_elo = away_club_analysis.new_elo()
-
-                    # Update players' ELO
-                    for player_id in game_analysis.players_list:
-                        # Case where player_id is null
-                        # Log and skip.
-                        if player_id is None:
-                            logging.error(
-                                f"Game {game_id} contains a player with NULL player id."
-                            )
-                        player_analysis = PlayerAnalysis(game_analysis, player_id)
-                        team_change = (
-                            new_home_club_elo
-                            if player_analysis.club_id == game_analysis.home_club_id
-                            else new_away_club_elo
-                        )
-                        new_player_elo = player_analysis.new_elo(team_change)
-                        player_elo_updates.append(
-                            (player_id, game_analysis.season, new_player_elo)
-                        )
-
-            return game_id, game_date, player_elo_updates
+            return (
+                game_id,
+                game_date,
+                player_elo_updates,
+                game_analysis.fetch_latency,
+                time.perf_counter() - start_time,
+            )
 
         except Exception as e:
             logging.error(f"Error processing game {game_id}: {e}", exc_info=True)
@@ -172,55 +273,241 @@ class EloUpdater:
     def update_elo_with_multiprocessing(self, db_config, games_to_process):
         """
         Parallel processing of games using multiprocessing with chunked updates.
+        Games are replayed season by season: when the replay crosses into a new season, pending
+        updates are flushed and active players' ELOs are rolled over before its first game.
+        Workers read ELOs from a shared-memory rating store holding the season's ELOs, which the
+        coordinator updates in game order after every batch; `players_elo` only receives the
+        periodic bulk flushes.
+        Batches have a fixed size (BATCH_SIZE), so the ratings a game reads do not depend on the
+        run. Chunksize, flush limit and pool size are adjusted between batches by the tuner; the
+        pool is only recreated when the number of workers changes.
 
         @param db_config:
         @param games_to_process:
         @return: None
         """
+        if not games_to_process:
+            logging.info("No games to process.")
+            return
+
         logging.info(f"Starting ELO update for {len(games_to_process)} games.")
         logging.info(f"START: {games_to_process[0]} - END: {games_to_process[-1]}")
 
+        # Games are read from the materialized feature table when it has been built
+        use_game_features = game_features_available(self.cur)
+        logging.info(f"Using materialized game features: {use_game_features}")
+
+        # Season of the last game processed by a previous run (None when starting from scratch)
+        last_processed_date, _ = self._get_last_processed_game()
+        current_season = (
+            GameAnalysis.season_of(last_processed_date) if last_processed_date else None
+        )
+
         # List to store all updates
         all_player_elo_updates = []
+        # Per-game fetch latencies (seconds) of the whole run
+        fetch_latencies = []
+
+        progress = ProgressReporter(
+            min(len(games_to_process), self.MAX_GAMES_TO_PROCESS - self.games_processed),
+            interval=self.summary_interval,
+        )
+        rating_store = self._create_rating_store()
+        # One pool for the whole run (unless the tuner resizes it), so each worker keeps its
+        # connection and prepared statements
+        pool = self._create_pool(rating_store)
+        for season, season_games in groupby(
+            games_to_process, key=lambda game: GameAnalysis.season_of(game[1])
+        ):
+            season_games = list(season_games)
+            if current_season is not None and season > current_season:
+                # Previous season's ELOs must be in the DB before they are carried forward
+                if all_player_elo_updates:
+                    self._flush_player_elo_updates(all_player_elo_updates)
+                    all_player_elo_updates = []
+                self._rollover_season(season)
+            current_season = season
+            if rating_store.season != season:
+                self._load_rating_store(rating_store, season)
+
+            # Deal with each batch
+            batch_start = 0
+            while batch_start < len(season_games):
+                if self.games_processed >= self.MAX_GAMES_TO_PROCESS:
+                    # Exit after processing MAX GAMES
+                    logging.info(f"Processed {self.games_processed} games. Exiting...")
+                    break
+                batch = season_games[batch_start : batch_start + self.BATCH_SIZE]
+                batch_start += len(batch)
+                batch_start_time = time.perf_counter()
 
-        # Split len(games_to_process) to BATCH_SIZEd lists
-        batches = [
-            games_to_process[i : i + self.BATCH_SIZE]
-            for i in range(0, len(games_to_process), self.BATCH_SIZE)
-        ]
-
-        # Deal with each batch
-        for batch in batches:
-            if self.games_processed >= self.MAX_GAMES_TO_PROCESS:
-                # Exit after processing MAX GAMES
-                logging.info(f"Processed {self.games_processed} games. Exiting...")
-                return
-
-            with Pool(processes=4) as pool:
-                # Adjust the number of processes
                 results = pool.map(
-                    partial(self.process_game, db_config=db_config), batch
+                    partial(
+                        self.process_game,
+                        db_config=db_config,
+                        use_game_features=use_game_features,
+                    ),
+                    batch,
+                    chunksize=self.tuner.chunksize,
                 )
 
-            for result in results:
-                if result:
-                    game_id, game_date, player_elo_updates = result
+                batch_latencies = []
+                batch_updates = []
+                busy_time = 0.0
+                for result in results:
+                    if result:
+                        game_id, game_date, player_elo_updates, fetch_latency, process_time = (
+                            result
+                        )
 
-                    all_player_elo_updates.extend(player_elo_updates)
-                    self._update_progress(game_date, game_id)
-                    self.games_processed += 1
+                        batch_latencies.append(fetch_latency)
+                        busy_time += process_time
+                        batch_updates.extend(player_elo_updates)
+                        all_player_elo_updates.extend(player_elo_updates)
+                        self._update_progress(game_date, game_id)
+                        self.games_processed += 1
+
+                        # Flush to DB if the batch limit is reached
+                        if len(all_player_elo_updates) >= self.tuner.flush_limit:
+                            self._flush_player_elo_updates(all_player_elo_updates)
+                            all_player_elo_updates = []
+
+                # Results are in game order: a player's last game of the batch sets their ELO
+                rating_store.write(
+                    [player_id for player_id, _, _ in batch_updates if player_id is not None],
+                    [elo for player_id, _, elo in batch_updates if player_id is not None],
+                )
+                logging.debug(f"Batch completed. Processed {len(batch)} games.")
+                if batch_latencies:
+                    logging.debug(
+                        "Average per-game fetch latency: "
+                        f"{1000 * sum(batch_latencies) / len(batch_latencies):.2f} ms"
+                    )
+                fetch_latencies.extend(batch_latencies)
+                progress.update(done=len(batch), errors=results.count(None))
 
-                    # Flush to DB if the batch limit is reached
-                    if len(all_player_elo_updates) >= self.PLAYER_BATCH_LIMIT:
-                        self._flush_player_elo_updates(all_player_elo_updates)
-                        all_player_elo_updates = []
+                self.tuner.record_batch(
+                    len(batch), time.perf_counter() - batch_start_time, busy_time
+                )
+                if "n_workers" in self.tuner.update():
+                    pool.close()
+                    pool.join()
+                    pool = self._create_pool(rating_store)
 
-            logging.info(f"Batch completed. Processed {len(batch)} games.")
+        pool.close()
+        pool.join()
+        rating_store.close()
+        progress.log_summary()
 
         # Final flush for any remaining updates
         if all_player_elo_updates:
             self._flush_player_elo_updates(all_player_elo_updates)
 
+        if fetch_latencies:
+            logging.info(
+                f"Average per-game fetch latency over {len(fetch_latencies)} games: "
+                f"{1000 * sum(fetch_latencies) / len(fetch_latencies):.2f} ms"
+            )
+
+    def _create_pool(self, rating_store: SharedRatingStore) -> Pool:
+        """
+        Worker pool of the tuner's size, attached to the shared rating store.
+        @param rating_store: Shared rating store
+        @return: Pool
+        """
+        return Pool(
+            processes=self.tuner.n_workers,
+            initializer=_init_worker,
+            initargs=(rating_store.name, self.log_queue, logging.getLogger().level),
+        )
+
+    def _create_rating_store(self) -> SharedRatingStore:
+        """
+        Allocate the shared rating store with a slot for every player who has an ELO, an
+        appearance or a substitution, so every player of a game can be read and written (the
+        participants of player_intervals_cte include substitutes only found in game_events).
+        @return: SharedRatingStore (no season loaded yet)
+        """
+        self.cur.execute(
+            """
+            SELECT player_id FROM players_elo
+            UNION
+            SELECT player_id FROM appearances WHERE player_id IS NOT NULL
+            UNION
+            SELECT player_in_id FROM game_events
+            WHERE type = 'Substitutions' AND player_in_id IS NOT NULL
+            UNION
+            SELECT player_id FROM game_events
+            WHERE type = 'Substitutions' AND player_id IS NOT NULL;
+        """
+        )
+        rating_store = SharedRatingStore.create(row[0] for row in self.cur.fetchall())
+        logging.info(f"Shared rating store of {len(rating_store.player_ids)} players.")
+        return rating_store
+
+    def _load_rating_store(self, rating_store: SharedRatingStore, season: int) -> None:
+        """
+        Load a season's ELOs (after its rollover and the flush of all pending updates).
+        @param rating_store: Shared rating store
+        @param season: Season about to be replayed
+        @return: None
+        """
+        self.cur.execute(
+            "SELECT player_id, elo FROM players_elo WHERE season = %s AND elo IS NOT NULL;",
+            (season,),
+        )
+        loaded = rating_store.load(season, self.cur.fetchall())
+        logging.info(f"Loaded {loaded} player ELOs of season {season} into the rating store.")
+
+    def _rollover_season(self, season: int) -> None:
+        """
+        Carry every active player's latest ELO forward into `season` in one bulk statement.
+        Active players are those who appeared in a game of the previous season; their latest
+        ELO replaces the season's market-value seed, so ratings continue across seasons and the
+        per-game teammate/default fallback is only needed for genuinely new players.
+
+        @param season: The season the replay is entering
+        @return: None
+        """
+        self.cur.execute(
+            """
+            INSERT INTO players_elo (
+                player_id, season, first_name, last_name, name,
+                player_code, country_of_birth, date_of_birth, elo
+            )
+            SELECT
+                pe.player_id, %(season)s, pe.first_name, pe.last_name, pe.name,
+                pe.player_code, pe.country_of_birth, pe.date_of_birth, pe.elo
+            FROM players_elo pe
+            JOIN (
+                SELECT player_id, MAX(season) AS season
+                FROM players_elo
+                WHERE season < %(season)s AND elo IS NOT NULL
+                GROUP BY player_id
+            ) latest ON latest.player_id = pe.player_id AND latest.season = pe.season
+            WHERE pe.player_id IN (
+                SELECT a.player_id
+                FROM appearances a
+                WHERE a.date >= %(previous_start)s
+                  AND a.date < %(season_start)s
+            )
+            ON CONFLICT (player_id, season)
+            DO UPDATE SET elo = EXCLUDED.elo;
+        """,
+            {
+                "season": season,
+                "previous_start": GameAnalysis.season_start(season - 1),
+                "season_start": GameAnalysis.season_start(season),
+            },
+        )
+        rolled_over = self.cur.rowcount
+        self.cur.connection.commit()
+        invalidate_rating_cache()
+        if self.leaderboards is not None:
+            # Loaded again on its next read
+            self.leaderboards.invalidate_season(season)
+        logging.info(f"Rolled over {rolled_over} player ELOs into season {season}.")
+
     def _flush_player_elo_updates(self, all_player_elo_updates):
         """Flush Player ELO updates
 
@@ -230,6 +517,7 @@ class EloUpdater:
         logging.info(
             f"Flushing {len(all_player_elo_updates)} player ELO updates to the database."
         )
+        start_time = time.perf_counter()
         try:
             with DatabaseConnection(DATABASE_CONFIG) as conn:
                 with conn.cursor() as cur:
@@ -245,44 +533,68 @@ class EloUpdater:
                         all_player_elo_updates,
                     )
                     conn.commit()
+            # Only the database write is measured for the tuner (see EloAutoTuner.record_flush)
+            self.tuner.record_flush(
+                len(all_player_elo_updates), time.perf_counter() - start_time
+            )
+            # Cached rating queries of this process would serve the old ELOs
+            invalidate_rating_cache()
+            if self.leaderboards is not None:
+                self.leaderboards.apply_updates(all_player_elo_updates)
         except Exception as e:
             logging.error(f"Error flushing player ELO updates: {e}", exc_info=True)
 
 
-def update_elo():
+def update_elo(summary_interval: float = SUMMARY_INTERVAL, log_level: int = logging.INFO):
     """Main Update Function.
-    Logs as well.
+    Logs as well: every process logs through a queue to one listener writing `elo_update.log`
+    and the console (per-game lines are debug logs, progress is summarized periodically).
+    The leaderboards are kept up to date during the run, and the top players of the latest
+    season are printed from them at the end.
+
+    Args:
+        summary_interval: Seconds between two progress summaries
+        log_level: Logging level (logging.DEBUG to log every game)
     Raises:
         ValueError: _description_
     """
     log_file = "elo_update.log"
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
-            RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=5),
-            logging.StreamHandler(),  # Remove this if you don't want logs in the console
-        ],
-    )
+    log_queue, listener = start_queue_logging(log_file, log_level)
 
     try:
-        process_game_num = int(
-            input("Enter number of games you want to process (recommended 100+): ")
-        )
-        if process_game_num <= 0:
-            raise ValueError("Number of games must be greater than 0.")
-    except ValueError as e:
-        logging.error(f"Invalid input: {e}. Exiting...")
-        sys.exit(1)
-
-    with DatabaseConnection(DATABASE_CONFIG) as conn:
-        with conn.cursor() as cur:
-
-            elo_updater = EloUpdater(cur, max_games_to_process=process_game_num)
-            games_to_process = elo_updater.fetch_games_to_process()
-            elo_updater.update_elo_with_multiprocessing(
-                DATABASE_CONFIG, games_to_process
+        try:
+            process_game_num = int(
+                input("Enter number of games you want to process (recommended 100+): ")
             )
+            if process_game_num <= 0:
+                raise ValueError("Number of games must be greater than 0.")
+        except ValueError as e:
+            logging.error(f"Invalid input: {e}. Exiting...")
+            sys.exit(1)
+
+        # The leaderboards read on a connection of their own, which never ends the updater's
+        # transaction
+        with DatabaseConnection(DATABASE_CONFIG) as conn, DatabaseConnection(
+            DATABASE_CONFIG
+        ) as read_conn:
+            leaderboards = LeaderboardIndex(read_conn)
+            with conn.cursor() as cur:
+
+                elo_updater = EloUpdater(
+                    cur,
+                    max_games_to_process=process_game_num,
+                    log_queue=log_queue,
+                    summary_interval=summary_interval,
+                    leaderboards=leaderboards,
+                )
+                games_to_process = elo_updater.fetch_games_to_process()
+                elo_updater.update_elo_with_multiprocessing(
+                    DATABASE_CONFIG, games_to_process
+                )
+            print_leaderboard(queries=RatingQueries(read_conn, leaderboards=leaderboards))
+    finally:
+        # Write out the queued records before exiting
+        listener.stop()
 
 
 # Main execution
@@ -1,10 +1,13 @@
 import json
-from datetime import datetime
+import time
+from datetime import date, datetime
 from typing import Dict, List, Tuple
 
-from psycopg import sql
-
-from footy.player_elo.database_connection import DatabaseConnection, DATABASE_CONFIG
+from footy.player_elo.database_connection import (
+    DatabaseConnection,
+    DATABASE_CONFIG,
+    backend_of,
+)
 
 # Typing
 ClubGoals = Dict[int, List[int]]
@@ -21,12 +24,91 @@ class GameAnalysis:
     FULL_GAME_MINUTES = 90
     DEFAULT_ELO = 1500
 
-    def __init__(self, cur, game_id: int):
+    # Per-game queries. They are sent as prepared statements, so they must stay static:
+    # no dynamically sized `IN (...)` lists, sets of players are matched with `= ANY(array)`.
+    # Queries that differ between storage backends are keyed by backend (see backend_of).
+    GAME_FEATURES_QUERY = {
+        "postgres": """
+            SELECT home_club_id, away_club_id, date,
+                   club_ids, player_ids, start_minutes, end_minutes,
+                   goal_club_ids, goal_minutes
+            FROM game_features
+            WHERE game_id = %s
+        """,
+        # Arrays are stored as JSON text
+        "sqlite": """
+            SELECT home_club_id, away_club_id, date,
+                   club_ids AS "club_ids [json]", player_ids AS "player_ids [json]",
+                   start_minutes AS "start_minutes [json]", end_minutes AS "end_minutes [json]",
+                   goal_club_ids AS "goal_club_ids [json]", goal_minutes AS "goal_minutes [json]"
+            FROM game_features
+            WHERE game_id = %s
+        """,
+    }
+    # The season expressions must match `season_of`
+    GAME_FEATURES_ELOS_QUERY = {
+        "postgres": """
+            SELECT pe.player_id, pe.elo
+            FROM game_features gf
+            JOIN players_elo pe
+              ON pe.player_id = ANY(gf.player_ids)
+             AND pe.season = EXTRACT(YEAR FROM gf.date)::INTEGER
+            WHERE gf.game_id = %s
+        """,
+        "sqlite": """
+            SELECT pe.player_id, pe.elo
+            FROM game_features gf
+            JOIN json_each(gf.player_ids) p
+            JOIN players_elo pe
+              ON pe.player_id = p.value
+             AND pe.season = CAST(strftime('%%Y', gf.date) AS INTEGER)
+            WHERE gf.game_id = %s
+        """,
+    }
+    GAME_DETAILS_QUERY = """
+        SELECT g.home_club_id, g.away_club_id, g.date
+        FROM valid_games g
+        WHERE g.game_id = %s
+    """
+    APPEARANCES_QUERY = """
+        SELECT player_club_id AS club_id, player_id, minutes_played
+        FROM appearances
+        WHERE game_id = %s
+    """
+    SUBSTITUTIONS_QUERY = """
+        SELECT club_id, player_id, player_in_id, minute
+        FROM game_events
+        WHERE type = 'Substitutions' AND game_id = %s
+    """
+    GOALS_QUERY = """
+        SELECT club_id, minute
+        FROM game_events
+        WHERE type = 'Goals' AND game_id = %s
+    """
+    PLAYER_ELOS_QUERY = {
+        "postgres": """
+            SELECT player_id, elo FROM players_elo
+            WHERE player_id = ANY(%s) AND season = %s
+        """,
+        # Lists are passed as JSON text
+        "sqlite": """
+            SELECT player_id, elo FROM players_elo
+            WHERE player_id IN (SELECT value FROM json_each(%s)) AND season = %s
+        """,
+    }
+
+    def __init__(
+        self, cur, game_id: int, use_game_features: bool = False, rating_store=None
+    ):
         """
         Initialize the GameAnalysis instance for a specific game
 
         @param cur: Database cursor for executing SQL queries.
         @param game_id: ID of the game being analyzed.
+        @param use_game_features: Read players, play times and goals from the materialized
+            `game_features` table (see game_features.py) instead of deriving them per game.
+        @param rating_store: SharedRatingStore to read the players' ELOs from instead of
+            `players_elo`, when it holds the game's season (see rating_store.py).
         @raise ValueError: If no home/away clubs are found for the game.
         """
         self._players_play_times = {}
@@ -35,85 +117,196 @@ class GameAnalysis:
         self._club_ratings = None
         self._date = None
         self._season = None
+        self._fetch_latency = None
 
         self.cur = cur
+        self.backend = backend_of(cur.connection)
         self.game_id = game_id
+        self.use_game_features = use_game_features
+        self.rating_store = rating_store
 
         # Fetch all game-related data in bulk
         self._fetch_bulk_game_data()
 
     def _fetch_bulk_game_data(self):
         """
-        Fetch all game-related data in bulk to minimize the number of queries.
+        Fetch all game-related data in bulk to minimize the number of round trips.
         (game_details, players_and_playtimes, goals, player_elos)
+        Queries are queued in psycopg pipeline mode as server-side prepared statements and sent
+        together; results are read once the pipeline is synced. A game with a materialized feature
+        row costs a single round trip, games without one fall back to the per-game queries (two
+        round trips, as ELOs need the list of players).
         @return: None
         """
-        self._fetch_game_details()
-        self._fetch_players_and_playtimes()
-        self._fetch_goals()
-        self._fetch_player_elos()
+        start_time = time.perf_counter()
+        loaded = False
+        if self.use_game_features:
+            with self.cur.connection.pipeline():
+                features_cur = self._execute(
+                    self.GAME_FEATURES_QUERY[self.backend], (self.game_id,)
+                )
+                # ELOs are queued with the features, unless the rating store has them
+                feature_elos_cur = (
+                    None
+                    if self.rating_store is not None
+                    else self._execute(
+                        self.GAME_FEATURES_ELOS_QUERY[self.backend], (self.game_id,)
+                    )
+                )
+            loaded = self._load_game_features(features_cur.fetchone())
+            if loaded:
+                self._load_player_elos(
+                    feature_elos_cur.fetchall()
+                    if feature_elos_cur is not None
+                    else self._fetch_player_elos()
+                )
 
-    def _fetch_game_details(self):
+        if not loaded:
+            with self.cur.connection.pipeline():
+                details_cur = self._execute(self.GAME_DETAILS_QUERY, (self.game_id,))
+                appearances_cur = self._execute(self.APPEARANCES_QUERY, (self.game_id,))
+                substitutions_cur = self._execute(
+                    self.SUBSTITUTIONS_QUERY, (self.game_id,)
+                )
+                goals_cur = self._execute(self.GOALS_QUERY, (self.game_id,))
+            self._load_game_details(details_cur.fetchone())
+            self._load_players_and_playtimes(
+                appearances_cur.fetchall(), substitutions_cur.fetchall()
+            )
+            self._load_goals(goals_cur.fetchall())
+            self._load_player_elos(self._fetch_player_elos())
+        self._fetch_latency = time.perf_counter() - start_time
+
+    def _fetch_player_elos(self) -> list:
+        """
+        ELOs of this game's players for its season: from the rating store when it holds the
+        season (no database access), else a second round trip, as ELOs need the list of players.
+
+        @return: (player_id, elo) rows
+        """
+        if not self.players_list:
+            return []
+        if self.rating_store is not None and self.rating_store.season == self.season:
+            return self.rating_store.read(self.players_list)
+        return self._execute(
+            self.PLAYER_ELOS_QUERY[self.backend],
+            (self.players_list, self.season),
+        ).fetchall()
+
+    def _execute(self, query: str, params: tuple):
+        """
+        Execute a query on a new cursor of this game's connection as a prepared statement.
+        Inside a pipeline the query is only queued: it is sent with the others when the pipeline
+        is synced (on exit).
+
+        @param query: SQL query
+        @param params: Query parameters
+        @return: The cursor to fetch the results from
+        """
+        cur = self.cur.connection.cursor()
+        cur.execute(query, params, prepare=True)
+        return cur
+
+    def _load_game_features(self, result) -> bool:
+        """
+        Populate game details, players, play times and goals from the single `game_features`
+        row of this game.
+
+        @param result: The `game_features` row (GAME_FEATURES_QUERY) or None
+        @return: True if the game has a materialized feature row, False otherwise.
         """
-        Fetch game data like: home/away club IDs and game date.
-        Also initializes players and goals dictionaries.
+        if not result:
+            return False
+
+        (
+            self.home_club_id,
+            self.away_club_id,
+            game_date,
+            club_ids,
+            player_ids,
+            start_minutes,
+            end_minutes,
+            goal_club_ids,
+            goal_minutes,
+        ) = result
+        self._set_game_date(game_date)
+
+        self._players = {self.home_club_id: [], self.away_club_id: []}
+        self._players_play_times = {}
+        for club_id, player_id, start_time, end_time in zip(
+            club_ids, player_ids, start_minutes, end_minutes
+        ):
+            self._players.setdefault(club_id, []).append(player_id)
+            self._players_play_times[(club_id, player_id)] = (start_time, end_time)
+        self._players_list = list(player_ids)
+
+        self._goals_per_club = {self.home_club_id: [], self.away_club_id: []}
+        for club_id, minute in zip(goal_club_ids, goal_minutes):
+            self._goals_per_club.setdefault(club_id, []).append(minute)
 
+        return True
+
+    def _set_game_date(self, game_date):
+        """
+        Set the game date and the season derived from it.
+
+        @param game_date: Date of the game (date object or 'YYYY-MM-DD' string)
         @return: None
-        @raise ValueError: If no valid game is found for the given game_id.
-        @raise ValueError: If no valid game is found for the given game_id
         """
-        self.cur.execute(
-            """
-            SELECT g.home_club_id, g.away_club_id, g.date
-            FROM valid_games g
-            WHERE g.game_id = %s
-        """,
-            (self.game_id,),
-        )
-        result = self.cur.fetchone()
+        self._date = datetime.strptime(str(game_date), "%Y-%m-%d")
+        self._season = self.season_of(self._date)
+
+    @staticmethod
+    def season_of(game_date) -> int:
+        """
+        Season a game date belongs to, i.e. the `players_elo` season its ELOs are read from.
+
+        @param game_date: Date of the game (date/datetime object or 'YYYY-MM-DD' string)
+        @return: The season (year) of the game
+        """
+        if isinstance(game_date, str):
+            game_date = datetime.strptime(game_date, "%Y-%m-%d")
+        return game_date.year
 
+    @staticmethod
+    def season_start(season: int) -> date:
+        """
+        First day of a season (inverse of `season_of`).
+
+        @param season: The season (year)
+        @return: Date the season starts on
+        """
+        return date(season, 1, 1)
+
+    def _load_game_details(self, result):
+        """
+        Set game data like: home/away club IDs and game date.
+
+        @param result: The `valid_games` row (GAME_DETAILS_QUERY) or None
+        @return: None
+        @raise ValueError: If no valid game is found for the given game_id.
+        """
         # Error: No club found for game id.
         if not result:
             raise ValueError(f"No clubs found for game_id={self.game_id}")
         self.home_club_id, self.away_club_id, game_date = result
 
         # Some formatting and initialising.
-        self._date = datetime.strptime(str(game_date), "%Y-%m-%d")
-        self._season = self._date.year
+        self._set_game_date(game_date)
 
-    def _fetch_players_and_playtimes(self):
+    def _load_players_and_playtimes(self, players_playtimes_data, substitutions_data):
         """
-        Fetch starting players, substitutios,
+        Process starting players, substitutios,
         The method populates `_players` and `_players_play_times` attributes.
 
+        @param players_playtimes_data: Appearance rows (APPEARANCES_QUERY)
+        @param substitutions_data: Substitution event rows (SUBSTITUTIONS_QUERY)
         @return: None
         """
         # Init.
         self._players = {self.home_club_id: [], self.away_club_id: []}
         self._players_play_times = {}
 
-        # Fetch starting players
-        self.cur.execute(
-            """
-            SELECT player_club_id AS club_id, player_id, minutes_played
-            FROM appearances
-            WHERE game_id = %s
-        """,
-            (self.game_id,),
-        )
-        players_playtimes_data = self.cur.fetchall()
-
-        # Fetch substituted players
-        self.cur.execute(
-            """
-            SELECT club_id, player_id, player_in_id, minute
-            FROM game_events
-            WHERE type = 'Substitutions' AND game_id = %s
-        """,
-            (self.game_id,),
-        )
-        substitutions_data = self.cur.fetchall()
-
         # Process starting players
         # self._players_play_times = {}
         for club_id, player_id, minutes_played in players_playtimes_data:
@@ -139,86 +332,66 @@ class GameAnalysis:
                     minute,
                     self.FULL_GAME_MINUTES,
                 )
-                self._players.setdefault(club_id, []).append(player_in_id)
+                # Substitutes usually have an appearance row already: list them once
+                club_players = self._players.setdefault(club_id, [])
+                if player_in_id not in club_players:
+                    club_players.append(player_in_id)
 
         # Add players_list field
         self._players_list = [
             player for club_players in self._players.values() for player in club_players
         ]
 
-    def _fetch_goals(self):
+    def _load_goals(self, goals_data):
         """
-        Fetch goal events during the game and populate `_goals_per_club`.
+        Populate `_goals_per_club` from the goal events of the game.
 
+        @param goals_data: Goal event rows (GOALS_QUERY)
         @return: None
         """
         # Init.
         self._goals_per_club = {self.home_club_id: [], self.away_club_id: []}
 
-        self.cur.execute(
-            """
-            SELECT club_id, minute
-            FROM game_events
-            WHERE type = 'Goals' AND game_id = %s
-        """,
-            (self.game_id,),
-        )
-        goals_data = self.cur.fetchall()
-
         for club_id, minute in goals_data:
             self._goals_per_club.setdefault(club_id, []).append(minute)
 
-    def _fetch_player_elos(self):
+    def _load_player_elos(self, elos_data):
         """
-        Fetch ELO ratings for all players involved in the game.
-        For players with no existing ELO, estimate their ELO based on teammates or use the default ELO.
+        Set ELO ratings for all players involved in the game.
+        For players with no existing ELO (genuinely new players, as ELOs are rolled over at every
+        season boundary), estimate their ELO from the average of their teammates' fetched ELOs,
+        or use the default ELO.
 
+        @param elos_data: (player_id, elo) rows of this game's players for its season
         @return: None
         """
-        # self._players_list = [player for club_players in self._players.values() for player in club_players]
-        if not self.players_list:
-            self._elos = {}
-            return
-
-        # Fetch ELOs in bulk
-        query = sql.SQL(
-            """
-            SELECT player_id, elo FROM players_elo
-            WHERE player_id IN ({ids}) AND season = %s
-        """
-        ).format(ids=sql.SQL(", ").join(sql.Placeholder() * len(self.players_list)))
-        self.cur.execute(query, (*self.players_list, self.season))
-        elos_data = self.cur.fetchall()
-        elos_dict = dict(elos_data)
+        elos_dict = {
+            player_id: elo for player_id, elo in elos_data if elo is not None
+        }
 
         # Process ELOs
+        # Fallbacks only use ELOs fetched from the DB, so they don't depend on player order
         self._elos = {}
+        fallback_elos = {}
+        for club_id, club_players in self.players.items():
+            teammate_elos = [elos_dict[pid] for pid in club_players if pid in elos_dict]
+            fallback_elos[club_id] = (
+                sum(teammate_elos) / len(teammate_elos)
+                if teammate_elos
+                else self.DEFAULT_ELO
+            )
+        player_clubs = {
+            player_id: club_id
+            for club_id, club_players in self.players.items()
+            for player_id in club_players
+        }
         for player_id in self._players_list:
             elo = elos_dict.get(player_id)
             if elo is not None:
                 self._elos[player_id] = elo
             else:
-                club_id = next(
-                    (
-                        cid
-                        for cid, players in self.players.items()
-                        if player_id in players
-                    ),
-                    None,
-                )
-                if club_id:
-                    teammate_elos = [
-                        self._elos[pid]
-                        for pid in self.players[club_id]
-                        if pid in self._elos
-                    ]
-                    self._elos[player_id] = (
-                        sum(teammate_elos) / len(teammate_elos)
-                        if teammate_elos
-                        else self.DEFAULT_ELO
-                    )
-                else:
-                    self._elos[player_id] = self.DEFAULT_ELO
+                club_id = player_clubs.get(player_id)
+                self._elos[player_id] = fallback_elos.get(club_id, self.DEFAULT_ELO)
 
     def _fetch_match_impact_players(self) -> MatchImpacts:
         """
@@ -370,6 +543,15 @@ class GameAnalysis:
 
         return self._players_list
 
+    @property
+    def fetch_latency(self) -> float:
+        """
+        Get the time spent fetching this game's data from the database.
+
+        @return: Fetch latency in seconds
+        """
+        return self._fetch_latency
+
     @property
     def match_impact_players(self) -> MatchImpacts:
         """
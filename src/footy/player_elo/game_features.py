@@ -0,0 +1,256 @@
+from footy.player_elo.database_connection import DatabaseConnection, backend_of
+
+FULL_GAME_MINUTES = 90
+
+
+def player_intervals_cte(games_table: str = "valid_games") -> str:
+    """
+    SQL for the CTEs ending in `player_intervals`: one row per (game, club, player) who took
+    part in a game of `games_table`, with the (start, end) minutes of their time on the pitch.
+    Mirrors GameAnalysis._load_players_and_playtimes:
+    - starters play from 0 until `minutes_played` (or the full game if that is not recorded),
+    - substituted-in players start at their substitution minute and play until the end,
+    - a later substitution off ends the interval at that minute.
+
+    @param games_table: Table of games to restrict to (`valid_games` or `games`)
+    @return: CTE definitions, to be used after `WITH`
+    """
+    return f"""
+    substitutions AS (
+        SELECT e.game_id, e.club_id, e.player_id, e.player_in_id, e.minute
+        FROM game_events e
+        JOIN {games_table} g ON g.game_id = e.game_id
+        WHERE e.type = 'Substitutions'
+    ),
+    subbed_in AS (
+        SELECT game_id, club_id, player_in_id AS player_id, minute,
+               ROW_NUMBER() OVER (
+                   PARTITION BY game_id, club_id, player_in_id ORDER BY minute
+               ) AS rn
+        FROM substitutions
+        WHERE player_in_id IS NOT NULL
+    ),
+    subbed_out AS (
+        SELECT game_id, club_id, player_id, minute,
+               ROW_NUMBER() OVER (
+                   PARTITION BY game_id, club_id, player_id ORDER BY minute DESC
+               ) AS rn
+        FROM substitutions
+        WHERE player_id IS NOT NULL
+    ),
+    starters AS (
+        SELECT a.game_id, a.player_club_id AS club_id, a.player_id,
+               MAX(a.minutes_played) AS minutes_played
+        FROM appearances a
+        JOIN {games_table} g ON g.game_id = a.game_id
+        WHERE a.player_id IS NOT NULL
+        GROUP BY a.game_id, a.player_club_id, a.player_id
+    ),
+    participants AS (
+        SELECT game_id, club_id, player_id FROM starters
+        UNION
+        SELECT game_id, club_id, player_id FROM subbed_in WHERE rn = 1
+    ),
+    player_intervals AS (
+        SELECT
+            p.game_id,
+            p.club_id,
+            p.player_id,
+            COALESCE(i.minute, 0) AS start_minute,
+            CASE
+                WHEN o.minute IS NOT NULL AND o.minute >= COALESCE(i.minute, 0)
+                    THEN o.minute
+                WHEN i.minute IS NOT NULL THEN {FULL_GAME_MINUTES}
+                WHEN s.minutes_played > 0 THEN s.minutes_played
+                ELSE {FULL_GAME_MINUTES}
+            END AS end_minute
+        FROM participants p
+        LEFT JOIN starters s
+            ON s.game_id = p.game_id AND s.club_id = p.club_id AND s.player_id = p.player_id
+        LEFT JOIN subbed_in i
+            ON i.game_id = p.game_id AND i.club_id = p.club_id
+           AND i.player_id = p.player_id AND i.rn = 1
+        LEFT JOIN subbed_out o
+            ON o.game_id = p.game_id AND o.club_id = p.club_id
+           AND o.player_id = p.player_id AND o.rn = 1
+    )
+"""
+
+
+# Queries that differ between storage backends, keyed by backend (see backend_of)
+MATERIALIZE_GAME_FEATURES_QUERY = {
+    "postgres": f"""
+    DROP TABLE IF EXISTS game_features;
+    CREATE TABLE game_features AS
+    WITH {player_intervals_cte()},
+    game_players AS (
+        SELECT
+            game_id,
+            ARRAY_AGG(club_id ORDER BY club_id, start_minute, player_id)
+                AS club_ids,
+            ARRAY_AGG(player_id ORDER BY club_id, start_minute, player_id)
+                AS player_ids,
+            ARRAY_AGG(start_minute ORDER BY club_id, start_minute, player_id)
+                AS start_minutes,
+            ARRAY_AGG(end_minute ORDER BY club_id, start_minute, player_id)
+                AS end_minutes
+        FROM player_intervals
+        GROUP BY game_id
+    ),
+    game_goals AS (
+        SELECT
+            e.game_id,
+            ARRAY_AGG(e.club_id ORDER BY e.minute) AS goal_club_ids,
+            ARRAY_AGG(e.minute ORDER BY e.minute) AS goal_minutes
+        FROM game_events e
+        JOIN valid_games g ON g.game_id = e.game_id
+        WHERE e.type = 'Goals'
+        GROUP BY e.game_id
+    )
+    SELECT
+        g.game_id,
+        g.date,
+        g.home_club_id,
+        g.away_club_id,
+        COALESCE(p.club_ids, '{{}}') AS club_ids,
+        COALESCE(p.player_ids, '{{}}') AS player_ids,
+        COALESCE(p.start_minutes, '{{}}') AS start_minutes,
+        COALESCE(p.end_minutes, '{{}}') AS end_minutes,
+        COALESCE(gl.goal_club_ids, '{{}}') AS goal_club_ids,
+        COALESCE(gl.goal_minutes, '{{}}') AS goal_minutes
+    FROM valid_games g
+    LEFT JOIN game_players p ON p.game_id = g.game_id
+    LEFT JOIN game_goals gl ON gl.game_id = g.game_id;
+
+    ALTER TABLE game_features
+        ADD CONSTRAINT game_features_game_id_pk PRIMARY KEY (game_id);
+    ANALYZE game_features;
+""",
+    # No ordered aggregates in SQLite: arrays are JSON built by window aggregates over the
+    # ordered game partition, then one row is kept per game.
+    "sqlite": f"""
+    DROP TABLE IF EXISTS game_features;
+    CREATE TABLE game_features AS
+    WITH {player_intervals_cte()},
+    ordered_players AS (
+        SELECT
+            game_id,
+            ROW_NUMBER() OVER game AS rn,
+            JSON_GROUP_ARRAY(club_id) OVER game AS club_ids,
+            JSON_GROUP_ARRAY(player_id) OVER game AS player_ids,
+            JSON_GROUP_ARRAY(start_minute) OVER game AS start_minutes,
+            JSON_GROUP_ARRAY(end_minute) OVER game AS end_minutes
+        FROM player_intervals
+        WINDOW game AS (
+            PARTITION BY game_id ORDER BY club_id, start_minute, player_id
+            ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+        )
+    ),
+    ordered_goals AS (
+        SELECT
+            e.game_id,
+            ROW_NUMBER() OVER game AS rn,
+            JSON_GROUP_ARRAY(e.club_id) OVER game AS goal_club_ids,
+            JSON_GROUP_ARRAY(e.minute) OVER game AS goal_minutes
+        FROM game_events e
+        JOIN valid_games g ON g.game_id = e.game_id
+        WHERE e.type = 'Goals'
+        WINDOW game AS (
+            PARTITION BY e.game_id ORDER BY e.minute
+            ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+        )
+    )
+    SELECT
+        g.game_id,
+        g.date,
+        g.home_club_id,
+        g.away_club_id,
+        COALESCE(p.club_ids, '[]') AS club_ids,
+        COALESCE(p.player_ids, '[]') AS player_ids,
+        COALESCE(p.start_minutes, '[]') AS start_minutes,
+        COALESCE(p.end_minutes, '[]') AS end_minutes,
+        COALESCE(gl.goal_club_ids, '[]') AS goal_club_ids,
+        COALESCE(gl.goal_minutes, '[]') AS goal_minutes
+    FROM valid_games g
+    LEFT JOIN ordered_players p ON p.game_id = g.game_id AND p.rn = 1
+    LEFT JOIN ordered_goals gl ON gl.game_id = g.game_id AND gl.rn = 1;
+
+    CREATE UNIQUE INDEX game_features_game_id_pk ON game_features (game_id);
+    ANALYZE game_features;
+""",
+}
+
+GAME_FEATURES_EXISTS_QUERY = {
+    "postgres": "SELECT to_regclass('public.game_features') IS NOT NULL;",
+    "sqlite": """
+        SELECT EXISTS (
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'game_features'
+        );
+    """,
+}
+
+
+class GameFeatureMaterializer:
+    """
+    Materialize the ELO-independent facts of every valid game into `game_features`.
+
+    Who played, for which club, each player's (start, end) minutes and the goal minutes per club
+    never change between ELO runs, so they are computed once (set-based) after validation and
+    stored as one row of parallel arrays per game. GameAnalysis then needs a single primary-key
+    read per game instead of re-deriving them from appearances and game_events.
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+    """
+
+    def __init__(self, conn):
+        """
+        Initialize the GameFeatureMaterializer class.
+
+        Args:
+            conn: Database connection object for creating cursors.
+        """
+        self.conn = conn
+
+    def materialize(self):
+        """
+        (Re)build the `game_features` table from `valid_games`, `appearances` and `game_events`.
+        """
+        print("Materializing game features...")
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    MATERIALIZE_GAME_FEATURES_QUERY[backend_of(self.conn)]
+                )
+                cur.execute("SELECT COUNT(*) FROM game_features;")
+                count = cur.fetchone()[0]
+                self.conn.commit()
+                print(f"Materialized features for {count} games.")
+        except Exception as e:
+            print(f"Error materializing game features: {e}")
+            self.conn.rollback()
+            raise
+
+
+def game_features_available(cur) -> bool:
+    """
+    Check whether the `game_features` table has been materialized.
+    @param cur: Database cursor
+    @return: True if `game_features` exists
+    """
+    cur.execute(GAME_FEATURES_EXISTS_QUERY[backend_of(cur.connection)])
+    return bool(cur.fetchone()[0])
+
+
+def materialize_game_features():
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        materializer = GameFeatureMaterializer(conn)
+        materializer.materialize()
+
+
+# Usage
+if __name__ == "__main__":
+    materialize_game_features()
@@ -1,15 +1,126 @@
-from footy.player_elo.database_connection import DatabaseConnection
+from footy.player_elo.database_connection import DatabaseConnection, backend_of
+from footy.player_elo.game_features import FULL_GAME_MINUTES, player_intervals_cte
 
 
 class GameValidator:
     """
     Class for validating and selecting valid games.
 
+    All games are checked in a single set-based pass. Games passing every check are copied to
+    `valid_games`; the rest go to `quarantined_games` together with the reasons they failed,
+    so the ELO updater never schedules a game that would fail inside GameAnalysis.
+
     Attributes:
         conn: Database connection for creating separate cursors.
     """
 
-    BATCH_SIZE = 10000  # Adjust batch size based on performance
+    # Reason -> condition on a row of the per-game checks (see `_validate_all_games`)
+    CHECKS = {
+        "missing_game_details": "g.home_club_id IS NULL OR g.away_club_id IS NULL "
+        "OR g.date IS NULL OR g.home_club_id = g.away_club_id",
+        "no_appearances": "ag.game_id IS NULL",
+        "no_home_players": "COALESCE(pc.home_players, 0) = 0",
+        "no_away_players": "COALESCE(pc.away_players, 0) = 0",
+        "players_of_other_clubs": "COALESCE(pc.other_club_players, 0) > 0",
+        "inconsistent_intervals": "COALESCE(pc.inconsistent_intervals, 0) > 0",
+        "goals_of_other_clubs": "COALESCE(gc.other_club_goals, 0) > 0",
+    }
+
+    # Queries that differ between storage backends, keyed by backend (see backend_of)
+    CREATE_VALID_GAMES_QUERY = {
+        "postgres": """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1
+                    FROM information_schema.tables
+                    WHERE table_schema = 'public' AND table_name = 'valid_games'
+                ) THEN
+                    CREATE TABLE public.valid_games AS
+                    SELECT * FROM public.games WHERE 1 = 0;
+                    ALTER TABLE public.valid_games ADD CONSTRAINT valid_games_game_id_pk PRIMARY KEY (game_id);
+                END IF;
+            END
+            $$;
+        """,
+        "sqlite": """
+            CREATE TABLE IF NOT EXISTS valid_games AS
+            SELECT * FROM games WHERE 1 = 0;
+            CREATE UNIQUE INDEX IF NOT EXISTS valid_games_game_id_pk ON valid_games (game_id);
+        """,
+    }
+    CREATE_QUARANTINED_GAMES_QUERY = {
+        "postgres": """
+            CREATE TABLE IF NOT EXISTS quarantined_games (
+                game_id INTEGER PRIMARY KEY,
+                reasons TEXT[] NOT NULL,
+                quarantined_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """,
+        # Reasons are stored as a JSON array
+        "sqlite": """
+            CREATE TABLE IF NOT EXISTS quarantined_games (
+                game_id INTEGER PRIMARY KEY,
+                reasons TEXT NOT NULL,
+                quarantined_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """,
+    }
+    # Array of the failed reasons of a game, from one CASE expression per check
+    REASONS_EXPRESSION = {
+        "postgres": "ARRAY_REMOVE(ARRAY[{reasons}]::TEXT[], NULL)",
+        "sqlite": "(SELECT JSON_GROUP_ARRAY(value) FROM JSON_EACH(JSON_ARRAY({reasons})) "
+        "WHERE value IS NOT NULL)",
+    }
+    CREATE_GAME_CHECKS_TABLE = {
+        "postgres": "CREATE TEMP TABLE game_checks ON COMMIT DROP AS",
+        "sqlite": "DROP TABLE IF EXISTS temp.game_checks; CREATE TEMP TABLE game_checks AS",
+    }
+    REBUILD_QUERY = {
+        "postgres": """
+            TRUNCATE valid_games, quarantined_games;
+
+            INSERT INTO valid_games
+            SELECT g.*
+            FROM games g
+            JOIN game_checks c ON c.game_id = g.game_id
+            WHERE CARDINALITY(c.reasons) = 0;
+
+            INSERT INTO quarantined_games (game_id, reasons)
+            SELECT game_id, reasons
+            FROM game_checks
+            WHERE CARDINALITY(reasons) > 0;
+        """,
+        "sqlite": """
+            DELETE FROM valid_games;
+            DELETE FROM quarantined_games;
+
+            INSERT INTO valid_games
+            SELECT g.*
+            FROM games g
+            JOIN game_checks c ON c.game_id = g.game_id
+            WHERE JSON_ARRAY_LENGTH(c.reasons) = 0;
+
+            INSERT INTO quarantined_games (game_id, reasons)
+            SELECT game_id, reasons
+            FROM game_checks
+            WHERE JSON_ARRAY_LENGTH(reasons) > 0;
+        """,
+    }
+    REASON_COUNTS_QUERY = {
+        "postgres": """
+            SELECT reason, COUNT(*)
+            FROM game_checks, UNNEST(reasons) AS reason
+            GROUP BY reason
+            ORDER BY COUNT(*) DESC;
+        """,
+        "sqlite": """
+            SELECT r.value AS reason, COUNT(*)
+            FROM game_checks, JSON_EACH(game_checks.reasons) AS r
+            GROUP BY r.value
+            ORDER BY COUNT(*) DESC;
+        """,
+    }
 
     def __init__(self, conn):
         """
@@ -19,7 +130,9 @@ class GameValidator:
             conn: Database connection object for creating cursors.
         """
         self.conn = conn
+        self.backend = backend_of(conn)
         self._ensure_valid_games_table_exists()
+        self._ensure_quarantined_games_table_exists()
 
     def _ensure_valid_games_table_exists(self):
         """
@@ -28,86 +141,120 @@ class GameValidator:
         """
         try:
             with self.conn.cursor() as cur:
-                cur.execute(
-                    """
-                    DO $$
-                    BEGIN
-                        IF NOT EXISTS (
-                            SELECT 1
-                            FROM information_schema.tables 
-                            WHERE table_schema = 'public' AND table_name = 'valid_games'
-                        ) THEN
-                            CREATE TABLE public.valid_games AS
-                            SELECT * FROM public.games WHERE 1 = 0;
-                            ALTER TABLE public.valid_games ADD CONSTRAINT valid_games_game_id_pk PRIMARY KEY (game_id);
-                        END IF; 
-                    END
-                    $$;
-                """
-                )
+                cur.execute(self.CREATE_VALID_GAMES_QUERY[self.backend])
                 self.conn.commit()
                 print("Ensured `valid_games` table exists.")
         except Exception as e:
             print(f"Error occured while ensuring 'valid_games' table exists: {e}")
             self.conn.rollback()
 
-    def _fetch_game_ids_batch(self):
+    def _ensure_quarantined_games_table_exists(self):
         """
-        Generator to fetch game IDs in batches.
-
-        Yields:
-            list: A batch of game IDs.
-        """
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT game_id FROM games ORDER BY game_id;")
-            while True:
-                batch = cur.fetchmany(self.BATCH_SIZE)
-                if not batch:
-                    break
-                yield [row[0] for row in batch]
-
-    def _validate_and_insert_games(self, game_ids):
-        """
-        Use SQL to validate and insert valid games into `valid_games`.
-
-        Args:
-            game_ids (list): List of game IDs to validate and insert.
+        Ensure the `quarantined_games` table exists in the database.
+        It stores rejected games together with the reasons they were rejected.
         """
         try:
             with self.conn.cursor() as cur:
-                cur.execute(
-                    """
-                    WITH valid_games_batch AS (
-                        SELECT g.*
-                        FROM games g
-                        WHERE g.game_id = ANY(%s)
-                          AND EXISTS (
-                              SELECT 1
-                              FROM appearances a
-                              WHERE a.game_id = g.game_id
-                          )
-                    )
-                    INSERT INTO valid_games
-                    SELECT * FROM valid_games_batch
-                    ON CONFLICT (game_id) DO NOTHING;
-                """,
-                    (game_ids,),
-                )
+                cur.execute(self.CREATE_QUARANTINED_GAMES_QUERY[self.backend])
                 self.conn.commit()
-                print(f"Validated and inserted batch of {len(game_ids)} games.")
+                print("Ensured `quarantined_games` table exists.")
         except Exception as e:
-            print(f"Error validating / inserting games: {e}")
+            print(f"Error occured while ensuring 'quarantined_games' table exists: {e}")
             self.conn.rollback()
 
+    def _validate_all_games(self, cur):
+        """
+        Run every check over all games at once and store the failed reasons per game
+        in the temporary table `game_checks` (dropped at the end of the validation).
+
+        Args:
+            cur: Database cursor inside the validation transaction.
+        """
+        reasons = self.REASONS_EXPRESSION[self.backend].format(
+            reasons=",\n".join(
+                f"CASE WHEN {condition} THEN '{reason}' END"
+                for reason, condition in self.CHECKS.items()
+            )
+        )
+        cur.execute(
+            f"""
+            {self.CREATE_GAME_CHECKS_TABLE[self.backend]}
+            WITH {player_intervals_cte("games")},
+            player_checks AS (
+                SELECT
+                    pi.game_id,
+                    COUNT(*) FILTER (WHERE pi.club_id = g.home_club_id) AS home_players,
+                    COUNT(*) FILTER (WHERE pi.club_id = g.away_club_id) AS away_players,
+                    COUNT(*) FILTER (
+                        WHERE pi.club_id IS DISTINCT FROM g.home_club_id
+                          AND pi.club_id IS DISTINCT FROM g.away_club_id
+                    ) AS other_club_players,
+                    -- Substitutions in stoppage / extra time start after the full game they
+                    -- end at, and are rated (start clamped to the full game)
+                    COUNT(*) FILTER (
+                        WHERE pi.start_minute < 0
+                           OR pi.end_minute < CASE
+                               WHEN pi.start_minute > {FULL_GAME_MINUTES} THEN {FULL_GAME_MINUTES}
+                               ELSE pi.start_minute
+                           END
+                    ) AS inconsistent_intervals
+                FROM player_intervals pi
+                JOIN games g ON g.game_id = pi.game_id
+                GROUP BY pi.game_id
+            ),
+            appearance_games AS (
+                SELECT DISTINCT game_id FROM appearances
+            ),
+            goal_checks AS (
+                SELECT
+                    e.game_id,
+                    COUNT(*) FILTER (
+                        WHERE e.club_id IS DISTINCT FROM g.home_club_id
+                          AND e.club_id IS DISTINCT FROM g.away_club_id
+                    ) AS other_club_goals
+                FROM game_events e
+                JOIN games g ON g.game_id = e.game_id
+                WHERE e.type = 'Goals'
+                GROUP BY e.game_id
+            )
+            SELECT
+                g.game_id,
+                {reasons} AS reasons
+            FROM games g
+            LEFT JOIN appearance_games ag ON ag.game_id = g.game_id
+            LEFT JOIN player_checks pc ON pc.game_id = g.game_id
+            LEFT JOIN goal_checks gc ON gc.game_id = g.game_id;
+        """
+        )
+
     def add_valid_games(self):
         """
-        Process the Games table in batches, validate games, and add valid games to the `valid_games` table.
+        Validate all games in one pass, then rebuild `valid_games` and `quarantined_games`
+        from the result.
         """
         print("Starting validation...")
+        try:
+            with self.conn.cursor() as cur:
+                self._validate_all_games(cur)
+                cur.execute(self.REBUILD_QUERY[self.backend])
+                cur.execute(self.REASON_COUNTS_QUERY[self.backend])
+                reason_counts = cur.fetchall()
+                cur.execute("SELECT COUNT(*) FROM valid_games;")
+                valid_count = cur.fetchone()[0]
+                cur.execute("SELECT COUNT(*) FROM quarantined_games;")
+                quarantined_count = cur.fetchone()[0]
+                if self.backend == "sqlite":
+                    # No ON COMMIT DROP in SQLite
+                    cur.execute("DROP TABLE temp.game_checks;")
+                self.conn.commit()
+        except Exception as e:
+            print(f"Error validating / inserting games: {e}")
+            self.conn.rollback()
+            return
 
-        for batch_game_ids in self._fetch_game_ids_batch():
-            self._validate_and_insert_games(batch_game_ids)
-
+        print(f"Valid games: {valid_count}, quarantined games: {quarantined_count}.")
+        for reason, count in reason_counts:
+            print(f"  {reason}: {count}")
         print("Validation complete.")
 
 
@@ -114,40 +114,51 @@ class PlayerEloInitializer:
         """
         Fill season gaps for each player individually, ensuring each player has continuous
         season entries from min to max. Forward-fill other columns.
+
+        Columnar: the min..max season grid of every player is built with a single
+        repeat/cumsum expansion, joined back onto the original rows and forward-filled
+        within each player in one grouped pass (no per-player reindex / concat).
         """
         if "player_id" not in df.columns or "season" not in df.columns:
             raise ValueError("Dataframe must contain 'player_id' and 'season' columns.")
 
-        other_columns = df.columns.difference(["elo"]).tolist()
-        filled_dfs = []
+        df = df.dropna(subset=["season"])
+        if df.empty:
+            return df.reset_index(drop=True)
+
+        df = df.astype({"season": np.int64})
+        bounds = df.groupby("player_id", sort=True)["season"].agg(["min", "max"])
+        lengths = (bounds["max"] - bounds["min"] + 1).to_numpy()
 
-        for player_id, group in df.groupby("player_id"):
-            min_season = group["season"].min()
-            max_season = group["season"].max()
+        # Offset of every grid row inside its player's run: 0, 1, ..., len - 1
+        run_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        offsets = np.arange(lengths.sum(), dtype=np.int64) - run_starts
 
-            if pd.isna(min_season) or pd.isna(max_season):
-                continue
+        grid = pd.DataFrame(
+            {
+                "player_id": np.repeat(bounds.index.to_numpy(), lengths),
+                "season": np.repeat(bounds["min"].to_numpy(), lengths) + offsets,
+            }
+        )
 
-            # Reindex from min_season..max_season
-            group = group.set_index("season")
-            df_filled = group.reindex(np.arange(min_season, max_season + 1))
+        # Left join keeps every original row (several valuations per season stay distinct)
+        # and adds an empty row for every missing season.
+        filled_df = grid.merge(df, on=["player_id", "season"], how="left", sort=False)
 
+        other_columns = [
+            c for c in filled_df.columns if c not in ("player_id", "season")
+        ]
+        if other_columns:
             # Forward-fill data from previous seasons
             with pd.option_context("future.no_silent_downcasting", True):
-                df_filled = df_filled.ffill().infer_objects(copy=False)
-
-            df_filled = df_filled.reset_index()
-            df_filled["player_id"] = player_id
-
-            filled_dfs.append(df_filled)
+                filled_df[other_columns] = (
+                    filled_df.groupby("player_id", sort=False)[other_columns]
+                    .ffill()
+                    .infer_objects(copy=False)
+                )
 
-        filled_df = pd.concat(filled_dfs, ignore_index=True)
         # Re-order columns to have player_id, season first
-        cols = ["player_id", "season"] + [
-            c for c in filled_df.columns if c not in ["player_id", "season"]
-        ]
-        filled_df = filled_df[cols]
-        return filled_df
+        return filled_df[["player_id", "season"] + other_columns]
 
     @staticmethod
     def _add_season_column(df: pd.DataFrame) -> pd.DataFrame:
@@ -156,12 +167,10 @@ class PlayerEloInitializer:
         df_copy["date"] = pd.to_datetime(df_copy["date"])
 
         if "season" not in df_copy.columns:
-            df_copy["season"] = df_copy["date"].apply(
-                lambda x: (
-                    f"{x.year}" if x >= pd.Timestamp(x.year, 7, 1) else f"{x.year - 1}"
-                )
-            )
-            df_copy["season"] = np.int64(df_copy["season"])
+            # Seasons start on 1st July: Jan-Jun dates belong to the previous year's season
+            df_copy["season"] = (
+                df_copy["date"].dt.year - (df_copy["date"].dt.month < 7)
+            ).astype(np.int64)
 
         return df_copy
 
@@ -178,15 +187,16 @@ class PlayerEloInitializer:
             self.player_valuations_df["season"]
         )
 
-        for season in self.player_valuations_df["season"].unique():
-            season_values = self.player_valuations_df.loc[
-                self.player_valuations_df["season"] == season, "market_value_in_eur"
-            ].dropna()
-
-            season_values_log = np.log1p(season_values)
+        # One grouped pass instead of a boolean scan per season
+        season_stats = (
+            np.log1p(self.player_valuations_df["market_value_in_eur"])
+            .groupby(self.player_valuations_df["season"])
+            .agg(["mean", "std"])
+        )
+        for season, mean_log, std_log in season_stats.itertuples():
             season_valuations[season] = {
-                "mean_log": season_values_log.mean(),
-                "std_log": season_values_log.std(),
+                "mean_log": mean_log,
+                "std_log": std_log,
             }
 
         return season_valuations
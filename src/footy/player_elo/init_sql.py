@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict
 from footy.player_elo.database_connection import DATA_DIR, DATABASE_CONFIG
@@ -13,6 +14,7 @@ from sqlalchemy import (
     Float,
     Date,
     Boolean,
+    MetaData,
     PrimaryKeyConstraint,
     text,
 )
@@ -25,13 +27,31 @@ DATA_DIR /= "transfer_data"
 
 
 def create_sqlalchemy_engine(config: Dict[str, str]):
-    """Create SQLAlchemy engine using psycopg 3 driver."""
+    """Create SQLAlchemy engine using psycopg 3 driver (or sqlite3 for the sqlite backend)."""
+    if config.get("backend") == "sqlite":
+        return create_engine(f"sqlite:///{config['path']}")
     return create_engine(
         f"postgresql+psycopg://{config['user']}:{config['password']}@{config['host']}:{config['port']}/{config['dbname']}"
     )
 
 
-engine = create_sqlalchemy_engine(DATABASE_CONFIG)
+@lru_cache(maxsize=None)
+def get_engine():
+    """
+    SQLAlchemy engine of the configured database, created on first use (not at import, so
+    importing this module neither builds an engine nor touches the database).
+    @return: Engine, shared by all callers
+    """
+    return create_sqlalchemy_engine(DATABASE_CONFIG)
+
+
+def __getattr__(name):
+    # `init_sql.engine` is kept for existing callers, and also created lazily
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 Base = declarative_base()
 
 
@@ -261,9 +281,15 @@ def drop_all_tables(engine):
     @return:
     """
     print("Dropping all tables...")
-    with engine.begin() as conn:
-        conn.execute(text("DROP SCHEMA public CASCADE;"))
-        conn.execute(text("CREATE SCHEMA public;"))
+    if engine.dialect.name == "sqlite":
+        # No schemas in SQLite: drop every table found in the database file
+        metadata = MetaData()
+        metadata.reflect(engine)
+        metadata.drop_all(engine)
+    else:
+        with engine.begin() as conn:
+            conn.execute(text("DROP SCHEMA public CASCADE;"))
+            conn.execute(text("CREATE SCHEMA public;"))
     print("Schema reset complete.")
 
 
@@ -319,9 +345,33 @@ def load_csv_to_postgres(table_name, csv_file_path, engine):
         raw_conn.close()
 
 
+def load_csv_to_sqlite(table_name, csv_file_path, engine, chunksize=100_000):
+    """
+    Load a csv file to the SQLite DB, in chunks so large files are never fully in memory.
+    @param table_name:
+    @param csv_file_path:
+    @param engine:
+    @param chunksize: Number of csv rows inserted at once
+    @return:
+    """
+
+    import pandas as pd
+
+    print(f"Loading data into table: {table_name} from file: {csv_file_path}")
+
+    try:
+        with engine.begin() as conn:
+            for chunk in pd.read_csv(csv_file_path, chunksize=chunksize):
+                chunk.to_sql(table_name, conn, if_exists="append", index=False)
+        print(f"Data loaded successfully into table: {table_name}")
+
+    except Exception as e:
+        print(f"Error loading data into table {table_name}: {e}")
+
+
 def load_all_csv(data_dir, engine):
     """
-    Load all CSV files in the data directory into corresponding PostgreSQL tables.
+    Load all CSV files in the data directory into corresponding PostgreSQL (or SQLite) tables.
     @param data_dir:
     @param engine:
     @return:
@@ -335,10 +385,14 @@ def load_all_csv(data_dir, engine):
             filepath = os.path.join(dirpath, filename)
             csv_to_table_map[filepath] = file_key
 
+    load_csv = (
+        load_csv_to_sqlite if engine.dialect.name == "sqlite" else load_csv_to_postgres
+    )
+
     # Load each CSV into its matching table
     for csv_file_path, table_name in csv_to_table_map.items():
         if os.path.exists(csv_file_path):
-            load_csv_to_postgres(table_name, csv_file_path, engine)
+            load_csv(table_name, csv_file_path, engine)
         else:
             print(f"File {csv_file_path} not found. Skipping.")
 
@@ -383,8 +437,32 @@ def create_process_table(engine):
             raise
 
 
+# Indexes of the rating read API (RatingQueries, LeaderboardIndex); players_elo's is recreated
+# when reset_players_elo swaps the table in
+QUERY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS players_elo_season_elo_idx ON players_elo (season, elo DESC)",
+    "CREATE INDEX IF NOT EXISTS players_current_club_idx ON players (current_club_id)",
+    "CREATE INDEX IF NOT EXISTS games_competition_date_idx ON games (competition_id, date)",
+    "CREATE INDEX IF NOT EXISTS appearances_game_player_idx ON appearances (game_id, player_id)",
+]
+
+
+def create_query_indexes(engine):
+    """
+    Create the indexes of the rating queries, once the tables are loaded (cheaper than
+    maintaining them during the load).
+    @param engine:
+    @return:
+    """
+    print("Creating query indexes...")
+    with engine.begin() as conn:
+        for statement in QUERY_INDEXES:
+            conn.execute(text(statement))
+
+
 def init_sql_db():
     data_dir = DATA_DIR
+    engine = get_engine()
 
     # Drop existing tables
     drop_all_tables(engine)
@@ -403,6 +481,8 @@ def init_sql_db():
 
     # Create process_progress table
     create_process_table(engine)
+    # Indexes of the rating queries
+    create_query_indexes(engine)
 
 
 if __name__ == "__main__":
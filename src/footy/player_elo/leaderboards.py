@@ -0,0 +1,411 @@
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from footy.player_elo.database_connection import DatabaseConnection
+from footy.player_elo.game_analysis import GameAnalysis
+
+# Typing
+BoardKey = Tuple[int, Optional[str], Optional[str]]  # season, competition_id, position
+RankedPlayer = Tuple[int, float]  # player_id, elo
+PlayerEloUpdate = Tuple[int, int, float]  # player_id, season, elo (as flushed by EloUpdater)
+
+# Target size of the blocks of a RankedList (split at twice this size)
+BLOCK_SIZE = 512
+# Seconds a loaded season is served before it is reloaded, bounding its staleness when the
+# ratings are updated by another process (updates of this process are applied right away)
+RELOAD_TTL = 60.0
+
+
+class RankedList:
+    """
+    Sorted list with O(log n) rank (position of a key) and select (key at a position).
+
+    Keys are kept in sorted blocks of at most 2 * `block_size` keys, with the last key of every
+    block in `_maxes` to find a key's block by bisection. A Fenwick tree over the block lengths
+    gives the number of keys before a block in O(log blocks), so ranks and positions do not scan
+    the blocks before them. Inserting or removing a key shifts the rest of one block only (a
+    bounded memmove); the tree is rebuilt when a block is split or emptied.
+    """
+
+    def __init__(self, keys: Iterable = (), block_size: int = BLOCK_SIZE):
+        """
+        @param keys: Initial keys (sorted once)
+        @param block_size: Target block size
+        """
+        self.block_size = block_size
+        keys = sorted(keys)
+        self._blocks = [keys[i : i + block_size] for i in range(0, len(keys), block_size)]
+        self._reindex()
+
+    def _reindex(self) -> None:
+        """Rebuild the block maxima and the Fenwick tree of the block lengths."""
+        self._maxes = [block[-1] for block in self._blocks]
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, start=1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent <= len(self._blocks):
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._len = sum(len(block) for block in self._blocks)
+
+    def _add(self, block: int, delta: int) -> None:
+        """Add delta to the length of a block in the Fenwick tree."""
+        i = block + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+        self._len += delta
+
+    def _before(self, block: int) -> int:
+        """Number of keys in the blocks before a block."""
+        count, i = 0, block
+        while i > 0:
+            count += self._tree[i]
+            i -= i & -i
+        return count
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """(block, offset) of a position, by descending the Fenwick tree."""
+        block, remaining = 0, position
+        step = 1 << (len(self._blocks).bit_length())
+        while step:
+            nxt = block + step
+            if nxt < len(self._tree) and self._tree[nxt] <= remaining:
+                block = nxt
+                remaining -= self._tree[nxt]
+            step >>= 1
+        return block, remaining
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, key) -> None:
+        """Insert a key."""
+        if not self._blocks:
+            self._blocks.append([key])
+            self._reindex()
+            return
+        block = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+        insort(self._blocks[block], key)
+        self._maxes[block] = self._blocks[block][-1]
+        if len(self._blocks[block]) > 2 * self.block_size:
+            half = self._blocks[block]
+            self._blocks[block : block + 1] = [half[: self.block_size], half[self.block_size :]]
+            self._reindex()
+        else:
+            self._add(block, 1)
+
+    def remove(self, key) -> None:
+        """
+        Remove a key.
+        @raise ValueError: If the key is not in the list
+        """
+        block = bisect_left(self._maxes, key)
+        if block < len(self._blocks):
+            keys = self._blocks[block]
+            offset = bisect_left(keys, key)
+            if offset < len(keys) and keys[offset] == key:
+                del keys[offset]
+                if keys:
+                    self._maxes[block] = keys[-1]
+                    self._add(block, -1)
+                else:
+                    del self._blocks[block]
+                    self._reindex()
+                return
+        raise ValueError(f"{key!r} is not in the list.")
+
+    def rank(self, key) -> int:
+        """Number of keys smaller than a key (its position if present)."""
+        block = bisect_left(self._maxes, key)
+        if block == len(self._blocks):
+            return self._len
+        return self._before(block) + bisect_left(self._blocks[block], key)
+
+    def __getitem__(self, position: int):
+        if not 0 <= position < self._len:
+            raise IndexError("RankedList index out of range")
+        block, offset = self._locate(position)
+        return self._blocks[block][offset]
+
+    def iter_from(self, position: int = 0) -> Iterator:
+        """Keys in order, starting at a position."""
+        if position >= self._len:
+            return
+        block, offset = self._locate(max(position, 0))
+        for keys in self._blocks[block:]:
+            yield from keys[offset:]
+            offset = 0
+
+
+class Leaderboard:
+    """Players by descending ELO (ties by player ID), with O(log n) updates and ranks."""
+
+    def __init__(self, elos: Optional[Dict[int, float]] = None):
+        """
+        @param elos: Initial ELOs (player_id -> elo)
+        """
+        self.elos: Dict[int, float] = dict(elos or {})
+        self._ranked = RankedList((-elo, player_id) for player_id, elo in self.elos.items())
+
+    def __len__(self) -> int:
+        return len(self.elos)
+
+    def set(self, player_id: int, elo: float) -> None:
+        """Set the ELO of a player (added if missing)."""
+        old_elo = self.elos.get(player_id)
+        if old_elo == elo:
+            return
+        if old_elo is not None:
+            self._ranked.remove((-old_elo, player_id))
+        self._ranked.add((-elo, player_id))
+        self.elos[player_id] = elo
+
+    def top(self, n: int = 10, offset: int = 0) -> List[RankedPlayer]:
+        """
+        Best players.
+        @param n: Number of players
+        @param offset: Players skipped (for pages of the leaderboard)
+        @return: (player_id, elo) by descending ELO
+        """
+        players = []
+        for negative_elo, player_id in self._ranked.iter_from(offset):
+            if len(players) == n:
+                break
+            players.append((player_id, -negative_elo))
+        return players
+
+    def rank(self, player_id: int) -> Optional[int]:
+        """
+        Rank of a player (1 for the best).
+        @param player_id: Player ID
+        @return: Rank, None if the player is not on the leaderboard
+        """
+        elo = self.elos.get(player_id)
+        if elo is None:
+            return None
+        return self._ranked.rank((-elo, player_id)) + 1
+
+
+class LeaderboardIndex:
+    """
+    Player ELO leaderboards per season, competition and position, kept in memory and updated
+    incrementally instead of sorting `players_elo` for every ranking query.
+
+    A player's rating of a season is on the leaderboard of the season, of their position
+    (players.position) and of every competition they appeared in that season, alone and with
+    their position: board keys (season, competition_id, position), None meaning all.
+
+    Seasons are loaded from the database on first read (`load_season`). EloUpdater then applies
+    every flush to the loaded seasons (`apply_updates`, the changed (player_id, season) rows only)
+    and drops a season after rolling ELOs over into it (`invalidate_season`), to be loaded again
+    when read. Share one index between the EloUpdater and the RatingQueries of a process to serve
+    up-to-date top-N and rank queries without a sort. A season is reloaded when it is read `ttl`
+    seconds after it was last loaded or updated, so the ratings written by other processes show
+    up as they do in the RatingQueries cache; the seasons this process writes are kept up to date
+    by its updates instead of being reloaded. Like RatingQueries, it only reads (ending its
+    reads with a rollback): give it a connection without pending writes.
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+        boards: Leaderboards by key.
+        ttl: Seconds a loaded season is served before it is reloaded (None: never reloaded).
+    """
+
+    def __init__(self, conn, ttl: Optional[float] = RELOAD_TTL):
+        """
+        Initialize the LeaderboardIndex class and load the players (names, positions).
+
+        Args:
+            conn: Database connection object for creating cursors.
+            ttl: Seconds a loaded season is served before it is reloaded.
+        """
+        self.conn = conn
+        self.ttl = ttl
+        self.boards: Dict[BoardKey, Leaderboard] = {}
+        # (player_id, season) -> competitions the player appeared in that season
+        self._competitions: Dict[Tuple[int, int], Tuple[str, ...]] = {}
+        # Season -> time.monotonic() of its last load
+        self._loaded_seasons: Dict[int, float] = {}
+
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT player_id, name, position FROM players")
+            self.players: Dict[int, Tuple[Optional[str], Optional[str]]] = {
+                player_id: (name, position) for player_id, name, position in cur.fetchall()
+            }
+        self.conn.rollback()
+
+    def _board_keys(self, player_id: int, season: int) -> List[BoardKey]:
+        """Keys of the leaderboards a player's rating of a season is on."""
+        position = self.players.get(player_id, (None, None))[1]
+        positions = (None,) if position is None else (None, position)
+        competitions = (None,) + self._competitions.get((player_id, season), ())
+        return [
+            (season, competition_id, board_position)
+            for competition_id in competitions
+            for board_position in positions
+        ]
+
+    def _is_fresh(self, season: int) -> bool:
+        """Whether a season is loaded and was loaded less than `ttl` seconds ago."""
+        loaded_at = self._loaded_seasons.get(season)
+        if loaded_at is None:
+            return False
+        return self.ttl is None or time.monotonic() - loaded_at < self.ttl
+
+    def load_season(self, season: int) -> int:
+        """
+        (Re)build the leaderboards of a season from the database.
+        Competitions are those of the games played within the season's dates (games.season is
+        the season of the competition, which does not start on the same day).
+        @param season: Season
+        @return: Number of player ELOs loaded
+        """
+        loaded_at = time.monotonic()
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT DISTINCT a.player_id, g.competition_id
+                FROM games g
+                JOIN appearances a ON a.game_id = g.game_id
+                WHERE g.date >= %s AND g.date < %s AND a.player_id IS NOT NULL
+                """,
+                (GameAnalysis.season_start(season), GameAnalysis.season_start(season + 1)),
+            )
+            competitions = defaultdict(list)
+            for player_id, competition_id in cur.fetchall():
+                competitions[(player_id, season)].append(competition_id)
+            cur.execute(
+                "SELECT player_id, elo FROM players_elo WHERE season = %s AND elo IS NOT NULL",
+                (season,),
+            )
+            rows = cur.fetchall()
+        self.conn.rollback()
+
+        self._competitions = {
+            key: value for key, value in self._competitions.items() if key[1] != season
+        }
+        self._competitions.update(
+            (key, tuple(sorted(values))) for key, values in competitions.items()
+        )
+        board_elos = defaultdict(dict)
+        for player_id, elo in rows:
+            for key in self._board_keys(player_id, season):
+                board_elos[key][player_id] = elo
+        self.boards = {key: board for key, board in self.boards.items() if key[0] != season}
+        # Each board is sorted once here, then only updated
+        self.boards.update((key, Leaderboard(elos)) for key, elos in board_elos.items())
+        self._loaded_seasons[season] = loaded_at
+        return len(rows)
+
+    def invalidate_season(self, season: int) -> None:
+        """Drop the leaderboards of a season, which is loaded again on its next read."""
+        self.boards = {key: board for key, board in self.boards.items() if key[0] != season}
+        self._loaded_seasons.pop(season, None)
+
+    def apply_updates(self, updates: Iterable[PlayerEloUpdate]) -> int:
+        """
+        Apply changed player ELOs, in order (the last update of a player and season wins), once
+        they are in the database. Seasons not loaded are skipped: they are read from the database,
+        updates included, when loaded. The updated seasons count as fresh (their writer keeps
+        them up to date), so they are not reloaded while updates keep coming.
+        @param updates: (player_id, season, elo) updates
+        @return: Number of ratings changed on loaded leaderboards
+        """
+        latest = {}
+        for player_id, season, elo in updates:
+            if player_id is not None and elo is not None and season in self._loaded_seasons:
+                latest[(player_id, season)] = elo
+        now = time.monotonic()
+        for season in {season for _, season in latest}:
+            self._loaded_seasons[season] = now
+
+        changed = 0
+        for (player_id, season), elo in latest.items():
+            for key in self._board_keys(player_id, season):
+                board = self.boards.get(key)
+                if board is None:
+                    board = self.boards[key] = Leaderboard()
+                board.set(player_id, elo)
+            changed += 1
+        return changed
+
+    def _board(
+        self, season: int, competition_id: Optional[str], position: Optional[str]
+    ) -> Optional[Leaderboard]:
+        if not self._is_fresh(season):
+            self.load_season(season)
+        return self.boards.get((season, competition_id, position))
+
+    def top(
+        self,
+        season: int,
+        n: int = 10,
+        competition_id: Optional[str] = None,
+        position: Optional[str] = None,
+    ) -> List[RankedPlayer]:
+        """
+        Highest rated players of a season.
+        @param season: Season
+        @param n: Number of players
+        @param competition_id: Only players who appeared in this competition in the season
+        @param position: Only players of this position (players.position)
+        @return: (player_id, elo) by descending ELO
+        """
+        board = self._board(season, competition_id, position)
+        return board.top(n) if board is not None else []
+
+    def rank(
+        self,
+        player_id: int,
+        season: int,
+        competition_id: Optional[str] = None,
+        position: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Rank of a player in a season (1 for the best).
+        @param player_id: Player ID
+        @param season: Season
+        @param competition_id: Rank among the players of this competition
+        @param position: Rank among the players of this position
+        @return: Rank, None if the player is not on that leaderboard
+        """
+        board = self._board(season, competition_id, position)
+        return board.rank(player_id) if board is not None else None
+
+
+def print_season_leaderboards(season: int, n: int = 5) -> LeaderboardIndex:
+    """
+    Print the best players of a season of the configured database, overall and per position.
+    @param season: Season
+    @param n: Players per leaderboard
+    @return: LeaderboardIndex with the season loaded
+    """
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        start_time = time.perf_counter()
+        index = LeaderboardIndex(conn)
+        loaded = index.load_season(season)
+        print(
+            f"Loaded {loaded} player ELOs of season {season} into {len(index.boards)} "
+            f"leaderboards. ({time.perf_counter() - start_time:.2f}s)"
+        )
+        positions = sorted({key[2] for key in index.boards if key[2] is not None})
+        for position in [None] + positions:
+            print(f"\nSeason {season}, {position or 'all positions'}:")
+            for rank, (player_id, elo) in enumerate(
+                index.top(season, n, position=position), start=1
+            ):
+                name = index.players.get(player_id, (None, None))[0]
+                print(f"{rank:3d}. {name or player_id}: {elo:.1f}")
+    return index
+
+
+# Usage
+if __name__ == "__main__":
+    print_season_leaderboards(2012)
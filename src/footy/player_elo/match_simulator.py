@@ -0,0 +1,374 @@
+from datetime import date
+from typing import Dict, Iterable, Tuple, Union
+
+import numpy as np
+
+from footy.player_elo.database_connection import DatabaseConnection, backend_of
+from footy.player_elo.game_analysis import GameAnalysis
+
+# Typing
+Lineup = Union[Dict[int, float], Iterable[int]]  # {player_id: minutes} or player IDs (full game)
+GoalModel = Dict[str, float]
+
+
+class MatchSimulator:
+    """
+    Monte Carlo simulator for matches between two custom lineups.
+
+    A lineup's rating is the minutes-weighted average ELO of its players, as in
+    GameAnalysis._calculate_club_ratings. Goals of each side are Poisson distributed with
+        log(home_xg) = home_intercept + slope * d,    log(away_xg) = away_intercept - slope * d
+    where d = (home_rating - away_rating) / 400. The three parameters are fitted (Newton's
+    method on the Poisson log-likelihood) to the scores of historical games, rated the same way
+    from `game_features` and `players_elo`. Matches are then sampled in NumPy batches.
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+        model: Goal model parameters (None until calibrated).
+    """
+
+    FULL_GAME_MINUTES = GameAnalysis.FULL_GAME_MINUTES
+    DEFAULT_ELO = GameAnalysis.DEFAULT_ELO
+    MAX_GOALS = 10  # Scorelines count goals up to MAX_GOALS (the last bin is MAX_GOALS or more)
+    BATCH_SIZE = 1_000_000  # Matches sampled at once
+
+    # Queries that differ between storage backends, keyed by backend (see backend_of)
+    CALIBRATION_GAMES_QUERY = {
+        "postgres": """
+            SELECT gf.date, gf.home_club_id, g.home_club_goals, g.away_club_goals,
+                   gf.club_ids, gf.player_ids, gf.start_minutes, gf.end_minutes
+            FROM game_features gf
+            JOIN games g ON g.game_id = gf.game_id
+            WHERE g.home_club_goals IS NOT NULL AND g.away_club_goals IS NOT NULL
+        """,
+        "sqlite": """
+            SELECT gf.date, gf.home_club_id, g.home_club_goals, g.away_club_goals,
+                   gf.club_ids AS "club_ids [json]", gf.player_ids AS "player_ids [json]",
+                   gf.start_minutes AS "start_minutes [json]",
+                   gf.end_minutes AS "end_minutes [json]"
+            FROM game_features gf
+            JOIN games g ON g.game_id = gf.game_id
+            WHERE g.home_club_goals IS NOT NULL AND g.away_club_goals IS NOT NULL
+        """,
+    }
+    LINEUP_ELOS_QUERY = {
+        "postgres": """
+            SELECT player_id, elo FROM players_elo
+            WHERE player_id = ANY(%s) AND season <= %s AND elo IS NOT NULL
+            ORDER BY season
+        """,
+        "sqlite": """
+            SELECT player_id, elo FROM players_elo
+            WHERE player_id IN (SELECT value FROM json_each(%s))
+              AND season <= %s AND elo IS NOT NULL
+            ORDER BY season
+        """,
+    }
+
+    def __init__(self, conn, model: GoalModel = None, seed=None):
+        """
+        Initialize the MatchSimulator class.
+
+        Args:
+            conn: Database connection object for creating cursors.
+            model: Goal model parameters from a previous `calibrate`, to skip calibration.
+            seed: Seed of the random generator (for reproducible simulations).
+        """
+        self.conn = conn
+        self.backend = backend_of(conn)
+        self.model = model
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def _minutes_weights(cls, start_minutes, end_minutes) -> np.ndarray:
+        """
+        Weight of each player in a team rating: minutes played, and 1 minute for a player
+        coming on at the final whistle (as in GameAnalysis._calculate_club_ratings).
+        """
+        start_minutes = np.asarray(start_minutes, dtype=np.float64)
+        end_minutes = np.asarray(end_minutes, dtype=np.float64)
+        weights = np.abs(end_minutes - start_minutes)
+        weights[start_minutes == cls.FULL_GAME_MINUTES] = 1
+        return weights
+
+    def _historical_games(self):
+        """
+        Rate every historical game with a score from `game_features` and `players_elo`.
+        Players without an ELO for the game's season are left out of their team's average.
+
+        @return: (rating difference d, home goals, away goals) arrays, one entry per game
+        @raise ValueError: If `game_features` has no game with a score
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(self.CALIBRATION_GAMES_QUERY[self.backend])
+            games = cur.fetchall()
+            cur.execute(
+                "SELECT player_id, season, elo FROM players_elo WHERE elo IS NOT NULL"
+            )
+            elos = np.asarray(cur.fetchall(), dtype=np.float64).reshape(-1, 3)
+        if not games:
+            raise ValueError(
+                "No scored games in `game_features`: validate and materialize games first."
+            )
+
+        dates, home_club_ids, home_goals, away_goals, club_ids, player_ids, starts, ends = (
+            zip(*games)
+        )
+        n_players = np.fromiter(map(len, player_ids), dtype=np.int64, count=len(games))
+        game_index = np.repeat(np.arange(len(games)), n_players)
+        player_club = np.concatenate([np.asarray(c, dtype=np.int64) for c in club_ids])
+        player_id = np.concatenate([np.asarray(p, dtype=np.int64) for p in player_ids])
+        weights = self._minutes_weights(
+            np.concatenate([np.asarray(s) for s in starts]),
+            np.concatenate([np.asarray(e) for e in ends]),
+        )
+        seasons = np.asarray(
+            [GameAnalysis.season_of(str(game_date)) for game_date in dates],
+            dtype=np.int64,
+        )
+
+        # (player_id, season) -> ELO, looked up with a binary search on combined keys
+        elo_keys = elos[:, 0].astype(np.int64) * 10_000 + elos[:, 1].astype(np.int64)
+        order = np.argsort(elo_keys)
+        elo_keys, elo_values = elo_keys[order], elos[order, 2]
+        keys = player_id * 10_000 + seasons[game_index]
+        position = np.minimum(np.searchsorted(elo_keys, keys), max(len(elo_keys) - 1, 0))
+        found = (
+            elo_keys[position] == keys if len(elo_keys) else np.zeros(len(keys), bool)
+        )
+        weights = np.where(found, weights, 0)
+        player_elos = np.where(found, elo_values[position] if len(elo_keys) else 0, 0)
+
+        # Minutes-weighted average per (game, side)
+        is_home = player_club == np.asarray(home_club_ids, dtype=np.int64)[game_index]
+        side_index = 2 * game_index + (~is_home)
+        total_weight = np.bincount(side_index, weights, minlength=2 * len(games))
+        total_rating = np.bincount(
+            side_index, weights * player_elos, minlength=2 * len(games)
+        )
+        ratings = np.full(2 * len(games), float(self.DEFAULT_ELO))
+        rated = total_weight > 0
+        ratings[rated] = total_rating[rated] / total_weight[rated]
+
+        rating_difference = (ratings[0::2] - ratings[1::2]) / 400
+        return (
+            rating_difference,
+            np.asarray(home_goals, dtype=np.float64),
+            np.asarray(away_goals, dtype=np.float64),
+        )
+
+    def calibrate(self, max_iterations: int = 50, tolerance: float = 1e-10) -> GoalModel:
+        """
+        Fit the goal model to the scores of historical games.
+
+        @param max_iterations: Maximum number of Newton iterations
+        @param tolerance: Stop once no parameter moves more than this
+        @return: Goal model parameters (also stored in `model`)
+        """
+        rating_difference, home_goals, away_goals = self._historical_games()
+        n_games = len(home_goals)
+
+        # One observation per (game, side): [home, away, signed rating difference]
+        features = np.zeros((2 * n_games, 3))
+        features[:n_games, 0] = 1
+        features[n_games:, 1] = 1
+        features[:n_games, 2] = rating_difference
+        features[n_games:, 2] = -rating_difference
+        goals = np.concatenate([home_goals, away_goals])
+
+        parameters = np.array(
+            [np.log(max(home_goals.mean(), 1e-3)), np.log(max(away_goals.mean(), 1e-3)), 0.0]
+        )
+        for _ in range(max_iterations):
+            expected = np.exp(features @ parameters)
+            gradient = features.T @ (goals - expected)
+            hessian = features.T @ (features * expected[:, None])
+            step = np.linalg.solve(hessian, gradient)
+            parameters += step
+            if np.max(np.abs(step)) < tolerance:
+                break
+
+        self.model = {
+            "home_intercept": float(parameters[0]),
+            "away_intercept": float(parameters[1]),
+            "slope": float(parameters[2]),
+            "games": n_games,
+        }
+        print(
+            f"Goal model calibrated on {n_games} games: "
+            f"home xG {np.exp(parameters[0]):.2f}, away xG {np.exp(parameters[1]):.2f} "
+            f"at equal ratings, slope {parameters[2]:.3f} per 400 ELO."
+        )
+        return self.model
+
+    def lineup_rating(self, lineup: Lineup, season: int = None) -> float:
+        """
+        Minutes-weighted average ELO of a lineup.
+        Each player's latest ELO up to `season` is used. Players without one get their
+        teammates' average ELO, or the default ELO (as in GameAnalysis).
+
+        @param lineup: {player_id: minutes} or player IDs (each playing the full game)
+        @param season: Latest season to read ELOs from (default: current season)
+        @return: Team rating
+        @raise ValueError: If the lineup is empty
+        """
+        if not isinstance(lineup, dict):
+            lineup = {player_id: self.FULL_GAME_MINUTES for player_id in lineup}
+        if not lineup:
+            raise ValueError("A lineup needs at least one player.")
+        if season is None:
+            season = GameAnalysis.season_of(date.today())
+
+        player_ids = list(lineup)
+        with self.conn.cursor() as cur:
+            cur.execute(self.LINEUP_ELOS_QUERY[self.backend], (player_ids, season))
+            # Ordered by season: the latest ELO of each player wins
+            elos = dict(cur.fetchall())
+
+        fallback_elo = (
+            sum(elos.values()) / len(elos) if elos else float(self.DEFAULT_ELO)
+        )
+        player_elos = np.asarray(
+            [elos.get(player_id, fallback_elo) for player_id in player_ids]
+        )
+        # Minutes of 0 count as 1, as for a substitute coming on at the final whistle
+        weights = np.maximum(np.asarray([lineup[p] for p in player_ids], float), 1)
+        return float(np.average(player_elos, weights=weights))
+
+    def expected_goals(self, home_rating, away_rating, neutral: bool = False) -> Tuple:
+        """
+        Expected goals of both sides for given team ratings.
+
+        @param home_rating: Rating of the home side (float, or array of fixtures)
+        @param away_rating: Rating of the away side (float, or array of fixtures)
+        @param neutral: Neutral venue (no home advantage)
+        @return: (home expected goals, away expected goals), floats or arrays like the ratings
+        """
+        if self.model is None:
+            self.calibrate()
+        home_intercept = self.model["home_intercept"]
+        away_intercept = self.model["away_intercept"]
+        if neutral:
+            home_intercept = away_intercept = (home_intercept + away_intercept) / 2
+        d = (np.asarray(home_rating) - np.asarray(away_rating)) / 400
+        home_xg = np.exp(home_intercept + self.model["slope"] * d)
+        away_xg = np.exp(away_intercept - self.model["slope"] * d)
+        if np.ndim(d) == 0:
+            return float(home_xg), float(away_xg)
+        return home_xg, away_xg
+
+    def sample_goals(
+        self, home_xg, away_xg, n_matches: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sample the goals of n matches.
+        @param home_xg: Home expected goals (scalar, or array broadcastable to n_matches)
+        @param away_xg: Away expected goals (scalar, or array broadcastable to n_matches)
+        @param n_matches: Number of matches
+        @return: (home goals, away goals) arrays
+        """
+        return (
+            self.rng.poisson(home_xg, n_matches),
+            self.rng.poisson(away_xg, n_matches),
+        )
+
+    def simulate_ratings(
+        self,
+        home_rating: float,
+        away_rating: float,
+        n_matches: int = 1_000_000,
+        neutral: bool = False,
+    ) -> Dict:
+        """
+        Simulate matches between two team ratings.
+
+        @param home_rating: Rating of the home side
+        @param away_rating: Rating of the away side
+        @param n_matches: Number of simulated matches
+        @param neutral: Neutral venue (no home advantage)
+        @return: Dictionary with home_win / draw / away_win probabilities, expected_goals and
+            scorelines: (MAX_GOALS + 1) x (MAX_GOALS + 1) array of scoreline probabilities
+            [home goals, away goals]
+        """
+        home_xg, away_xg = self.expected_goals(home_rating, away_rating, neutral)
+        bins = self.MAX_GOALS + 1
+        scoreline_counts = np.zeros(bins * bins, dtype=np.int64)
+        remaining = n_matches
+        while remaining > 0:
+            batch = min(remaining, self.BATCH_SIZE)
+            home_goals, away_goals = self.sample_goals(home_xg, away_xg, batch)
+            scoreline = np.minimum(home_goals, self.MAX_GOALS) * bins + np.minimum(
+                away_goals, self.MAX_GOALS
+            )
+            scoreline_counts += np.bincount(scoreline, minlength=bins * bins)
+            remaining -= batch
+
+        scorelines = scoreline_counts.reshape(bins, bins) / n_matches
+        # Capped scorelines keep their ordering, except for MAX_GOALS-MAX_GOALS (counted as a draw)
+        home_win = float(np.tril(scorelines, -1).sum())
+        away_win = float(np.triu(scorelines, 1).sum())
+        most_likely = np.unravel_index(np.argmax(scorelines), scorelines.shape)
+        return {
+            "home_rating": home_rating,
+            "away_rating": away_rating,
+            "expected_goals": (home_xg, away_xg),
+            "home_win": home_win,
+            "draw": 1 - home_win - away_win,
+            "away_win": away_win,
+            "scorelines": scorelines,
+            "most_likely_scoreline": (int(most_likely[0]), int(most_likely[1])),
+            "n_matches": n_matches,
+        }
+
+    def simulate(
+        self,
+        home_lineup: Lineup,
+        away_lineup: Lineup,
+        n_matches: int = 1_000_000,
+        season: int = None,
+        neutral: bool = False,
+    ) -> Dict:
+        """
+        Simulate matches between two lineups.
+
+        @param home_lineup: {player_id: minutes} or player IDs of the home side
+        @param away_lineup: {player_id: minutes} or player IDs of the away side
+        @param n_matches: Number of simulated matches
+        @param season: Latest season to read ELOs from (default: current season)
+        @param neutral: Neutral venue (no home advantage)
+        @return: See `simulate_ratings`
+        """
+        return self.simulate_ratings(
+            self.lineup_rating(home_lineup, season),
+            self.lineup_rating(away_lineup, season),
+            n_matches,
+            neutral,
+        )
+
+
+def simulate_match(home_lineup: Lineup, away_lineup: Lineup, n_matches=1_000_000):
+    """
+    Simulate matches between two lineups, calibrating the goal model on the configured DB.
+    @param home_lineup: {player_id: minutes} or player IDs of the home side
+    @param away_lineup: {player_id: minutes} or player IDs of the away side
+    @param n_matches: Number of simulated matches
+    @return: See MatchSimulator.simulate_ratings
+    """
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        simulator = MatchSimulator(conn)
+        return simulator.simulate(home_lineup, away_lineup, n_matches)
+
+
+# Usage
+if __name__ == "__main__":
+    home = [int(p) for p in input("Home player IDs (comma separated): ").split(",")]
+    away = [int(p) for p in input("Away player IDs (comma separated): ").split(",")]
+    result = simulate_match(home, away)
+    print(
+        f"Home win {result['home_win']:.1%}, draw {result['draw']:.1%}, "
+        f"away win {result['away_win']:.1%}, "
+        f"most likely score {result['most_likely_scoreline']}"
+    )
@@ -0,0 +1,349 @@
+import pickle
+import time
+from datetime import date
+from pathlib import Path
+from typing import Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from footy.player_elo.database_connection import DATA_DIR, DatabaseConnection
+
+STANDARD_STATS_CSV = DATA_DIR / "standard_stats_big5.csv"
+
+METRICS = ("euclidean", "cosine", "mahalanobis")
+
+# Per-90 features of standard_stats_big5.csv (counting stats are divided by `90s`)
+STANDARD_STATS_PER_90 = ["Gls-90", "Ast-90", "xG-90", "xAG-90", "npxG-90"]
+STANDARD_STATS_COUNTS = ["PrgC", "PrgP", "PrgR", "CrdY"]
+
+# Per-90 features aggregated from `appearances`
+APPEARANCE_FEATURES = ["goals", "assists", "yellow_cards", "red_cards", "minutes"]
+
+# Descriptive columns kept next to the features: used for filters and results
+INFO_COLUMNS = ["name", "position", "competition", "club"]
+
+
+def load_standard_stats(
+    csv_path: Union[str, Path] = STANDARD_STATS_CSV, min_minutes: int = 450
+) -> pd.DataFrame:
+    """
+    Per-90 feature matrix from the FBref big 5 standard stats.
+    Players with fewer minutes are left out: their per-90 stats are mostly noise.
+
+    @param csv_path: standard_stats_big5.csv
+    @param min_minutes: Minimum minutes played
+    @return: DataFrame with INFO_COLUMNS and feature columns, one row per (player, squad)
+    """
+    stats = pd.read_csv(csv_path, index_col=0)
+    stats = stats[stats["Min"] >= min_minutes]
+    per_90 = stats[STANDARD_STATS_PER_90].copy()
+    for column in STANDARD_STATS_COUNTS:
+        per_90[f"{column}-90"] = stats[column] / stats["90s"]
+
+    info = pd.DataFrame(
+        {
+            "name": stats["Player"],
+            "position": stats["Pos"],
+            "competition": stats["Comp"],
+            "club": stats["Squad"],
+        }
+    )
+    return pd.concat([info, per_90], axis=1)
+
+
+def load_appearance_stats(conn, since: date, min_minutes: int = 450) -> pd.DataFrame:
+    """
+    Per-90 feature matrix aggregated from `appearances` since a date.
+
+    @param conn: Database connection
+    @param since: First appearance date included
+    @param min_minutes: Minimum minutes played
+    @return: DataFrame with INFO_COLUMNS and feature columns, indexed by player_id
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT a.player_id, p.name, p.position,
+                   p.current_club_domestic_competition_id, p.current_club_name,
+                   SUM(COALESCE(a.goals, 0)), SUM(COALESCE(a.assists, 0)),
+                   SUM(COALESCE(a.yellow_cards, 0)), SUM(COALESCE(a.red_cards, 0)),
+                   SUM(a.minutes_played), COUNT(*)
+            FROM appearances a
+            JOIN players p ON p.player_id = a.player_id
+            WHERE a.date >= %s
+            GROUP BY a.player_id, p.name, p.position,
+                     p.current_club_domestic_competition_id, p.current_club_name
+            HAVING SUM(a.minutes_played) >= %s
+            """,
+            (since, min_minutes),
+        )
+        rows = cur.fetchall()
+
+    stats = pd.DataFrame(
+        rows,
+        columns=["player_id", *INFO_COLUMNS, *APPEARANCE_FEATURES[:-1], "minutes", "games"],
+    ).set_index("player_id")
+    nineties = stats["minutes"].astype(float) / 90
+    features = stats[APPEARANCE_FEATURES[:-1]].astype(float).div(nineties, axis=0)
+    # Minutes per appearance tells starters from substitutes
+    features["minutes"] = stats["minutes"] / stats["games"]
+    return pd.concat([stats[INFO_COLUMNS], features.add_suffix("-90")], axis=1)
+
+
+class PlayerSimilarityIndex:
+    """
+    Nearest-neighbour index over standardized per-90 stat vectors.
+
+    Features are standardized (z-scores) and mapped once to a space where the chosen metric is
+    the Euclidean distance:
+    - euclidean: z-scores,
+    - cosine: z-scores scaled to unit length (|u - v|^2 = 2 * cosine distance),
+    - mahalanobis: z-scores whitened with a square root of the inverse covariance,
+    so a single cKDTree answers top-N queries. Position / competition filters are masks over
+    the indexed rows: filtered queries scan the masked vectors (argpartition) instead of
+    rebuilding the tree.
+
+    Attributes:
+        info: Descriptive columns (INFO_COLUMNS), one row per indexed player.
+        features: Feature column names.
+        metric: Distance metric.
+    """
+
+    def __init__(self, stats: pd.DataFrame, metric: str = "euclidean"):
+        """
+        Build the index.
+
+        Args:
+            stats: INFO_COLUMNS and numeric feature columns (see `load_standard_stats`).
+            metric: One of METRICS.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}, use one of {METRICS}.")
+        self.metric = metric
+        self.features = [c for c in stats.columns if c not in INFO_COLUMNS]
+        stats = stats.dropna(subset=self.features)
+        self.info = stats[INFO_COLUMNS].reset_index(names="key")
+
+        values = stats[self.features].to_numpy(dtype=np.float64)
+        self.mean = values.mean(axis=0)
+        self.std = values.std(axis=0)
+        self.std[self.std == 0] = 1
+        self.transform = np.eye(len(self.features))
+        if metric == "mahalanobis":
+            # inv(cov) = W W^T, so |(u - v) W| is the Mahalanobis distance
+            precision = np.linalg.pinv(np.cov((values - self.mean) / self.std, rowvar=False))
+            eigenvalues, eigenvectors = np.linalg.eigh(precision)
+            self.transform = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+        self.vectors = self._embed(values)
+        self.tree = cKDTree(self.vectors)
+
+        # Lower-cased positions (FBref "MF,FW" lists) and competitions, for filters
+        self._positions = [
+            {p.strip().lower() for p in str(position).split(",")}
+            for position in self.info["position"]
+        ]
+        self._competitions = self.info["competition"].astype(str).str.lower().to_numpy()
+
+    def _embed(self, values: np.ndarray) -> np.ndarray:
+        """Map raw feature rows to the space where the metric is the Euclidean distance."""
+        vectors = ((values - self.mean) / self.std) @ self.transform
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        return np.ascontiguousarray(vectors)
+
+    def _distance(self, distances: np.ndarray) -> np.ndarray:
+        """Euclidean distances in the embedded space -> distances of the metric."""
+        if self.metric == "cosine":
+            return distances**2 / 2
+        return distances
+
+    def find(self, name: str) -> pd.DataFrame:
+        """
+        Find indexed players by (part of) their name, case-insensitively.
+        @param name: Name or part of it
+        @return: Matching rows of `info` (their `row` is used by `similar`)
+        """
+        matches = self.info["name"].str.contains(name, case=False, regex=False, na=False)
+        return self.info[matches].rename_axis("row")
+
+    def _mask(self, positions: Iterable[str] = None, competitions: Iterable[str] = None):
+        """
+        Rows passing the filters (None when there is no filter).
+        @param positions: Positions, a player passes if one of their positions is listed
+        @param competitions: Competitions
+        @return: Boolean array over the indexed rows, or None
+        """
+        if not positions and not competitions:
+            return None
+        mask = np.ones(len(self.info), dtype=bool)
+        if positions:
+            wanted = {p.lower() for p in positions}
+            mask &= np.fromiter(
+                (bool(p & wanted) for p in self._positions), dtype=bool, count=len(mask)
+            )
+        if competitions:
+            mask &= np.isin(self._competitions, [c.lower() for c in competitions])
+        return mask
+
+    def similar(
+        self,
+        row: int,
+        n: int = 5,
+        positions: Iterable[str] = None,
+        competitions: Iterable[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Most similar players to an indexed player.
+
+        @param row: Row of the player in `info` (see `find`)
+        @param n: Number of players returned
+        @param positions: Only return players with one of these positions (e.g. ["FW"])
+        @param competitions: Only return players of these competitions
+        @return: `info` rows of the n nearest players with their distance, nearest first
+        """
+        query = self.vectors[row]
+        mask = self._mask(positions, competitions)
+        if mask is None:
+            k = min(n + 1, len(self.vectors))
+            distances, rows = self.tree.query(query, k=k)
+            distances, rows = np.atleast_1d(distances), np.atleast_1d(rows)
+        else:
+            mask[row] = False
+            candidates = np.flatnonzero(mask)
+            distances = np.linalg.norm(self.vectors[candidates] - query, axis=1)
+            k = min(n, len(candidates))
+            nearest = np.argpartition(distances, k - 1)[:k] if k else candidates[:0]
+            nearest = nearest[np.argsort(distances[nearest])]
+            distances, rows = distances[nearest], candidates[nearest]
+
+        keep = rows != row
+        result = self.info.iloc[rows[keep][:n]].copy()
+        result["distance"] = self._distance(distances[keep][:n])
+        return result
+
+    def top_k_all(self, k: int = 5, block_size: int = 1024) -> tuple:
+        """
+        Top-k most similar players of every indexed player, by blocks of rows, so memory stays
+        at block_size x n distances.
+
+        @param k: Neighbours per player
+        @param block_size: Rows per block
+        @return: (rows, distances) arrays of shape (n_players, k), nearest first
+        """
+        n_rows = len(self.vectors)
+        k = min(k, n_rows - 1)
+        squared_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        all_rows = np.empty((n_rows, k), dtype=np.int64)
+        all_distances = np.empty((n_rows, k))
+        for start in range(0, n_rows, block_size):
+            block = self.vectors[start : start + block_size]
+            squared = (
+                squared_norms[start : start + block_size, None]
+                - 2 * block @ self.vectors.T
+                + squared_norms[None, :]
+            )
+            # A player is not their own neighbour
+            squared[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+            nearest = np.argpartition(squared, k - 1, axis=1)[:, :k]
+            nearest_squared = np.take_along_axis(squared, nearest, axis=1)
+            order = np.argsort(nearest_squared, axis=1)
+            all_rows[start : start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+            all_distances[start : start + len(block)] = self._distance(
+                np.sqrt(np.maximum(np.take_along_axis(nearest_squared, order, axis=1), 0))
+            )
+        return all_rows, all_distances
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Persist the built index (tree included).
+        @param path: Index file
+        @return: None
+        """
+        with open(path, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: Union[str, Path]) -> "PlayerSimilarityIndex":
+        """
+        Load an index persisted with `save`.
+        @param path: Index file
+        @return: PlayerSimilarityIndex
+        """
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+
+def get_index(metric: str = "euclidean", rebuild: bool = False) -> PlayerSimilarityIndex:
+    """
+    Load the persisted index of the standard stats CSV, building it first when it is missing or
+    older than the CSV.
+    @param metric: One of METRICS
+    @param rebuild: Build the index even if a current one is persisted
+    @return: PlayerSimilarityIndex
+    """
+    index_path = DATA_DIR / f"player_similarity_{metric}.pkl"
+    if (
+        not rebuild
+        and index_path.exists()
+        and index_path.stat().st_mtime >= STANDARD_STATS_CSV.stat().st_mtime
+    ):
+        return PlayerSimilarityIndex.load(index_path)
+
+    start_time = time.perf_counter()
+    index = PlayerSimilarityIndex(load_standard_stats(), metric)
+    index.save(index_path)
+    print(
+        f"Built {metric} similarity index of {len(index.info)} players. "
+        f"({time.perf_counter() - start_time:.2f}s)"
+    )
+    return index
+
+
+def find_similar_players(
+    name: str, n: int = 5, metric: str = "euclidean", positions: List[str] = None
+) -> pd.DataFrame:
+    """
+    Most similar players to the first player matching a name, from the standard stats CSV.
+    @param name: Name or part of it
+    @param n: Number of players returned
+    @param metric: One of METRICS
+    @param positions: Only return players with one of these positions (e.g. ["FW"])
+    @return: See PlayerSimilarityIndex.similar
+    @raise ValueError: If no player matches the name
+    """
+    index = get_index(metric)
+    matches = index.find(name)
+    if matches.empty:
+        raise ValueError(f"No player matching {name!r}.")
+    return index.similar(matches.index[0], n, positions=positions)
+
+
+def find_similar_players_from_appearances(
+    player_id: int, since: date, n: int = 5, metric: str = "euclidean"
+) -> pd.DataFrame:
+    """
+    Most similar players to a player, by per-90 stats aggregated from `appearances`.
+    @param player_id: Player ID
+    @param since: First appearance date included
+    @param n: Number of players returned
+    @param metric: One of METRICS
+    @return: See PlayerSimilarityIndex.similar (`key` is the player_id)
+    @raise ValueError: If the player has too few minutes since the date
+    """
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        index = PlayerSimilarityIndex(load_appearance_stats(conn, since), metric)
+    rows = np.flatnonzero(index.info["key"].to_numpy() == player_id)
+    if not len(rows):
+        raise ValueError(f"Player {player_id} has too few minutes since {since}.")
+    return index.similar(rows[0], n)
+
+
+# Usage
+if __name__ == "__main__":
+    print(find_similar_players(input("Player name: ").strip()).to_string())
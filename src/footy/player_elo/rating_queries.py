@@ -0,0 +1,374 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from footy.player_elo.database_connection import DatabaseConnection
+from footy.player_elo.game_analysis import GameAnalysis
+from footy.player_elo.leaderboards import LeaderboardIndex
+
+# Typing
+RatedPlayer = Tuple[int, str, str, float]  # player_id, name, position, elo
+SeasonRating = Tuple[int, float]  # season, elo
+
+# Seconds a cached result is served, bounding its staleness when the ratings are updated by
+# another process (flushes of this process invalidate the cache right away)
+CACHE_TTL = 60.0
+CACHE_SIZE = 1024
+# Players of a club counted in its best XI strength
+BEST_XI_SIZE = 11
+
+# Caches of the live RatingQueries of this process (see invalidate_rating_cache)
+_caches = weakref.WeakSet()
+
+
+class TTLCache:
+    """
+    LRU cache whose entries expire `ttl` seconds after being stored. Thread safe.
+
+    `clear` bumps a generation counter: a result computed from data read before the clear is not
+    stored (see `put`), so a query racing an invalidation cannot cache stale ratings.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        """
+        @param maxsize: Entries kept, least recently used ones are evicted first
+        @param ttl: Seconds an entry is served
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, object]:
+        """
+        Look a key up.
+        @param key: Key
+        @return: (found, value), value is None if not found or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, value, generation: int) -> bool:
+        """
+        Store a value, unless the cache was cleared since it was computed.
+        @param key: Key
+        @param value: Value (shared by every caller, must not be mutated)
+        @param generation: `generation` read before computing the value
+        @return: Whether the value was stored
+        """
+        with self._lock:
+            if generation != self.generation:
+                return False
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return True
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def invalidate_rating_cache() -> None:
+    """
+    Clear the caches of every RatingQueries of this process.
+    Called by EloUpdater after writing player ELOs.
+    """
+    for cache in list(_caches):
+        cache.clear()
+
+
+class RatingQueries:
+    """
+    Read API of the player ratings: leaderboards, rating history of a player, club strength.
+
+    Results are kept in a TTLCache (a repeated query is a dictionary lookup instead of a database
+    round trip) and returned as tuples, shared by every caller. The cache is cleared when
+    EloUpdater writes ratings in this process (invalidate_rating_cache); writes of other processes
+    are seen after at most `ttl` seconds.
+
+    Queries only read: each one ends its transaction with a rollback, so give RatingQueries a
+    connection of its own rather than one with pending writes. The indexes the queries rely on
+    are created with the schema (init_sql.create_query_indexes).
+
+    Given a LeaderboardIndex (shared with the EloUpdater of the process, which keeps it up to
+    date), top players and ranks are read from its leaderboards instead, without a sort; they see
+    the writes of other processes once the index reloads the season (after its own `ttl`).
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+        cache: Cache of the query results.
+        leaderboards: In-memory leaderboards (optional).
+    """
+
+    def __init__(
+        self,
+        conn,
+        ttl: float = CACHE_TTL,
+        maxsize: int = CACHE_SIZE,
+        leaderboards: LeaderboardIndex = None,
+    ):
+        """
+        Initialize the RatingQueries class.
+
+        Args:
+            conn: Database connection object for creating cursors (used for reads only).
+            ttl: Seconds a cached result is served.
+            maxsize: Results kept in the cache.
+            leaderboards: Leaderboards serving top players and ranks (optional).
+        """
+        self.conn = conn
+        self.leaderboards = leaderboards
+        self.cache = TTLCache(maxsize, ttl)
+        _caches.add(self.cache)
+
+    def _fetch(self, key: Hashable, query: str, params) -> tuple:
+        """
+        Rows of a query, from the cache if present.
+        @param key: Cache key of the query and its parameters
+        @param query: Query
+        @param params: Query parameters
+        @return: Rows, as a tuple of tuples
+        """
+        found, rows = self.cache.get(key)
+        if found:
+            return rows
+        generation = self.cache.generation
+        with self.conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = tuple(tuple(row) for row in cur.fetchall())
+        # Do not leave the connection idle in a transaction between queries (nothing to commit)
+        self.conn.rollback()
+        self.cache.put(key, rows, generation)
+        return rows
+
+    @staticmethod
+    def _filters(competition_id: Optional[str], position: Optional[str]) -> str:
+        """
+        WHERE clause of the players_elo rows (pe) of a leaderboard (see top_players).
+        Games are matched to a players_elo season by date (see _season_params): games.season is
+        the season of the competition, which does not start on the same day.
+        """
+        filters = ["pe.season = %(season)s", "pe.elo IS NOT NULL"]
+        if position is not None:
+            filters.append("p.position = %(position)s")
+        if competition_id is not None:
+            filters.append(
+                """pe.player_id IN (
+                    SELECT a.player_id
+                    FROM games g
+                    JOIN appearances a ON a.game_id = g.game_id
+                    WHERE g.competition_id = %(competition_id)s
+                      AND g.date >= %(season_start)s AND g.date < %(season_end)s
+                )"""
+            )
+        return " AND ".join(filters)
+
+    @staticmethod
+    def _season_params(season: int) -> Dict[str, object]:
+        """Date range of the games of a players_elo season (parameters of _filters)."""
+        return {
+            "season_start": GameAnalysis.season_start(season),
+            "season_end": GameAnalysis.season_start(season + 1),
+        }
+
+    def latest_season(self) -> Optional[int]:
+        """
+        Latest season with player ELOs.
+        @return: Season, None if there are no ELOs
+        """
+        rows = self._fetch(
+            ("latest_season",),
+            "SELECT MAX(season) FROM players_elo WHERE elo IS NOT NULL",
+            None,
+        )
+        return rows[0][0]
+
+    def top_players(
+        self,
+        season: Optional[int] = None,
+        n: int = 10,
+        competition_id: Optional[str] = None,
+        position: Optional[str] = None,
+    ) -> Tuple[RatedPlayer, ...]:
+        """
+        Highest rated players of a season.
+        @param season: Season (default: latest season)
+        @param n: Number of players
+        @param competition_id: Only players who played a game of this competition in the season
+        @param position: Only players of this position (players.position, e.g. "Attack")
+        @return: (player_id, name, position, elo) by descending ELO
+        """
+        if season is None:
+            season = self.latest_season()
+            if season is None:
+                return ()
+        if self.leaderboards is not None:
+            players = self.leaderboards.players
+            return tuple(
+                (player_id, *players.get(player_id, (None, None)), elo)
+                for player_id, elo in self.leaderboards.top(season, n, competition_id, position)
+            )
+        query = f"""
+            SELECT pe.player_id, COALESCE(pe.name, p.name), p.position, pe.elo
+            FROM players_elo pe
+            LEFT JOIN players p ON p.player_id = pe.player_id
+            WHERE {self._filters(competition_id, position)}
+            ORDER BY pe.elo DESC, pe.player_id
+            LIMIT %(n)s
+        """
+        params = {
+            "season": season,
+            "n": n,
+            "competition_id": competition_id,
+            "position": position,
+            **self._season_params(season),
+        }
+        return self._fetch(("top_players", season, n, competition_id, position), query, params)
+
+    def player_rank(
+        self,
+        player_id: int,
+        season: Optional[int] = None,
+        competition_id: Optional[str] = None,
+        position: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Rank of a player on a leaderboard of top_players (1 for the best).
+        @param player_id: Player ID
+        @param season: Season (default: latest season)
+        @param competition_id: Rank among the players of this competition
+        @param position: Rank among the players of this position
+        @return: Rank, None if the player is not on that leaderboard
+        """
+        if season is None:
+            season = self.latest_season()
+            if season is None:
+                return None
+        if self.leaderboards is not None:
+            return self.leaderboards.rank(player_id, season, competition_id, position)
+        # Players ahead: higher ELO, or same ELO and lower ID (the order of top_players)
+        query = f"""
+            SELECT
+                (SELECT pe.elo FROM players_elo pe LEFT JOIN players p
+                    ON p.player_id = pe.player_id
+                 WHERE {self._filters(competition_id, position)}
+                   AND pe.player_id = %(player_id)s),
+                (SELECT COUNT(*) FROM players_elo pe
+                 LEFT JOIN players p ON p.player_id = pe.player_id
+                 JOIN players_elo own ON own.player_id = %(player_id)s AND own.season = pe.season
+                 WHERE {self._filters(competition_id, position)}
+                   AND (pe.elo > own.elo OR (pe.elo = own.elo AND pe.player_id < own.player_id)))
+        """
+        params = {
+            "player_id": player_id,
+            "season": season,
+            "competition_id": competition_id,
+            "position": position,
+            **self._season_params(season),
+        }
+        ((elo, ahead),) = self._fetch(
+            ("player_rank", player_id, season, competition_id, position), query, params
+        )
+        return ahead + 1 if elo is not None else None
+
+    def player_history(self, player_id: int) -> Tuple[SeasonRating, ...]:
+        """
+        ELO of a player in every season.
+        @param player_id: Player ID
+        @return: (season, elo) by season
+        """
+        return self._fetch(
+            ("player_history", player_id),
+            """
+            SELECT season, elo
+            FROM players_elo
+            WHERE player_id = %s AND elo IS NOT NULL
+            ORDER BY season
+            """,
+            (player_id,),
+        )
+
+    def club_strength(self, club_id: int, season: Optional[int] = None) -> Dict[str, float]:
+        """
+        Strength of a club's current squad (players.current_club_id) from their latest ELOs.
+        @param club_id: Club ID
+        @param season: Ratings of this season or before (default: latest season)
+        @return: players (rated players of the squad), mean_elo, best_xi_elo (mean ELO of the
+            BEST_XI_SIZE best players); ELOs are None for a squad without ratings
+        """
+        if season is None:
+            season = self.latest_season()
+        rows = self._fetch(
+            ("club_strength", club_id, season),
+            """
+            SELECT pe.elo
+            FROM players p
+            JOIN players_elo pe ON pe.player_id = p.player_id
+            WHERE p.current_club_id = %(club_id)s
+              AND pe.season = (
+                  SELECT MAX(latest.season)
+                  FROM players_elo latest
+                  WHERE latest.player_id = p.player_id
+                    AND latest.season <= %(season)s
+                    AND latest.elo IS NOT NULL
+              )
+            ORDER BY pe.elo DESC
+            """,
+            {"club_id": club_id, "season": season},
+        )
+        elos = [elo for (elo,) in rows]
+        best_xi = elos[:BEST_XI_SIZE]
+        return {
+            "players": len(elos),
+            "mean_elo": sum(elos) / len(elos) if elos else None,
+            "best_xi_elo": sum(best_xi) / len(best_xi) if best_xi else None,
+        }
+
+
+def print_leaderboard(
+    season: Optional[int] = None, n: int = 10, queries: RatingQueries = None
+) -> Tuple[RatedPlayer, ...]:
+    """
+    Print the highest rated players of a season.
+    @param season: Season (default: latest season)
+    @param n: Number of players
+    @param queries: RatingQueries to read them from (default: on the configured database)
+    @return: (player_id, name, position, elo) by descending ELO
+    """
+    if queries is None:
+        from footy.player_elo.database_connection import DATABASE_CONFIG
+
+        with DatabaseConnection(DATABASE_CONFIG) as conn:
+            return print_leaderboard(season, n, RatingQueries(conn))
+
+    season = season if season is not None else queries.latest_season()
+    leaderboard = queries.top_players(season, n)
+    print(f"Top {n} players of season {season}:")
+    for rank, (player_id, name, position, elo) in enumerate(leaderboard, start=1):
+        print(f"{rank:3d}. {name or player_id} ({position or '-'}): {elo:.1f}")
+    return leaderboard
+
+
+# Usage
+if __name__ == "__main__":
+    print_leaderboard()
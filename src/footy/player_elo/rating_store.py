@@ -0,0 +1,186 @@
+import logging
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Header of the shared block: capacity, season of the ratings
+_HEADER_SIZE = 2
+# Readers retry a torn read this many times before raising
+MAX_READ_RETRIES = 1000
+
+
+class SharedRatingStore:
+    """
+    Player ELOs of one season in shared memory, read by the ELO worker processes without a
+    database round trip and written by the coordinator only.
+
+    The block holds a header (capacity, season), then three arrays of `capacity` slots:
+    - player IDs, sorted: a player's slot is their position (np.searchsorted),
+    - version counters: odd while the slot is being written (seqlock),
+    - ratings (float64, NaN when the player has no ELO this season).
+
+    The writer bumps a slot's version before and after writing its rating. A reader takes the
+    version, the rating and the version again, and retries the slots whose versions were odd or
+    changed in between, so a rating is never read half-written.
+
+    Create it in the coordinator (`create`), open it in workers by name (`attach`).
+    """
+
+    def __init__(self, shm: SharedMemory, owner: bool):
+        """
+        @param shm: Shared memory block laid out by `create`
+        @param owner: Whether this process created the block (and unlinks it)
+        """
+        self.shm = shm
+        self.owner = owner
+        header = np.ndarray((_HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+        capacity = int(header[0])
+        offset = header.nbytes
+        self._header = header
+        self.player_ids = np.ndarray((capacity,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.player_ids.nbytes
+        self.versions = np.ndarray((capacity,), dtype=np.uint64, buffer=shm.buf, offset=offset)
+        offset += self.versions.nbytes
+        self.ratings = np.ndarray((capacity,), dtype=np.float64, buffer=shm.buf, offset=offset)
+
+    @classmethod
+    def create(cls, player_ids: Iterable[int]) -> "SharedRatingStore":
+        """
+        Allocate a store with one slot per player (no ratings yet).
+        @param player_ids: Every player whose ELO can be read or written
+        @return: SharedRatingStore owning the block
+        """
+        ids = np.unique(np.fromiter(player_ids, dtype=np.int64))
+        capacity = len(ids)
+        size = (_HEADER_SIZE + 3 * max(capacity, 1)) * 8
+        shm = SharedMemory(create=True, size=size)
+        np.ndarray((_HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)[:] = (capacity, -1)
+        store = cls(shm, owner=True)
+        store.player_ids[:] = ids
+        store.versions[:] = 0
+        store.ratings[:] = np.nan
+        return store
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedRatingStore":
+        """
+        Open the store created by another process.
+        @param name: `name` of the store
+        @return: SharedRatingStore (not owning the block)
+        """
+        # Pool workers share the resource tracker of the process that created the block, so only
+        # the owner's unlink frees it
+        shm = SharedMemory(name=name)
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def season(self) -> int:
+        """Season of the stored ratings (-1 before the first `load`)."""
+        return int(self._header[1])
+
+    def slots(self, player_ids: Iterable[int]) -> np.ndarray:
+        """
+        Slots of some players.
+        @param player_ids: Player IDs
+        @return: Slot per player, -1 for players without one
+        """
+        ids = np.asarray(list(player_ids), dtype=np.int64)
+        slots = np.searchsorted(self.player_ids, ids)
+        slots[slots == len(self.player_ids)] = 0
+        found = len(self.player_ids) > 0 and (self.player_ids[slots] == ids)
+        return np.where(found, slots, -1)
+
+    def read(self, player_ids: List[int]) -> List[Tuple[int, float]]:
+        """
+        Current ELOs of some players (consistent per slot, see the seqlock above).
+        @param player_ids: Player IDs (None entries are skipped)
+        @return: (player_id, elo) of the players with an ELO this season
+        @raise RuntimeError: If a slot stays under write for MAX_READ_RETRIES reads
+        """
+        ids = [player_id for player_id in player_ids if player_id is not None]
+        slots = self.slots(ids)
+        known = slots >= 0
+        ids = np.asarray(ids, dtype=np.int64)[known]
+        slots = slots[known]
+
+        values = np.empty(len(slots), dtype=np.float64)
+        pending = np.arange(len(slots))
+        for _ in range(MAX_READ_RETRIES):
+            before = self.versions[slots[pending]]
+            values[pending] = self.ratings[slots[pending]]
+            after = self.versions[slots[pending]]
+            pending = pending[(before != after) | (before % 2 == 1)]
+            if len(pending) == 0:
+                break
+        else:
+            raise RuntimeError(f"{len(pending)} ratings stayed under write.")
+
+        rated = ~np.isnan(values)
+        return list(zip(ids[rated].tolist(), values[rated].tolist()))
+
+    def write(self, player_ids: List[int], ratings: List[float]) -> int:
+        """
+        Set ELOs, in order (a player listed twice keeps the last one). Single writer only.
+        @param player_ids: Player IDs
+        @param ratings: New ELOs
+        @return: Number of ratings written (players without a slot are skipped and logged)
+        """
+        slots = self.slots(player_ids)
+        values = np.asarray(ratings, dtype=np.float64)
+        known = slots >= 0
+        if not known.all():
+            skipped = np.unique(np.asarray(player_ids, dtype=np.int64)[~known])
+            logging.warning(
+                f"Rating store has no slot for {len(skipped)} players, their ELOs are not "
+                f"shared with the workers: {skipped[:10].tolist()}"
+            )
+        slots, values = slots[known], values[known]
+        # Duplicated slots: keep the last rating of each
+        last = len(slots) - 1 - np.unique(slots[::-1], return_index=True)[1]
+        slots, values = slots[last], values[last]
+
+        self.versions[slots] += 1
+        self.ratings[slots] = values
+        self.versions[slots] += 1
+        return len(slots)
+
+    def load(self, season: int, rows: Iterable[Tuple[int, float]]) -> int:
+        """
+        Replace the stored ratings by a season's ELOs (players missing from `rows` get none).
+        Only call it while no worker is reading.
+        @param season: Season of the ratings
+        @param rows: (player_id, elo) rows
+        @return: Number of ratings loaded
+        """
+        rows = [(player_id, elo) for player_id, elo in rows if elo is not None]
+        self.versions += 1
+        self.ratings[:] = np.nan
+        self._header[1] = season
+        self.versions += 1
+        if not rows:
+            return 0
+        player_ids, ratings = zip(*rows)
+        return self.write(list(player_ids), list(ratings))
+
+    def close(self) -> None:
+        """Release this process' view of the block, and free the block if it owns it."""
+        # The arrays must be released before the buffer they are views of
+        self._header = self.player_ids = self.versions = self.ratings = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def as_dict(self) -> Dict[int, float]:
+        """Every stored ELO (player_id -> elo)."""
+        return dict(self.read(self.player_ids.tolist()))
@@ -1,4 +1,10 @@
-from footy.player_elo.database_connection import DatabaseConnection, DATABASE_CONFIG
+import time
+
+from footy.player_elo.database_connection import (
+    DatabaseConnection,
+    DATABASE_CONFIG,
+    backend_of,
+)
 
 
 # Constants
@@ -9,7 +15,185 @@ from footy.player_elo.database_connection import DatabaseConnection, DATABASE_CO
 class PlayersEloReinitialiser:
     """Initialize Player ELO based on SQL operations.
     @precondition: players_elo.csv file is alr created, player ELO value might not be accurate.
-    @precondition: PostGre SQL database is alr created."""
+    @precondition: SQL database (PostgreSQL or SQLite) is alr created.
+
+    The players_elo table is rebuilt set-based: seasons are gap-filled with generate_series
+    (a recursive range on SQLite), the earliest valuation of every (player, season) is picked
+    with DISTINCT ON (ROW_NUMBER on SQLite), and the result is written with a single
+    CREATE TABLE AS which is then swapped in for the old table.
+    """
+
+    # Queries that differ between storage backends, keyed by backend (see backend_of)
+    VALUATION_SEASONS_QUERY = {
+        "postgres": """
+            ALTER TABLE player_valuations ADD COLUMN IF NOT EXISTS season INTEGER;
+
+            -- Calendar-year seasons, as replayed (GameAnalysis.season_of); also corrects rows
+            -- stored with another convention
+            UPDATE player_valuations
+            SET season = EXTRACT(YEAR FROM date)::INTEGER
+            WHERE season IS DISTINCT FROM EXTRACT(YEAR FROM date)::INTEGER;
+
+            CREATE INDEX IF NOT EXISTS player_valuations_player_season_date_idx
+                ON player_valuations (player_id, season, date);
+        """,
+        # The season column is added beforehand (no ADD COLUMN IF NOT EXISTS in SQLite)
+        "sqlite": """
+            UPDATE player_valuations
+            SET season = CAST(strftime('%Y', date) AS INTEGER)
+            WHERE season IS NOT CAST(strftime('%Y', date) AS INTEGER);
+
+            CREATE INDEX IF NOT EXISTS player_valuations_player_season_date_idx
+                ON player_valuations (player_id, season, date);
+        """,
+    }
+    SEASON_VALUATIONS_QUERY = {
+        "postgres": """
+            DROP TABLE IF EXISTS season_valuations;
+            CREATE TABLE season_valuations AS
+            SELECT 
+                p.season,
+                AVG(LOG(1 + p.market_value_in_eur)) AS mean_log,
+                STDDEV(LOG(1 + p.market_value_in_eur)) AS std_log
+            FROM player_valuations p
+            GROUP BY p.season;
+            ALTER TABLE season_valuations ADD PRIMARY KEY (season);
+        """,
+        "sqlite": """
+            DROP TABLE IF EXISTS season_valuations;
+            CREATE TABLE season_valuations (
+                season INTEGER PRIMARY KEY,
+                mean_log REAL,
+                std_log REAL
+            );
+            INSERT INTO season_valuations (season, mean_log, std_log)
+            SELECT
+                p.season,
+                AVG(LOG(1 + p.market_value_in_eur)),
+                STDDEV(LOG(1 + p.market_value_in_eur))
+            FROM player_valuations p
+            GROUP BY p.season;
+        """,
+    }
+    # Formatted with base_elo and half_elo_range
+    BUILD_PLAYERS_ELO_QUERY = {
+        "postgres": """
+            DROP TABLE IF EXISTS players_elo_new;
+            CREATE TABLE players_elo_new AS
+            WITH season_bounds AS (
+                SELECT player_id, MIN(season) AS min_season, MAX(season) AS max_season
+                FROM players_elo
+                GROUP BY player_id
+            ),
+            player_details AS (
+                SELECT DISTINCT ON (player_id)
+                    player_id, first_name, last_name, name, player_code,
+                    country_of_birth, date_of_birth
+                FROM players_elo
+                ORDER BY player_id, (name IS NULL), season
+            ),
+            first_valuations AS (
+                SELECT DISTINCT ON (player_id, season)
+                    player_id, season, market_value_in_eur
+                FROM player_valuations
+                ORDER BY player_id, season, date
+            )
+            SELECT
+                b.player_id,
+                s.season::INTEGER AS season,
+                d.first_name,
+                d.last_name,
+                d.name,
+                d.player_code,
+                d.country_of_birth,
+                d.date_of_birth,
+                ({base_elo} + (
+                    (LOG(1 + fv.market_value_in_eur) - sv.mean_log) / NULLIF(sv.std_log, 0)
+                    * {half_elo_range}
+                ))::DOUBLE PRECISION AS elo
+            FROM season_bounds b
+            CROSS JOIN LATERAL generate_series(b.min_season, b.max_season) AS s(season)
+            JOIN player_details d ON d.player_id = b.player_id
+            LEFT JOIN first_valuations fv
+                ON fv.player_id = b.player_id AND fv.season = s.season
+            LEFT JOIN season_valuations sv ON sv.season = s.season;
+        """,
+        # No DISTINCT ON / generate_series: ROW_NUMBER and a recursive range of seasons
+        "sqlite": """
+            DROP TABLE IF EXISTS players_elo_new;
+            CREATE TABLE players_elo_new AS
+            WITH RECURSIVE seasons(season) AS (
+                SELECT MIN(season) FROM players_elo
+                UNION ALL
+                SELECT season + 1 FROM seasons
+                WHERE season < (SELECT MAX(season) FROM players_elo)
+            ),
+            season_bounds AS (
+                SELECT player_id, MIN(season) AS min_season, MAX(season) AS max_season
+                FROM players_elo
+                GROUP BY player_id
+            ),
+            player_details AS (
+                SELECT
+                    player_id, first_name, last_name, name, player_code,
+                    country_of_birth, date_of_birth
+                FROM (
+                    SELECT *, ROW_NUMBER() OVER (
+                        PARTITION BY player_id ORDER BY (name IS NULL), season
+                    ) AS rn
+                    FROM players_elo
+                )
+                WHERE rn = 1
+            ),
+            first_valuations AS (
+                SELECT player_id, season, market_value_in_eur
+                FROM (
+                    SELECT player_id, season, market_value_in_eur, ROW_NUMBER() OVER (
+                        PARTITION BY player_id, season ORDER BY date
+                    ) AS rn
+                    FROM player_valuations
+                )
+                WHERE rn = 1
+            )
+            SELECT
+                b.player_id,
+                CAST(s.season AS INTEGER) AS season,
+                d.first_name,
+                d.last_name,
+                d.name,
+                d.player_code,
+                d.country_of_birth,
+                d.date_of_birth,
+                CAST({base_elo} + (
+                    (LOG(1 + fv.market_value_in_eur) - sv.mean_log) / NULLIF(sv.std_log, 0)
+                    * {half_elo_range}
+                ) AS REAL) AS elo
+            FROM season_bounds b
+            JOIN seasons s ON s.season BETWEEN b.min_season AND b.max_season
+            JOIN player_details d ON d.player_id = b.player_id
+            LEFT JOIN first_valuations fv
+                ON fv.player_id = b.player_id AND fv.season = s.season
+            LEFT JOIN season_valuations sv ON sv.season = s.season;
+        """,
+    }
+    SWAP_PLAYERS_ELO_QUERY = {
+        "postgres": """
+            DROP TABLE players_elo;
+            ALTER TABLE players_elo_new RENAME TO players_elo;
+            ALTER TABLE players_elo
+                ADD CONSTRAINT player_elo_pk PRIMARY KEY (player_id, season);
+            CREATE INDEX players_elo_season_elo_idx ON players_elo (season, elo DESC);
+            ANALYZE players_elo;
+        """,
+        # No constraints added by ALTER TABLE in SQLite: a unique index backs ON CONFLICT
+        "sqlite": """
+            DROP TABLE players_elo;
+            ALTER TABLE players_elo_new RENAME TO players_elo;
+            CREATE UNIQUE INDEX player_elo_pk ON players_elo (player_id, season);
+            CREATE INDEX players_elo_season_elo_idx ON players_elo (season, elo DESC);
+            ANALYZE players_elo;
+        """,
+    }
 
     def __init__(self, cur, base_elo, elo_range):
         """
@@ -18,93 +202,76 @@ class PlayersEloReinitialiser:
         @param elo_range:
         """
         self.cur = cur
+        self.backend = backend_of(cur.connection)
         self.base_elo = base_elo
         self.elo_range = elo_range
 
-    def reset_elo_column(self):
-        """Reset the ELO column for all players in the players_elo table."""
-        print("Resetting ELO column...")
-        self.cur.execute(
-            """
-            UPDATE players_elo
-            SET elo = NULL;
+    def _timed_step(self, description, step):
         """
-        )
+        Run a single reinitialisation step and print how long it took.
+        @param description: Human readable name of the step
+        @param step: Callable running the step
+        @return: None
+        """
+        start_time = time.perf_counter()
+        step()
+        print(f"{description} ({time.perf_counter() - start_time:.2f}s)")
+
+    def init_valuation_seasons(self):
+        """
+        Persist a season column on player_valuations (the calendar year, like the seasons of the
+        replay, see GameAnalysis.season_of), so that valuations can be joined on season through an
+        index instead of EXTRACT(YEAR ...).
+        """
+        if self.backend == "sqlite":
+            self.cur.execute(
+                "SELECT COUNT(*) FROM pragma_table_info('player_valuations') WHERE name = 'season';"
+            )
+            if not self.cur.fetchone()[0]:
+                self.cur.execute("ALTER TABLE player_valuations ADD COLUMN season INTEGER;")
+        self.cur.execute(self.VALUATION_SEASONS_QUERY[self.backend])
 
         self.cur.connection.commit()
-        print("ELO column reset successfully.")
 
     def init_season_valuations(self):
         """Calculate mean and std of player valuations per season, storing in SQL for fast access."""
         # Calculate mean and std of log-transformed values for each season and store them in a new table
-        self.cur.execute(
-            """
-            DROP TABLE IF EXISTS season_valuations;
-            CREATE TABLE season_valuations AS
-            SELECT 
-                EXTRACT(YEAR FROM p.date::date) AS season,  -- Alias the extracted year as `season`
-                AVG(LOG(1 + p.market_value_in_eur)) AS mean_log,
-                STDDEV(LOG(1 + p.market_value_in_eur)) AS std_log
-            FROM player_valuations p
-            GROUP BY season;
-        """
-        )
+        self.cur.execute(self.SEASON_VALUATIONS_QUERY[self.backend])
 
         self.cur.connection.commit()
-        print("Season valuations initialized.")
 
-    def fill_season_gaps(self):
-        """Fill missing seasons for each player directly in SQL."""
-        # Using a recursive CTE to generate continuous seasons for each player
+    def build_players_elo(self):
+        """
+        Build `players_elo_new`: one row per player for every season between their first and
+        last players_elo season, with ELO initialised from the earliest valuation of that season.
+        Player details are carried from the player's existing rows, so gap seasons keep them too.
+        """
         self.cur.execute(
-            """
-            WITH RECURSIVE seasons AS (
-                SELECT DISTINCT player_id, season AS min_season, season AS max_season
-                FROM players_elo
-                UNION
-                SELECT player_id, min_season, min_season + 1
-                FROM seasons
-                WHERE min_season + 1 <= max_season
+            self.BUILD_PLAYERS_ELO_QUERY[self.backend].format(
+                base_elo=self.base_elo, half_elo_range=self.elo_range / 2
             )
-            INSERT INTO players_elo (player_id, season)
-            SELECT s.player_id, s.min_season
-            FROM seasons s
-            LEFT JOIN players_elo p ON s.player_id = p.player_id AND s.min_season = p.season
-            WHERE p.season IS NULL;
-        """
         )
 
         self.cur.connection.commit()
-        print("Season gaps filled for players.")
 
-    def init_player_elo_with_value(self):
-        """Initialize ELO based on market value for each player per season using SQL."""
-        # Initialize ELO based on z-score calculation
-        self.cur.execute(
-            f"""
-            UPDATE players_elo
-            SET elo = {self.base_elo} + (
-                (LOG(1 + pv.market_value_in_eur) - sv.mean_log) / NULLIF(sv.std_log, 0)
-                * {self.elo_range / 2}
-            )
-            FROM player_valuations pv
-            JOIN season_valuations sv ON EXTRACT(YEAR FROM pv.date::date) = sv.season
-            WHERE players_elo.player_id = pv.player_id
-            AND players_elo.season = EXTRACT(YEAR FROM pv.date::date)
-            AND players_elo.elo IS NULL;
-        """
-        )
+    def swap_players_elo(self):
+        """Replace players_elo with players_elo_new in one transaction and restore its primary key."""
+        self.cur.execute(self.SWAP_PLAYERS_ELO_QUERY[self.backend])
 
         self.cur.connection.commit()
-        print("Player ELO initialized based on market value.")
 
     def init_all_players_elo(self):
         """Main function to initialize all player ELOs."""
-        self.reset_elo_column()
-        self.init_season_valuations()
-        self.fill_season_gaps()
-        self.init_player_elo_with_value()
-        print("All player ELOs initialized.")
+        start_time = time.perf_counter()
+        self._timed_step("Valuation seasons persisted.", self.init_valuation_seasons)
+        self._timed_step("Season valuations initialized.", self.init_season_valuations)
+        self._timed_step(
+            "Players ELO rebuilt with season gaps filled.", self.build_players_elo
+        )
+        self._timed_step("Players ELO table swapped in.", self.swap_players_elo)
+        print(
+            f"All player ELOs initialized. ({time.perf_counter() - start_time:.2f}s)"
+        )
         self.cur.execute(
             f"""
             SELECT name, elo
@@ -169,5 +336,3 @@ def reset_init_players_elo_db():
 # Usage
 if __name__ == "__main__":
     reset_init_players_elo_db()
-
-    # elo_reinit.reset_elo_column()
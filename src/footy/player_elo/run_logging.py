@@ -0,0 +1,133 @@
+import logging
+import multiprocessing
+import time
+from datetime import timedelta
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Tuple
+
+LOG_FORMAT = "%(asctime)s - %(processName)s - %(levelname)s - %(message)s"
+# Seconds between two progress summaries
+SUMMARY_INTERVAL = 30.0
+
+
+class RunLogListener(QueueListener):
+    """
+    QueueListener of `start_queue_logging`: stopping it also gives the root logger back its
+    handlers and level from before the run, instead of leaving the QueueHandler of a queue
+    nobody reads anymore.
+    """
+
+    def __init__(self, queue, *handlers, respect_handler_level: bool = False):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        root = logging.getLogger()
+        self._root_handlers = root.handlers[:]
+        self._root_level = root.level
+
+    def stop(self) -> None:
+        """Restore the root logger, then write out the queued records and stop the thread."""
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in self._root_handlers:
+            root.addHandler(handler)
+        root.setLevel(self._root_level)
+        super().stop()
+
+
+def start_queue_logging(
+    log_file: str, level: int = logging.INFO
+) -> Tuple[multiprocessing.Queue, RunLogListener]:
+    """
+    Route the logs of this process and of its worker processes through a queue to a single
+    listener thread, the only writer of the log file (so rotation is safe) and of the console.
+    Workers attach to the queue with `configure_worker_logging`.
+
+    @param log_file: Rotating log file
+    @param level: Level of the root logger (records below it are dropped where they are logged)
+    @return: (queue to pass to the workers, listener to stop at the end of the run, which
+        restores the logging of this process)
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=5)
+    console_handler = logging.StreamHandler()  # Remove this if you don't want logs in the console
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = multiprocessing.Queue()
+    listener = RunLogListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    configure_worker_logging(log_queue, level)
+    return log_queue, listener
+
+
+def configure_worker_logging(log_queue, level: int = logging.INFO) -> None:
+    """
+    Send every log record of the current process to the queue of `start_queue_logging`.
+    @param log_queue: Log queue
+    @param level: Level of the root logger
+    @return: None
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+class ProgressReporter:
+    """
+    Log one summary line (games done / remaining, games/s, ETA, errors) at most every `interval`
+    seconds, instead of a line per game, and a final line at the end of the run (log_summary).
+    """
+
+    def __init__(self, total: int, interval: float = SUMMARY_INTERVAL, label: str = "games"):
+        """
+        @param total: Number of items the run will process
+        @param interval: Seconds between two summaries
+        @param label: Name of the items in the summary
+        """
+        self.total = total
+        self.interval = interval
+        self.label = label
+        self.done = 0
+        self.errors = 0
+        self.start_time = time.perf_counter()
+        self._last_summary = self.start_time
+
+    def update(self, done: int = 0, errors: int = 0) -> None:
+        """
+        Count processed items, logging a summary if the interval has passed.
+        @param done: Items processed since the last update (errors included)
+        @param errors: Items that failed since the last update
+        @return: None
+        """
+        self.done += done
+        self.errors += errors
+        now = time.perf_counter()
+        # The last items are reported by log_summary at the end of the run
+        if now - self._last_summary >= self.interval and self.done < self.total:
+            self._last_summary = now
+            self._log_progress()
+
+    def _log_progress(self) -> None:
+        """Log the progress of the run."""
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.done, 0)
+        eta = timedelta(seconds=round(remaining / rate)) if rate > 0 else "unknown"
+        percent = 100 * self.done / self.total if self.total else 100.0
+        logging.info(
+            f"Progress: {self.done}/{self.total} {self.label} ({percent:.1f}%), "
+            f"{remaining} remaining, {rate:.1f} {self.label}/s, ETA {eta}, "
+            f"{self.errors} errors"
+        )
+
+    def log_summary(self) -> None:
+        """Log the end of the run: items processed, elapsed time, rate and errors."""
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            f"Finished: {self.done}/{self.total} {self.label} in "
+            f"{timedelta(seconds=round(elapsed))}, {rate:.1f} {self.label}/s, "
+            f"{self.errors} errors"
+        )
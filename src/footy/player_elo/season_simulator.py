@@ -0,0 +1,382 @@
+import time
+from datetime import date, timedelta
+from multiprocessing import Pool
+from typing import Dict, List
+
+import numpy as np
+
+from footy.player_elo.database_connection import DatabaseConnection, backend_of
+from footy.player_elo.game_analysis import GameAnalysis
+from footy.player_elo.match_simulator import MatchSimulator
+
+# Typing
+ClubProjection = Dict[str, object]
+
+POINTS_WIN = 3
+POINTS_DRAW = 1
+
+
+def _simulate_seasons(seed_sequence, n_seasons, batch_size, table, fixtures):
+    """
+    Simulate the remaining fixtures of a season n_seasons times (run in a worker process).
+
+    @param seed_sequence: np.random.SeedSequence of this worker
+    @param n_seasons: Number of simulated seasons
+    @param batch_size: Seasons simulated at once
+    @param table: Current (points, goal difference, goals for) arrays, one entry per club
+    @param fixtures: (home club index, away club index, home xG, away xG) arrays, one entry
+        per remaining fixture
+    @return: (position counts [club, position], summed final points per club)
+    """
+    rng = np.random.default_rng(seed_sequence)
+    points, goal_difference, goals_for = table
+    home, away, home_xg, away_xg = fixtures
+    n_clubs = len(points)
+    position_counts = np.zeros((n_clubs, n_clubs), dtype=np.int64)
+    points_sum = np.zeros(n_clubs)
+
+    # Fixture -> club incidence matrices: summing per club is a matrix product
+    home_matrix = np.zeros((len(home), n_clubs))
+    home_matrix[np.arange(len(home)), home] = 1
+    away_matrix = np.zeros((len(away), n_clubs))
+    away_matrix[np.arange(len(away)), away] = 1
+
+    remaining = n_seasons
+    while remaining > 0:
+        batch = min(remaining, batch_size)
+        home_goals = rng.poisson(home_xg, (batch, len(home))).astype(np.float64)
+        away_goals = rng.poisson(away_xg, (batch, len(away))).astype(np.float64)
+        home_points = np.where(
+            home_goals > away_goals,
+            POINTS_WIN,
+            np.where(home_goals == away_goals, POINTS_DRAW, 0),
+        )
+        away_points = np.where(
+            away_goals > home_goals,
+            POINTS_WIN,
+            np.where(home_goals == away_goals, POINTS_DRAW, 0),
+        )
+        goal_balance = home_goals - away_goals
+
+        final_points = points + home_points @ home_matrix + away_points @ away_matrix
+        final_goal_difference = (
+            goal_difference + goal_balance @ home_matrix - goal_balance @ away_matrix
+        )
+        final_goals_for = goals_for + home_goals @ home_matrix + away_goals @ away_matrix
+
+        # Standings: points, then goal difference, then goals for, remaining ties at random
+        key = (
+            final_points * 1e8
+            + final_goal_difference * 1e4
+            + final_goals_for
+            + rng.random((batch, n_clubs))
+        )
+        order = np.argsort(-key, axis=1)
+        positions = np.empty_like(order)
+        np.put_along_axis(positions, order, np.arange(n_clubs)[None, :], axis=1)
+        position_counts += np.bincount(
+            (np.arange(n_clubs)[None, :] * n_clubs + positions).ravel(),
+            minlength=n_clubs * n_clubs,
+        ).reshape(n_clubs, n_clubs)
+        points_sum += final_points.sum(axis=0)
+        remaining -= batch
+
+    return position_counts, points_sum
+
+
+class SeasonSimulator:
+    """
+    Project the final table of a league season by simulating its remaining fixtures.
+
+    The table at the cutoff date is built from the competition's played `games`. Every club is
+    rated like a MatchSimulator lineup: the minutes-weighted average ELO of its lineup in its last
+    game before the cutoff (from `game_features` and `players_elo`). The remaining fixtures are
+    then simulated with MatchSimulator's goal model, in vectorized batches split across a process
+    pool with independent random streams (SeedSequence.spawn).
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+        simulator: MatchSimulator providing ratings and expected goals.
+    """
+
+    N_PROCESSES = 4
+    BATCH_SIZE = 2_000  # Seasons simulated at once by a worker
+    TOP_POSITIONS = 4
+    RELEGATION_SPOTS = 3
+    LINEUP_LOOKBACK_DAYS = 365  # Clubs without a game in this window get the default ELO
+
+    SEASON_GAMES_QUERY = """
+        SELECT game_id, date, home_club_id, away_club_id, home_club_goals, away_club_goals
+        FROM games
+        WHERE competition_id = %s AND season = %s
+          AND home_club_id IS NOT NULL AND away_club_id IS NOT NULL
+        ORDER BY date, game_id
+    """
+    # Queries that differ between storage backends, keyed by backend (see backend_of)
+    LAST_LINEUPS_QUERY = {
+        "postgres": """
+            SELECT home_club_id, away_club_id, club_ids, player_ids, start_minutes, end_minutes
+            FROM game_features
+            WHERE date < %(cutoff)s AND date >= %(since)s
+              AND (home_club_id = ANY(%(club_ids)s) OR away_club_id = ANY(%(club_ids)s))
+            ORDER BY date DESC, game_id DESC
+        """,
+        "sqlite": """
+            SELECT home_club_id, away_club_id,
+                   club_ids AS "club_ids [json]", player_ids AS "player_ids [json]",
+                   start_minutes AS "start_minutes [json]", end_minutes AS "end_minutes [json]"
+            FROM game_features
+            WHERE date < %(cutoff)s AND date >= %(since)s
+              AND (home_club_id IN (SELECT value FROM json_each(%(club_ids)s))
+                   OR away_club_id IN (SELECT value FROM json_each(%(club_ids)s)))
+            ORDER BY date DESC, game_id DESC
+        """,
+    }
+    CLUB_NAMES_QUERY = {
+        "postgres": "SELECT club_id, name FROM clubs WHERE club_id = ANY(%s)",
+        "sqlite": """
+            SELECT club_id, name FROM clubs
+            WHERE club_id IN (SELECT value FROM json_each(%s))
+        """,
+    }
+
+    def __init__(self, conn, simulator: MatchSimulator = None):
+        """
+        Initialize the SeasonSimulator class.
+
+        Args:
+            conn: Database connection object for creating cursors.
+            simulator: MatchSimulator to use (a new one is calibrated when omitted).
+        """
+        self.conn = conn
+        self.backend = backend_of(conn)
+        self.simulator = simulator if simulator is not None else MatchSimulator(conn)
+
+    def fetch_season_games(self, competition_id: str, season: int, cutoff: date):
+        """
+        Split a league season into its table at the cutoff date and its remaining fixtures.
+        Games before the cutoff with a score count as played, every other game is remaining.
+
+        @param competition_id: Competition (e.g. 'GB1')
+        @param season: `games.season` of the league season
+        @param cutoff: Date the projection starts from
+        @return: (club IDs, table arrays (points, goal difference, goals for, played),
+            remaining fixtures as (home club index, away club index) arrays)
+        @raise ValueError: If the competition has no games in this season
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(self.SEASON_GAMES_QUERY, (competition_id, season))
+            games = cur.fetchall()
+        if not games:
+            raise ValueError(f"No games of {competition_id} in season {season}.")
+
+        _, dates, home_ids, away_ids, home_goals, away_goals = zip(*games)
+        club_ids, club_index = np.unique(
+            np.asarray(home_ids + away_ids, dtype=np.int64), return_inverse=True
+        )
+        home, away = club_index[: len(games)], club_index[len(games) :]
+        played = np.asarray(
+            [
+                str(game_date) < str(cutoff) and hg is not None and ag is not None
+                for game_date, hg, ag in zip(dates, home_goals, away_goals)
+            ],
+            dtype=bool,
+        )
+
+        n_clubs = len(club_ids)
+        home_scored = np.asarray([g or 0 for g in home_goals], dtype=np.float64)[played]
+        away_scored = np.asarray([g or 0 for g in away_goals], dtype=np.float64)[played]
+        home_points = np.where(
+            home_scored > away_scored,
+            POINTS_WIN,
+            np.where(home_scored == away_scored, POINTS_DRAW, 0),
+        )
+        away_points = np.where(
+            away_scored > home_scored,
+            POINTS_WIN,
+            np.where(home_scored == away_scored, POINTS_DRAW, 0),
+        )
+        played_home, played_away = home[played], away[played]
+        table = (
+            np.bincount(played_home, home_points, n_clubs)
+            + np.bincount(played_away, away_points, n_clubs),
+            np.bincount(played_home, home_scored - away_scored, n_clubs)
+            + np.bincount(played_away, away_scored - home_scored, n_clubs),
+            np.bincount(played_home, home_scored, n_clubs)
+            + np.bincount(played_away, away_scored, n_clubs),
+            np.bincount(played_home, minlength=n_clubs)
+            + np.bincount(played_away, minlength=n_clubs),
+        )
+        return club_ids, table, (home[~played], away[~played])
+
+    def club_ratings(self, club_ids: np.ndarray, cutoff: date) -> np.ndarray:
+        """
+        Rate every club by its lineup in its last game before the cutoff.
+
+        @param club_ids: Club IDs
+        @param cutoff: Date the projection starts from
+        @return: Rating per club (default ELO for clubs without a recent game)
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                self.LAST_LINEUPS_QUERY[self.backend],
+                {
+                    "cutoff": cutoff,
+                    "since": cutoff - timedelta(days=self.LINEUP_LOOKBACK_DAYS),
+                    "club_ids": club_ids.tolist(),
+                },
+            )
+            rows = cur.fetchall()
+
+        # Newest game first: keep each club's first lineup
+        lineups = {}
+        wanted = set(club_ids.tolist())
+        for home_club_id, away_club_id, clubs, players, starts, ends in rows:
+            for club_id in (home_club_id, away_club_id):
+                if club_id not in wanted or club_id in lineups:
+                    continue
+                lineups[club_id] = {
+                    player_id: minutes
+                    for player_club, player_id, minutes in zip(
+                        clubs, players, np.abs(np.subtract(ends, starts)).tolist()
+                    )
+                    if player_club == club_id
+                }
+            if len(lineups) == len(wanted):
+                break
+
+        season = GameAnalysis.season_of(cutoff)
+        return np.asarray(
+            [
+                (
+                    self.simulator.lineup_rating(lineups[club_id], season)
+                    if lineups.get(club_id)
+                    else float(self.simulator.DEFAULT_ELO)
+                )
+                for club_id in club_ids.tolist()
+            ]
+        )
+
+    def _club_names(self, club_ids: np.ndarray) -> Dict[int, str]:
+        """Names of the clubs, from `clubs`."""
+        with self.conn.cursor() as cur:
+            cur.execute(self.CLUB_NAMES_QUERY[self.backend], (club_ids.tolist(),))
+            return dict(cur.fetchall())
+
+    def project(
+        self,
+        competition_id: str,
+        season: int,
+        cutoff: date,
+        n_seasons: int = 20_000,
+        n_processes: int = N_PROCESSES,
+        seed=None,
+    ) -> List[ClubProjection]:
+        """
+        Main function: simulate the rest of a league season and project its final table.
+
+        @param competition_id: Competition (e.g. 'GB1')
+        @param season: `games.season` of the league season
+        @param cutoff: Date the projection starts from
+        @param n_seasons: Number of simulated seasons
+        @param n_processes: Number of worker processes
+        @param seed: Seed of the random streams (for reproducible projections)
+        @return: One entry per club, by expected points: club_id, name, played, points,
+            expected_points, title, top_four, relegation, positions (probability per position)
+        """
+        start_time = time.perf_counter()
+        club_ids, table, (home, away) = self.fetch_season_games(
+            competition_id, season, cutoff
+        )
+        points, goal_difference, goals_for, played = table
+        ratings = self.club_ratings(club_ids, cutoff)
+        home_xg, away_xg = self.simulator.expected_goals(ratings[home], ratings[away])
+        fetched_time = time.perf_counter()
+        print(
+            f"{competition_id} {season}: {len(club_ids)} clubs, {len(home)} remaining fixtures "
+            f"after {cutoff}. ({fetched_time - start_time:.2f}s)"
+        )
+
+        # Independent random stream and share of the seasons for every worker
+        n_processes = max(1, min(n_processes, n_seasons))
+        seed_sequences = np.random.SeedSequence(seed).spawn(n_processes)
+        shares = np.diff(np.linspace(0, n_seasons, n_processes + 1).astype(int))
+        tasks = [
+            (
+                seed_sequence,
+                int(share),
+                self.BATCH_SIZE,
+                (points, goal_difference, goals_for),
+                (home, away, np.asarray(home_xg), np.asarray(away_xg)),
+            )
+            for seed_sequence, share in zip(seed_sequences, shares)
+        ]
+        if n_processes == 1:
+            results = [_simulate_seasons(*tasks[0])]
+        else:
+            with Pool(processes=n_processes) as pool:
+                results = pool.starmap(_simulate_seasons, tasks)
+        position_counts = sum(counts for counts, _ in results)
+        points_sum = sum(points_total for _, points_total in results)
+        print(
+            f"Simulated {n_seasons} seasons on {n_processes} processes. "
+            f"({time.perf_counter() - fetched_time:.2f}s)"
+        )
+
+        positions = position_counts / n_seasons
+        n_clubs = len(club_ids)
+        relegation_spots = min(self.RELEGATION_SPOTS, n_clubs)
+        names = self._club_names(club_ids)
+        projection = [
+            {
+                "club_id": club_id,
+                "name": names.get(club_id),
+                "rating": float(ratings[i]),
+                "played": int(played[i]),
+                "points": int(points[i]),
+                "expected_points": float(points_sum[i] / n_seasons),
+                "title": float(positions[i, 0]),
+                "top_four": float(positions[i, : self.TOP_POSITIONS].sum()),
+                "relegation": float(positions[i, n_clubs - relegation_spots :].sum()),
+                "positions": positions[i],
+            }
+            for i, club_id in enumerate(club_ids.tolist())
+        ]
+        projection.sort(key=lambda club: club["expected_points"], reverse=True)
+        return projection
+
+
+def project_season(competition_id: str, season: int, cutoff: date, n_seasons=20_000):
+    """
+    Project the final table of a league season from the configured DB, and print it.
+    @param competition_id: Competition (e.g. 'GB1')
+    @param season: `games.season` of the league season
+    @param cutoff: Date the projection starts from
+    @param n_seasons: Number of simulated seasons
+    @return: See SeasonSimulator.project
+    """
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        projection = SeasonSimulator(conn).project(
+            competition_id, season, cutoff, n_seasons
+        )
+
+    print(f"{'Club':<30} {'Pts':>4} {'xPts':>6} {'Title':>7} {'Top 4':>7} {'Rel.':>7}")
+    for club in projection:
+        print(
+            f"{str(club['name'] or club['club_id'])[:30]:<30} {club['points']:>4} "
+            f"{club['expected_points']:>6.1f} {club['title']:>7.1%} "
+            f"{club['top_four']:>7.1%} {club['relegation']:>7.1%}"
+        )
+    return projection
+
+
+# Usage
+if __name__ == "__main__":
+    project_season(
+        input("Competition ID (e.g. GB1): ").strip(),
+        int(input("Season (e.g. 2023): ")),
+        date.fromisoformat(input("Cutoff date (YYYY-MM-DD): ").strip()),
+    )
@@ -0,0 +1,244 @@
+import json
+import math
+import re
+import sqlite3
+from contextlib import nullcontext
+from datetime import date, datetime
+
+# FILTER clauses, window functions, math functions and IS DISTINCT FROM
+SQLITE_MIN_VERSION = (3, 39, 0)
+
+# psycopg placeholders -> sqlite3 placeholders
+_PLACEHOLDERS = re.compile(r"%\((\w+)\)s|%s|%%")
+
+# Dates are stored as ISO strings, as SQLAlchemy does for Date columns
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+# Array columns are stored as JSON text and decoded when selected AS "name [json]"
+sqlite3.register_converter("json", json.loads)
+
+
+def _translate_placeholders(query: str) -> str:
+    """
+    Convert psycopg placeholders (`%s`, `%(name)s`, `%%`) to sqlite3 ones (`?`, `:name`, `%`).
+    @param query: Query written for psycopg
+    @return: Query for sqlite3
+    """
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(0) == "%s":
+            return "?"
+        return f":{match.group(1)}"
+
+    return _PLACEHOLDERS.sub(replace, query)
+
+
+def _adapt_value(value):
+    """
+    Adapt a parameter value: lists/tuples (Postgres arrays) are passed as JSON text,
+    to be expanded in SQL with `json_each`.
+    @param value: Parameter value
+    @return: Value sqlite3 can bind
+    """
+    if isinstance(value, (list, tuple)):
+        return json.dumps(value)
+    return value
+
+
+def _adapt_params(params):
+    """
+    Adapt the parameters of a query (sequence or mapping).
+    @param params: Query parameters
+    @return: Parameters sqlite3 can bind
+    """
+    if isinstance(params, dict):
+        return {key: _adapt_value(value) for key, value in params.items()}
+    return [_adapt_value(value) for value in params]
+
+
+def split_statements(script: str) -> list:
+    """
+    Split a script of several `;` separated statements into single statements.
+    @param script: SQL script
+    @return: List of statements
+    """
+    statements = []
+    current = ""
+    for part in script.split(";"):
+        current += part + ";"
+        if sqlite3.complete_statement(current):
+            if current.strip(" \t\r\n;"):
+                statements.append(current)
+            current = ""
+    if current.strip(" \t\r\n;"):
+        statements.append(current)
+    return statements
+
+
+class _StdDev:
+    """Sample standard deviation aggregate (Postgres STDDEV), computed with Welford's method."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def finalize(self):
+        if self.count < 2:
+            return None
+        return math.sqrt(self.m2 / (self.count - 1))
+
+
+class SQLiteCursor:
+    """
+    Cursor with the subset of the psycopg cursor API used by the ELO pipeline.
+    Scripts without parameters may hold several statements, as with psycopg.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+
+    def execute(self, query: str, params=None, prepare=None):
+        """
+        Execute a query, opening a transaction first unless in autocommit mode.
+        @param query: Query with psycopg placeholders
+        @param params: Query parameters
+        @param prepare: Ignored, sqlite3 caches compiled statements per connection
+        @return: self
+        """
+        self.connection._begin()
+        if params is None:
+            for statement in split_statements(query):
+                self._cursor.execute(statement)
+        else:
+            self._cursor.execute(
+                _translate_placeholders(query), _adapt_params(params)
+            )
+        return self
+
+    def executemany(self, query: str, params_seq):
+        """
+        Execute a query once for every set of parameters.
+        @param query: Query with psycopg placeholders
+        @param params_seq: Sequence of query parameters
+        @return: None
+        """
+        self.connection._begin()
+        self._cursor.executemany(
+            _translate_placeholders(query),
+            (_adapt_params(params) for params in params_seq),
+        )
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SQLiteConnection:
+    """
+    Embedded single-file database with the subset of the psycopg connection API used by the
+    ELO pipeline, so the same classes run without a Postgres server.
+
+    As with psycopg, a transaction is opened by the first statement and lasts until commit() or
+    rollback(), unless `autocommit` is set. The database runs in WAL mode, so the ELO updater's
+    worker processes can read while the main process writes.
+    Queries that differ between backends are selected with `backend_of(conn)`.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        """
+        @param path: Database file
+        @param timeout: Seconds to wait for a lock held by another connection
+        """
+        if sqlite3.sqlite_version_info < SQLITE_MIN_VERSION:
+            raise RuntimeError(
+                f"SQLite {'.'.join(map(str, SQLITE_MIN_VERSION))}+ is required, "
+                f"found {sqlite3.sqlite_version}."
+            )
+        # isolation_level=None: transactions are handled here, like psycopg does
+        self.raw = sqlite3.connect(
+            path,
+            timeout=timeout,
+            detect_types=sqlite3.PARSE_COLNAMES,
+            isolation_level=None,
+        )
+        self.raw.execute("PRAGMA journal_mode=WAL;")
+        # Postgres LOG is base 10, which is also SQLite's
+        self.raw.create_aggregate("STDDEV", 1, _StdDev)
+        self.autocommit = False
+
+    def _begin(self):
+        """Open a transaction if none is open and autocommit is off."""
+        if not self.autocommit and not self.raw.in_transaction:
+            self.raw.execute("BEGIN")
+
+    def cursor(self) -> SQLiteCursor:
+        return SQLiteCursor(self)
+
+    def pipeline(self):
+        """No round trips to save with an embedded database: statements run as they come."""
+        return nullcontext()
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    @property
+    def closed(self) -> bool:
+        try:
+            self.raw.total_changes
+        except sqlite3.ProgrammingError:
+            return True
+        return False
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        self.close()
@@ -0,0 +1,279 @@
+import heapq
+import time
+from datetime import date
+from typing import Dict, List
+
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+from footy.player_elo.database_connection import DatabaseConnection
+from footy.player_elo.game_analysis import GameAnalysis
+
+# Typing
+Formation = Dict[str, int]  # role -> number of players
+SquadPlayer = Dict[str, object]
+
+# Role of every `players.sub_position` in a lineup. Each sub-position fills exactly one role, which
+# keeps the roles disjoint (needed by the dominance pruning in SquadOptimizer).
+ROLE_OF_SUB_POSITION = {
+    "Goalkeeper": "GK",
+    "Centre-Back": "CB",
+    "Left-Back": "FB",
+    "Right-Back": "FB",
+    "Defensive Midfield": "CM",
+    "Central Midfield": "CM",
+    "Attacking Midfield": "CM",
+    "Left Midfield": "W",
+    "Right Midfield": "W",
+    "Left Winger": "W",
+    "Right Winger": "W",
+    "Centre-Forward": "ST",
+    "Second Striker": "ST",
+}
+
+FORMATIONS: Dict[str, Formation] = {
+    "4-3-3": {"GK": 1, "CB": 2, "FB": 2, "CM": 3, "W": 2, "ST": 1},
+    "4-4-2": {"GK": 1, "CB": 2, "FB": 2, "CM": 2, "W": 2, "ST": 2},
+    "3-5-2": {"GK": 1, "CB": 3, "FB": 2, "CM": 3, "W": 0, "ST": 2},
+    "3-4-3": {"GK": 1, "CB": 3, "FB": 2, "CM": 2, "W": 2, "ST": 1},
+}
+
+
+class SquadOptimizer:
+    """
+    Pick the lineup with the highest total ELO whose market value fits a transfer budget.
+
+    Every player fills one role (see ROLE_OF_SUB_POSITION) and a formation fixes how many players
+    of each role are picked, so this is a multiple-choice knapsack, solved exactly as an integer
+    linear program (scipy.optimize.milp, branch and bound).
+
+    The pool is pruned first: a player is dropped when at least as many players as their role has
+    slots are as good and as cheap (higher or equal ELO for a lower or equal market value). Some
+    player of an optimal lineup could always be swapped for one of them, so the optimum is kept,
+    whatever the budget. This leaves a few hundred candidates out of tens of thousands of players.
+
+    Attributes:
+        conn: Database connection for creating separate cursors.
+    """
+
+    POOL_QUERY = """
+        SELECT p.player_id, p.name, p.sub_position, p.market_value_in_eur, pe.elo
+        FROM players p
+        JOIN players_elo pe ON pe.player_id = p.player_id
+        JOIN (
+            SELECT player_id, MAX(season) AS season
+            FROM players_elo
+            WHERE season <= %(season)s AND elo IS NOT NULL
+            GROUP BY player_id
+        ) latest ON latest.player_id = pe.player_id AND latest.season = pe.season
+        WHERE latest.season >= %(min_season)s
+          AND p.market_value_in_eur IS NOT NULL
+          AND p.sub_position IS NOT NULL
+    """
+
+    def __init__(self, conn):
+        """
+        Initialize the SquadOptimizer class.
+
+        Args:
+            conn: Database connection object for creating cursors.
+        """
+        self.conn = conn
+
+    def fetch_pool(self, season: int, active_seasons: int = 2) -> Dict[str, np.ndarray]:
+        """
+        Fetch the player pool: players with a role, a market value and a recent ELO.
+
+        @param season: Latest season to read ELOs from
+        @param active_seasons: Only players with an ELO in this many last seasons
+        @return: Arrays player_id, name, sub_position, role, cost, elo (one entry per player)
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                self.POOL_QUERY,
+                {"season": season, "min_season": season - active_seasons + 1},
+            )
+            rows = [row for row in cur.fetchall() if row[2] in ROLE_OF_SUB_POSITION]
+
+        columns = list(zip(*rows)) if rows else [()] * 5
+        return {
+            "player_id": np.asarray(columns[0], dtype=np.int64),
+            "name": np.asarray(columns[1], dtype=object),
+            "sub_position": np.asarray(columns[2], dtype=object),
+            "role": np.asarray(
+                [ROLE_OF_SUB_POSITION[sub_position] for sub_position in columns[2]],
+                dtype=object,
+            ),
+            "cost": np.asarray(columns[3], dtype=np.float64),
+            "elo": np.asarray(columns[4], dtype=np.float64),
+        }
+
+    @staticmethod
+    def prune(pool: Dict[str, np.ndarray], formation: Formation) -> np.ndarray:
+        """
+        Indices of the players that can be part of an optimal lineup for any budget.
+
+        Players of a role are scanned from cheapest to most expensive (best ELO first among equal
+        costs), keeping the best `slots` ELOs seen so far in a heap: a player whose ELO does not
+        beat the worst of them is dominated by `slots` cheaper players.
+
+        @param pool: Player pool (see `fetch_pool`)
+        @param formation: Role -> number of players
+        @return: Indices into the pool
+        """
+        kept = []
+        for role, slots in formation.items():
+            if slots == 0:
+                continue
+            members = np.flatnonzero(pool["role"] == role)
+            order = members[np.lexsort((-pool["elo"][members], pool["cost"][members]))]
+            best_elos = []
+            for index, elo in zip(order.tolist(), pool["elo"][order].tolist()):
+                if len(best_elos) == slots and elo <= best_elos[0]:
+                    continue
+                kept.append(index)
+                if len(best_elos) < slots:
+                    heapq.heappush(best_elos, elo)
+                else:
+                    heapq.heapreplace(best_elos, elo)
+        return np.asarray(kept, dtype=np.int64)
+
+    def optimize(
+        self, pool: Dict[str, np.ndarray], budget: float, formation: Formation
+    ) -> np.ndarray:
+        """
+        Solve the lineup ILP on a player pool:
+            maximize sum(elo * x)  s.t.  sum(cost * x) <= budget,
+            sum(x of role r) = formation[r] for every role,  x binary.
+
+        @param pool: Player pool (see `fetch_pool`)
+        @param budget: Total market value allowed (EUR)
+        @param formation: Role -> number of players
+        @return: Indices into the pool of the picked players
+        @raise ValueError: If no lineup of the formation fits the budget
+        """
+        candidates = self.prune(pool, formation)
+        roles = pool["role"][candidates]
+        costs = pool["cost"][candidates]
+        elos = pool["elo"][candidates]
+
+        active_roles = [role for role, slots in formation.items() if slots > 0]
+        role_matrix = np.asarray([roles == role for role in active_roles], dtype=np.float64)
+        slots = np.asarray([formation[role] for role in active_roles], dtype=np.float64)
+
+        # Cheapest lineup of the formation: if it does not fit, no lineup does
+        cheapest = 0.0
+        for role in active_roles:
+            role_costs = np.sort(costs[roles == role])
+            if len(role_costs) < formation[role]:
+                raise ValueError(
+                    f"Only {len(role_costs)} players for {formation[role]} {role} slots."
+                )
+            cheapest += role_costs[: formation[role]].sum()
+        if cheapest > budget:
+            raise ValueError(
+                f"No lineup fits a budget of {budget:,.0f} EUR: "
+                f"the cheapest one costs {cheapest:,.0f} EUR."
+            )
+
+        result = milp(
+            c=-elos,
+            constraints=[
+                LinearConstraint(costs[None, :], -np.inf, budget),
+                LinearConstraint(role_matrix, slots, slots),
+            ],
+            integrality=np.ones(len(candidates)),
+            bounds=Bounds(0, 1),
+            # Proven optimum, not HiGHS' default 0.01% gap
+            options={"mip_rel_gap": 0},
+        )
+        if result.status != 0 or result.x is None:
+            raise ValueError(
+                f"No lineup fits a budget of {budget:,.0f} EUR: {result.message}"
+            )
+        picked = result.x > 0.5
+        # HiGHS' presolve may report an infeasible instance as optimal: check the solution
+        if not np.array_equal(role_matrix @ picked, slots) or costs @ picked > budget * (
+            1 + 1e-9
+        ):
+            raise ValueError(
+                f"No lineup fits a budget of {budget:,.0f} EUR: the solver returned an "
+                "infeasible lineup."
+            )
+        return candidates[np.flatnonzero(picked)]
+
+    def best_squad(
+        self, budget: float, formation: str = "4-3-3", season: int = None
+    ) -> List[SquadPlayer]:
+        """
+        Main function: the highest total-ELO lineup under a budget.
+
+        @param budget: Total market value allowed (EUR)
+        @param formation: Name of the formation (see FORMATIONS)
+        @param season: Latest season to read ELOs from (default: current season)
+        @return: Picked players (player_id, name, role, sub_position, elo, market_value),
+            goalkeeper to strikers
+        @raise ValueError: If the formation is unknown or no lineup fits the budget
+        """
+        if formation not in FORMATIONS:
+            raise ValueError(f"Unknown formation {formation!r}, use one of {list(FORMATIONS)}.")
+        if season is None:
+            season = GameAnalysis.season_of(date.today())
+
+        start_time = time.perf_counter()
+        pool = self.fetch_pool(season)
+        fetched_time = time.perf_counter()
+        picked = self.optimize(pool, budget, FORMATIONS[formation])
+        print(
+            f"Picked a {formation} lineup out of {len(pool['player_id'])} players. "
+            f"(fetch {fetched_time - start_time:.2f}s, "
+            f"optimize {time.perf_counter() - fetched_time:.2f}s)"
+        )
+
+        role_order = list(FORMATIONS[formation])
+        squad = [
+            {
+                "player_id": int(pool["player_id"][i]),
+                "name": pool["name"][i],
+                "role": pool["role"][i],
+                "sub_position": pool["sub_position"][i],
+                "elo": float(pool["elo"][i]),
+                "market_value": float(pool["cost"][i]),
+            }
+            for i in picked
+        ]
+        squad.sort(key=lambda player: (role_order.index(player["role"]), -player["elo"]))
+        return squad
+
+
+def best_squad(budget: float, formation: str = "4-3-3") -> List[SquadPlayer]:
+    """
+    Print and return the highest total-ELO lineup under a budget, from the configured DB.
+    @param budget: Total market value allowed (EUR)
+    @param formation: Name of the formation (see FORMATIONS)
+    @return: See SquadOptimizer.best_squad
+    """
+
+    from footy.player_elo.database_connection import DATABASE_CONFIG
+
+    with DatabaseConnection(DATABASE_CONFIG) as conn:
+        squad = SquadOptimizer(conn).best_squad(budget, formation)
+
+    for player in squad:
+        print(
+            f"{player['role']:<3} {str(player['name'])[:30]:<30} {player['elo']:>8.1f} "
+            f"{player['market_value']:>14,.0f}"
+        )
+    print(
+        f"Total ELO {sum(p['elo'] for p in squad):.1f}, "
+        f"market value {sum(p['market_value'] for p in squad):,.0f} EUR"
+    )
+    return squad
+
+
+# Usage
+if __name__ == "__main__":
+    best_squad(
+        float(input("Budget (EUR): ")),
+        input(f"Formation {list(FORMATIONS)}: ").strip() or "4-3-3",
+    )
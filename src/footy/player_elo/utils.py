@@ -52,10 +52,9 @@ def add_season_column(df: pd.DataFrame) -> pd.DataFrame:
     df_copy = df.copy()
     df_copy['date'] = pd.to_datetime(df_copy['date'])
     if 'season' not in df_copy.columns:
-        # df_copy['month_year'] = df_copy['date'].apply(lambda x: f"08 {x.year}" if x >= pd.Timestamp(x.year, 7, 1)\
-        #     else f"08 {x.year-1}")
-        df_copy['season'] = df_copy['date'].apply(lambda x: f"{x.year}" if x >= pd.Timestamp(x.year, 7, 1) \
-            else f"{x.year - 1}")
+        # Seasons start on 1st July: Jan-Jun dates belong to the previous year's season
+        season = df_copy['date'].dt.year - (df_copy['date'].dt.month < 7)
+        df_copy['season'] = season.astype(str)
     # df_copy = df_copy.loc[df_copy.groupby(['season'])['date'].idxmin()] #Get value only at start of season
     return df_copy
 
@@ -0,0 +1,387 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import httpx
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from footy.player_elo.database_connection import DATA_DIR
+
+FBREF_URL = "https://fbref.com"
+# Competition page of each big 5 league: /en/comps/<id>/<name>-Stats
+BIG5_COMPETITIONS = {
+    "Premier-League": 9,
+    "La-Liga": 12,
+    "Serie-A": 11,
+    "Bundesliga": 20,
+    "Ligue-1": 13,
+}
+HTTP_CACHE_DIR = DATA_DIR / "http_cache"
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/101.0.4951.64 Safari/537.36"
+)
+# Status codes worth retrying: rate limited / server side errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter for asyncio tasks: `rate` requests per second on average, with
+    bursts of up to `capacity` requests.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        """
+        @param rate: Tokens added per second
+        @param capacity: Maximum number of tokens stored
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it (callers are served in order)."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HttpCache:
+    """
+    On-disk HTTP cache: body and validators (ETag / Last-Modified) of every fetched URL, used to
+    send conditional requests, so an unchanged page costs a 304 instead of a full download.
+    """
+
+    def __init__(self, directory: Union[str, Path] = HTTP_CACHE_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.directory / f"{key}.json", self.directory / f"{key}.body"
+
+    def load(self, url: str):
+        """
+        @param url: Absolute URL
+        @return: (metadata, body) of the cached response, or None
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            return json.loads(meta_path.read_text()), body_path.read_bytes()
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def store(self, url: str, headers: httpx.Headers, body: bytes) -> None:
+        """
+        Store a response (the body first, so metadata never points to a missing body).
+        @param url: Absolute URL
+        @param headers: Response headers
+        @param body: Response body
+        @return: None
+        """
+        meta_path, body_path = self._paths(url)
+        meta = {
+            "url": url,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "encoding": headers.get("content-type", "").partition("charset=")[2] or None,
+            "fetched_at": time.time(),
+        }
+        for path, data in ((body_path, body), (meta_path, json.dumps(meta).encode())):
+            temporary_path = path.with_suffix(path.suffix + ".tmp")
+            temporary_path.write_bytes(data)
+            os.replace(temporary_path, path)
+
+    def touch(self, url: str, meta: Dict) -> None:
+        """Mark a cached response as revalidated now (after a 304)."""
+        meta_path, _ = self._paths(url)
+        meta_path.write_text(json.dumps({**meta, "fetched_at": time.time()}))
+
+    @staticmethod
+    def conditional_headers(meta: Dict) -> Dict[str, str]:
+        """Headers asking the server for the page only if it changed since it was cached."""
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+
+class AsyncScraper:
+    """
+    Concurrent page fetcher built on httpx.AsyncClient.
+
+    - requests are spread by a token bucket (`rate` per second) and at most `max_concurrency`
+      are in flight,
+    - failed requests (connection errors, 429 and 5xx) are retried with exponential backoff,
+      honouring Retry-After,
+    - responses are cached on disk and revalidated with conditional requests,
+    - HTML is parsed in a thread pool, so parsing one page does not stall downloads.
+
+    Use it as an async context manager. Pass `transport` (e.g. httpx.MockTransport) and
+    `base_url` to run it against a stub server.
+    """
+
+    def __init__(
+        self,
+        rate: float = 10 / 60,
+        burst: int = 1,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        backoff: float = 2.0,
+        cache_dir: Optional[Union[str, Path]] = HTTP_CACHE_DIR,
+        max_age: float = 0,
+        parse_workers: int = 4,
+        timeout: float = 30.0,
+        base_url: str = FBREF_URL,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        @param rate: Requests per second (fbref allows about 10 per minute)
+        @param burst: Requests allowed at once before the rate applies
+        @param max_concurrency: Requests in flight at the same time
+        @param max_retries: Retries of a failed request
+        @param backoff: First retry delay in seconds, doubled at every retry
+        @param cache_dir: HTTP cache directory (None disables the cache)
+        @param max_age: Seconds a cached page is used without revalidation
+        @param parse_workers: Threads parsing pages
+        @param timeout: Request timeout in seconds
+        @param base_url: Base of relative URLs
+        @param transport: httpx transport (default: network)
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = HttpCache(cache_dir) if cache_dir is not None else None
+        self.max_age = max_age
+        self.parse_workers = parse_workers
+        self.timeout = timeout
+        self.base_url = base_url
+        self.transport = transport
+        self.client = None
+        self.executor = None
+        # Requests sent, pages served from cache (fresh or 304) and retries, for reporting
+        self.stats = {"requests": 0, "cached": 0, "retries": 0}
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"User-Agent": USER_AGENT, "Accept-Language": "en-US,en;q=0.5"},
+            timeout=self.timeout,
+            follow_redirects=True,
+            transport=self.transport,
+        )
+        self.executor = ThreadPoolExecutor(max_workers=self.parse_workers)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.client.aclose()
+        self.executor.shutdown(wait=True)
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Delay before a retry: the server's Retry-After (in seconds) if any, else backoff."""
+        if response is not None:
+            try:
+                return float(response.headers["retry-after"])
+            except (KeyError, ValueError):
+                pass
+        return self.backoff * 2**attempt
+
+    async def fetch(self, url: str) -> str:
+        """
+        Fetch a page, from the cache when it has not changed.
+
+        @param url: Absolute URL, or relative to base_url
+        @return: Page text
+        @raise httpx.HTTPError: If the request still fails after all retries
+        """
+        absolute_url = str(self.client.build_request("GET", url).url)
+        cached = self.cache.load(absolute_url) if self.cache else None
+        if cached and time.time() - cached[0]["fetched_at"] < self.max_age:
+            self.stats["cached"] += 1
+            return cached[1].decode(cached[0]["encoding"] or "utf-8")
+        headers = HttpCache.conditional_headers(cached[0]) if cached else {}
+
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.bucket.acquire()
+                response = None
+                try:
+                    self.stats["requests"] += 1
+                    response = await self.client.get(absolute_url, headers=headers)
+                    if response.status_code == 304 and cached:
+                        self.cache.touch(absolute_url, cached[0])
+                        self.stats["cached"] += 1
+                        return cached[1].decode(cached[0]["encoding"] or "utf-8")
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        response.raise_for_status()
+                        if self.cache:
+                            self.cache.store(absolute_url, response.headers, response.content)
+                        return response.text
+                    error = httpx.HTTPStatusError(
+                        f"{response.status_code} for {absolute_url}",
+                        request=response.request,
+                        response=response,
+                    )
+                except httpx.TransportError as e:
+                    error = e
+
+                if attempt == self.max_retries:
+                    raise error
+                delay = self._retry_delay(attempt, response)
+                self.stats["retries"] += 1
+                logging.warning(f"Retrying {absolute_url} in {delay:.1f}s: {error!r}")
+                await asyncio.sleep(delay)
+
+    async def parse(self, parser: Callable[[str], object], html: str):
+        """
+        Run a parser on a page in the thread pool.
+        @param parser: Function of the page text
+        @param html: Page text
+        @return: Parser result
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, parser, html)
+
+    async def fetch_and_parse(self, url: str, parser: Callable[[str], object]):
+        """Fetch a page and parse it in the thread pool."""
+        return await self.parse(parser, await self.fetch(url))
+
+
+def parse_squad_urls(html: str) -> List[str]:
+    """
+    Squad page URLs of a competition page (links of its standings table).
+    @param html: Competition page
+    @return: Relative squad URLs, in standings order
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    table = soup.select_one("table.stats_table")
+    if table is None:
+        return []
+    links = [a.get("href") for a in table.find_all("a", href=True)]
+    return list(dict.fromkeys(link for link in links if "/squads/" in link))
+
+
+def parse_standard_stats(html: str) -> pd.DataFrame:
+    """
+    Players' standard stats table of a squad page.
+    Cells are read by their `data-stat` attribute, so the columns do not depend on the table's
+    two header rows; the player's page is kept as `player_url`.
+
+    @param html: Squad page
+    @return: One row per player (squad total rows excluded)
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    table = soup.find(
+        "table", id=lambda table_id: bool(table_id) and table_id.startswith("stats_standard")
+    )
+    if table is None or table.tbody is None:
+        return pd.DataFrame()
+
+    rows = []
+    for tr in table.tbody.find_all("tr"):
+        # Repeated header rows inside the body
+        if "thead" in (tr.get("class") or []):
+            continue
+        row = {
+            cell["data-stat"]: cell.get_text(strip=True)
+            for cell in tr.find_all(["th", "td"])
+            if cell.has_attr("data-stat")
+        }
+        link = tr.find("a", href=True)
+        row["player_url"] = link["href"] if link else None
+        rows.append(row)
+
+    stats = pd.DataFrame(rows)
+    # Numbers come as text with thousands separators
+    for column in stats.columns:
+        if column not in ("player", "nationality", "position", "player_url", "matches"):
+            converted = pd.to_numeric(stats[column].str.replace(",", ""), errors="coerce")
+            if converted.notna().any():
+                stats[column] = converted
+    return stats
+
+
+async def scrape_competitions(
+    competitions: Dict[str, int] = BIG5_COMPETITIONS, **scraper_options
+) -> pd.DataFrame:
+    """
+    Scrape the standard stats of every squad of some competitions, all squads concurrently.
+
+    @param competitions: Competition name -> fbref competition ID
+    @param scraper_options: AsyncScraper options (rate, max_concurrency, transport, ...)
+    @return: Players' standard stats with `competition` and `team` columns
+    """
+    async with AsyncScraper(**scraper_options) as scraper:
+        start_time = time.perf_counter()
+        competition_names = list(competitions)
+        squad_urls = await asyncio.gather(
+            *(
+                scraper.fetch_and_parse(
+                    f"/en/comps/{competitions[name]}/{name}-Stats", parse_squad_urls
+                )
+                for name in competition_names
+            )
+        )
+        squads = [
+            (name, url)
+            for name, urls in zip(competition_names, squad_urls)
+            for url in urls
+        ]
+        print(f"Found {len(squads)} squads in {len(competition_names)} competitions.")
+
+        results = await asyncio.gather(
+            *(scraper.fetch_and_parse(url, parse_standard_stats) for _, url in squads),
+            return_exceptions=True,
+        )
+        squad_dfs = []
+        for (competition, url), result in zip(squads, results):
+            if isinstance(result, Exception):
+                print(f"Error scraping {url}: {result!r}")
+                continue
+            result["competition"] = competition.replace("-", " ")
+            result["team"] = url.split("/")[-1].replace("-Stats", "").replace("-", " ")
+            squad_dfs.append(result)
+
+        print(
+            f"Scraped {len(squad_dfs)}/{len(squads)} squads with {scraper.stats['requests']} "
+            f"requests ({scraper.stats['cached']} unchanged, {scraper.stats['retries']} "
+            f"retries). ({time.perf_counter() - start_time:.2f}s)"
+        )
+    return pd.concat(squad_dfs, ignore_index=True) if squad_dfs else pd.DataFrame()
+
+
+def scrape_big5_standard_stats(csv_path: Union[str, Path] = None) -> pd.DataFrame:
+    """
+    Scrape the standard stats of every big 5 league squad.
+    @param csv_path: CSV file the stats are also saved to (optional)
+    @return: Players' standard stats
+    """
+    stats = asyncio.run(scrape_competitions())
+    if csv_path is not None:
+        stats.to_csv(csv_path, index=False)
+    return stats
+
+
+# Usage
+if __name__ == "__main__":
+    scrape_big5_standard_stats(DATA_DIR / "squad_standard_stats_big5.csv")
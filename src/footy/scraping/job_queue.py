@@ -0,0 +1,613 @@
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import httpx
+import pandas as pd
+
+from footy.player_elo.database_connection import DatabaseConnection
+from footy.scraping.fbref_scraper import (
+    FBREF_URL,
+    HTTP_CACHE_DIR,
+    AsyncScraper,
+    parse_squad_urls,
+    parse_standard_stats,
+)
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Optional: InMemoryJobQueue works without it
+    redis_asyncio = None
+
+# Typing
+Job = Dict[str, object]  # kind, url, key, attempts
+
+# Redis of compose.yaml (port 6379 of the container is published on 6170)
+REDIS_URL = os.environ.get("FOOTY_REDIS_URL", "redis://localhost:6170/0")
+CLUB_ELO_URL = "http://api.clubelo.com"
+
+# Requests per second allowed on each host, shared by all workers of a pool
+HOST_RATES = {
+    urlsplit(FBREF_URL).hostname: 10 / 60,
+    urlsplit(CLUB_ELO_URL).hostname: 1.0,
+}
+DEFAULT_HOST_RATE = 1.0
+
+# A job whose key was enqueued less than this many seconds ago is dropped as a duplicate
+DEDUP_TTL = 24 * 60 * 60
+MAX_ATTEMPTS = 3
+STAGING_BATCH_SIZE = 50
+
+
+def parse_club_elo(text: str) -> pd.DataFrame:
+    """
+    ClubElo ranking of a day (CSV: Rank, Club, Country, Level, Elo, From, To).
+    @param text: Response of api.clubelo.com/<date>
+    @return: One row per club
+    """
+    return pd.read_csv(io.StringIO(text))
+
+
+# Parser of the page fetched by each kind of job. Player pages hold the same
+# `stats_standard_*` table as squad pages, one row per season.
+PARSERS: Dict[str, Callable[[str], pd.DataFrame]] = {
+    "team": parse_standard_stats,
+    "player": parse_standard_stats,
+    "club_elo": parse_club_elo,
+}
+
+
+def team_job(url: str) -> Job:
+    """
+    Job scraping the players' standard stats of a squad page.
+    @param url: fbref squad URL (absolute or relative)
+    @return: Job
+    """
+    url = url if url.startswith("http") else FBREF_URL + url
+    return {"kind": "team", "url": url, "key": f"team:{urlsplit(url).path}"}
+
+
+def player_job(url: str) -> Job:
+    """
+    Job scraping the standard stats of a player page.
+    @param url: fbref player URL (absolute or relative)
+    @return: Job
+    """
+    url = url if url.startswith("http") else FBREF_URL + url
+    return {"kind": "player", "url": url, "key": f"player:{urlsplit(url).path}"}
+
+
+def club_elo_job(day: Union[date, str]) -> Job:
+    """
+    Job fetching the ClubElo ranking of a day.
+    @param day: Date (or YYYY-MM-DD)
+    @return: Job
+    """
+    day = day.isoformat() if isinstance(day, date) else day
+    return {"kind": "club_elo", "url": f"{CLUB_ELO_URL}/{day}", "key": f"club_elo:{day}"}
+
+
+class InMemoryJobQueue:
+    """
+    In-process job queue with the interface of RedisJobQueue, for tests and single process runs
+    without a Redis server. Jobs live in the event loop of the process.
+    """
+
+    def __init__(self, dedup_ttl: float = DEDUP_TTL, max_attempts: int = MAX_ATTEMPTS):
+        """
+        @param dedup_ttl: Seconds during which a job key is only enqueued once
+        @param max_attempts: Attempts of a job before it is moved to the dead jobs
+        """
+        self.dedup_ttl = dedup_ttl
+        self.max_attempts = max_attempts
+        self.jobs = deque()
+        self.processing = {}
+        self.dead = []
+        self._seen = {}
+        self._next_token = 0
+        self._available = asyncio.Condition()
+
+    async def push(self, job: Job) -> bool:
+        """
+        Enqueue a job unless a job with the same key was enqueued within dedup_ttl.
+        @param job: Job (see team_job, player_job, club_elo_job)
+        @return: Whether the job was enqueued
+        """
+        now = time.monotonic()
+        if self._seen.get(job["key"], -float("inf")) > now:
+            return False
+        self._seen[job["key"]] = now + self.dedup_ttl
+        async with self._available:
+            self.jobs.appendleft(dict(job))
+            self._available.notify()
+        return True
+
+    async def pop(self, timeout: float = 1.0) -> Optional[Tuple[object, Job]]:
+        """
+        Take the oldest job, which stays in the processing jobs until done / failed.
+        @param timeout: Seconds to wait for a job
+        @return: (token for done / fail, job), or None if no job came within the timeout
+        """
+        async with self._available:
+            try:
+                await asyncio.wait_for(
+                    self._available.wait_for(lambda: len(self.jobs) > 0), timeout
+                )
+            except asyncio.TimeoutError:
+                return None
+            job = self.jobs.pop()
+        self._next_token += 1
+        self.processing[self._next_token] = job
+        return self._next_token, job
+
+    async def done(self, token) -> None:
+        """Remove a finished job from the processing jobs."""
+        self.processing.pop(token, None)
+
+    async def fail(self, token, job: Job, error: str) -> bool:
+        """
+        Requeue a failed job, or move it to the dead jobs after max_attempts.
+        @return: Whether the job was requeued
+        """
+        self.processing.pop(token, None)
+        job = {**job, "attempts": int(job.get("attempts", 0)) + 1, "error": error}
+        if job["attempts"] >= self.max_attempts:
+            self.dead.append(job)
+            return False
+        async with self._available:
+            self.jobs.appendleft(job)
+            self._available.notify()
+        return True
+
+    async def recover(self) -> int:
+        """Requeue the jobs left processing (workers stopped before finishing them)."""
+        stale = list(self.processing.values())
+        self.processing.clear()
+        async with self._available:
+            self.jobs.extend(stale)
+            self._available.notify(len(stale))
+        return len(stale)
+
+    async def size(self) -> int:
+        """Number of jobs waiting."""
+        return len(self.jobs)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisJobQueue:
+    """
+    Job queue shared by producers and worker processes through Redis.
+
+    - `<name>:jobs` list of waiting jobs (JSON), pushed left and popped right (FIFO),
+    - `<name>:processing` list of jobs taken by a worker: pop moves a job there atomically
+      (BLMOVE) and done removes it, so the jobs of a crashed worker are not lost (see recover),
+    - `<name>:dead` list of jobs that failed max_attempts times,
+    - `<name>:seen:<key>` keys (SET NX with expiry) deduplicating jobs: only the producer that
+      creates the key enqueues the job.
+    """
+
+    def __init__(
+        self,
+        client,
+        name: str = "footy:scrape",
+        dedup_ttl: float = DEDUP_TTL,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        """
+        @param client: redis.asyncio.Redis client (decode_responses=True)
+        @param name: Prefix of the queue's Redis keys
+        @param dedup_ttl: Seconds during which a job key is only enqueued once
+        @param max_attempts: Attempts of a job before it is moved to the dead jobs
+        """
+        self.client = client
+        self.name = name
+        self.dedup_ttl = dedup_ttl
+        self.max_attempts = max_attempts
+        self.jobs_key = f"{name}:jobs"
+        self.processing_key = f"{name}:processing"
+        self.dead_key = f"{name}:dead"
+
+    @classmethod
+    def from_url(cls, url: str = REDIS_URL, **options) -> "RedisJobQueue":
+        """
+        Queue on the Redis server at a URL.
+        @param url: redis:// URL
+        @param options: RedisJobQueue options
+        @return: RedisJobQueue
+        @raise ImportError: If the redis package is not installed
+        """
+        if redis_asyncio is None:
+            raise ImportError("RedisJobQueue needs the redis package (pip install redis).")
+        return cls(redis_asyncio.Redis.from_url(url, decode_responses=True), **options)
+
+    async def push(self, job: Job) -> bool:
+        """
+        Enqueue a job unless a job with the same key was enqueued within dedup_ttl.
+        @param job: Job (see team_job, player_job, club_elo_job)
+        @return: Whether the job was enqueued
+        """
+        created = await self.client.set(
+            f"{self.name}:seen:{job['key']}", 1, nx=True, ex=int(self.dedup_ttl)
+        )
+        if not created:
+            return False
+        await self.client.lpush(self.jobs_key, json.dumps(job))
+        return True
+
+    async def pop(self, timeout: float = 1.0) -> Optional[Tuple[object, Job]]:
+        """
+        Take the oldest job, which stays in the processing list until done / failed.
+        @param timeout: Seconds to wait for a job
+        @return: (token for done / fail, job), or None if no job came within the timeout
+        """
+        raw = await self.client.blmove(
+            self.jobs_key, self.processing_key, timeout, src="RIGHT", dest="LEFT"
+        )
+        if raw is None:
+            return None
+        return raw, json.loads(raw)
+
+    async def done(self, token) -> None:
+        """Remove a finished job from the processing list."""
+        await self.client.lrem(self.processing_key, 1, token)
+
+    async def fail(self, token, job: Job, error: str) -> bool:
+        """
+        Requeue a failed job, or move it to the dead jobs after max_attempts.
+        @return: Whether the job was requeued
+        """
+        job = {**job, "attempts": int(job.get("attempts", 0)) + 1, "error": error}
+        requeue = job["attempts"] < self.max_attempts
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 1, token)
+            pipe.lpush(self.jobs_key if requeue else self.dead_key, json.dumps(job))
+            await pipe.execute()
+        return requeue
+
+    async def recover(self) -> int:
+        """
+        Requeue the jobs left in the processing list by stopped workers.
+        Only call it while no worker is running, it would also requeue their current jobs.
+        @return: Number of jobs requeued
+        """
+        count = 0
+        while await self.client.lmove(self.processing_key, self.jobs_key, "RIGHT", "RIGHT"):
+            count += 1
+        return count
+
+    async def size(self) -> int:
+        """Number of jobs waiting."""
+        return await self.client.llen(self.jobs_key)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def open_job_queue(url: Optional[str] = REDIS_URL, **options):
+    """
+    Job queue on Redis, or in memory when no URL is given.
+    @param url: redis:// URL (None for an InMemoryJobQueue)
+    @param options: Queue options (dedup_ttl, max_attempts, ...)
+    @return: RedisJobQueue or InMemoryJobQueue
+    """
+    if url is None:
+        return InMemoryJobQueue(**options)
+    return RedisJobQueue.from_url(url, **options)
+
+
+class StagingWriter:
+    """
+    Store scraped tables in `scrape_staging` (one row per job, the table as JSON records) until
+    they are ingested. Rows are written in batches, a job scraped again replaces its row.
+
+    Every row keeps the queue token of its job: `add` and `flush` return the tokens of the rows
+    committed, so a job is only acknowledged once its table is in the database. The jobs of the
+    rows lost in a crash stay in the processing jobs of the queue (see recover).
+    """
+
+    CREATE_QUERY = """
+        CREATE TABLE IF NOT EXISTS scrape_staging (
+            job_key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            url TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            scraped_at TIMESTAMP NOT NULL,
+            ingested BOOLEAN NOT NULL DEFAULT FALSE
+        );
+    """
+
+    UPSERT_QUERY = """
+        INSERT INTO scrape_staging (job_key, kind, url, payload, scraped_at, ingested)
+        VALUES (%s, %s, %s, %s, %s, FALSE)
+        ON CONFLICT (job_key) DO UPDATE
+        SET kind = EXCLUDED.kind, url = EXCLUDED.url, payload = EXCLUDED.payload,
+            scraped_at = EXCLUDED.scraped_at, ingested = FALSE;
+    """
+
+    def __init__(self, conn, batch_size: int = STAGING_BATCH_SIZE):
+        """
+        @param conn: Database connection object for creating cursors.
+        @param batch_size: Rows written at once
+        """
+        self.conn = conn
+        self.batch_size = batch_size
+        self.rows = []
+        self.tokens = []
+        self.written = 0
+        with self.conn.cursor() as cur:
+            cur.execute(self.CREATE_QUERY)
+        self.conn.commit()
+
+    def add(self, job: Job, table: pd.DataFrame, token=None) -> list:
+        """
+        Queue the table scraped by a job, writing the batch once it is full.
+        @param job: Job
+        @param table: Table scraped by the job
+        @param token: Queue token of the job
+        @return: Tokens of the jobs whose rows were committed (empty if the batch is not full)
+        """
+        payload = table.to_json(orient="records")
+        self.rows.append((job["key"], job["kind"], job["url"], payload, datetime.now()))
+        self.tokens.append(token)
+        if len(self.rows) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self) -> list:
+        """
+        Write the queued rows in one transaction.
+        @return: Tokens of the jobs whose rows were committed
+        """
+        if not self.rows:
+            return []
+        with self.conn.cursor() as cur:
+            cur.executemany(self.UPSERT_QUERY, self.rows)
+        self.conn.commit()
+        tokens = self.tokens
+        self.written += len(self.rows)
+        self.rows = []
+        self.tokens = []
+        return tokens
+
+
+def load_staged(conn, kind: str, mark_ingested: bool = True) -> pd.DataFrame:
+    """
+    Staged tables of a kind of job not ingested yet, concatenated for ingest.
+    @param conn: Database connection
+    @param kind: "team", "player" or "club_elo"
+    @param mark_ingested: Flag the returned rows as ingested
+    @return: Rows of every staged table, with the job_key and url they come from
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT job_key, url, payload FROM scrape_staging "
+            "WHERE kind = %s AND NOT ingested ORDER BY scraped_at",
+            (kind,),
+        )
+        staged = cur.fetchall()
+        if mark_ingested and staged:
+            cur.executemany(
+                "UPDATE scrape_staging SET ingested = TRUE WHERE job_key = %s",
+                [(job_key,) for job_key, _, _ in staged],
+            )
+    conn.commit()
+
+    tables = []
+    for job_key, url, payload in staged:
+        table = pd.read_json(io.StringIO(payload), orient="records")
+        table["job_key"] = job_key
+        table["url"] = url
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+
+
+class ScrapeWorkerPool:
+    """
+    N asyncio workers consuming a job queue: fetch the job's page, parse it and stage the table.
+
+    Every host gets one AsyncScraper, so the workers share its rate limit (HOST_RATES), HTTP
+    cache and retries; a host's requests are throttled without holding back the other hosts.
+    Rate limits are per pool: with several worker processes, give each a share of the rate.
+    Use it as an async context manager.
+    """
+
+    def __init__(
+        self,
+        queue,
+        conn,
+        n_workers: int = 4,
+        host_rates: Dict[str, float] = None,
+        cache_dir: Optional[Union[str, Path]] = HTTP_CACHE_DIR,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        **scraper_options,
+    ):
+        """
+        @param queue: RedisJobQueue or InMemoryJobQueue
+        @param conn: Database connection of the staging table
+        @param n_workers: Concurrent workers
+        @param host_rates: Requests per second of each host (default: HOST_RATES)
+        @param cache_dir: HTTP cache directory (None disables the cache)
+        @param transport: httpx transport (default: network)
+        @param scraper_options: Other AsyncScraper options (max_retries, backoff, ...)
+        """
+        self.queue = queue
+        self.staging = StagingWriter(conn)
+        self.n_workers = n_workers
+        self.host_rates = HOST_RATES if host_rates is None else host_rates
+        self.scraper_options = {
+            "cache_dir": cache_dir,
+            "transport": transport,
+            "max_concurrency": n_workers,
+            **scraper_options,
+        }
+        self.scrapers: Dict[str, AsyncScraper] = {}
+        self.stats = {"done": 0, "retried": 0, "dead": 0}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        for scraper in self.scrapers.values():
+            await scraper.__aexit__(exc_type, exc_val, exc_tb)
+        self.scrapers = {}
+        await self._ack(self.staging.flush())
+
+    async def _scraper(self, url: str) -> AsyncScraper:
+        """AsyncScraper of a URL's host, created on its first job."""
+        parts = urlsplit(url)
+        if parts.hostname not in self.scrapers:
+            scraper = AsyncScraper(
+                rate=self.host_rates.get(parts.hostname, DEFAULT_HOST_RATE),
+                base_url=f"{parts.scheme}://{parts.netloc}",
+                **self.scraper_options,
+            )
+            self.scrapers[parts.hostname] = await scraper.__aenter__()
+        return self.scrapers[parts.hostname]
+
+    async def handle(self, job: Job) -> pd.DataFrame:
+        """
+        Fetch and parse the page of a job.
+        @param job: Job
+        @return: Parsed table
+        @raise KeyError: If the kind of job is unknown
+        """
+        parser = PARSERS[job["kind"]]
+        scraper = await self._scraper(job["url"])
+        return await scraper.fetch_and_parse(job["url"], parser)
+
+    async def _ack(self, tokens: list) -> None:
+        """Mark the jobs whose staged rows were committed as done."""
+        for token in tokens:
+            await self.queue.done(token)
+        self.stats["done"] += len(tokens)
+
+    async def _work(self, stop_when_idle: bool, idle_timeout: float) -> None:
+        """One worker: take jobs until the queue stays empty (or forever)."""
+        while True:
+            popped = await self.queue.pop(timeout=idle_timeout)
+            if popped is None:
+                # Idle: commit the partial batch rather than leave its jobs unacknowledged
+                await self._ack(self.staging.flush())
+                if stop_when_idle:
+                    return
+                continue
+            token, job = popped
+            try:
+                table = await self.handle(job)
+            except Exception as e:
+                if await self.queue.fail(token, job, repr(e)):
+                    self.stats["retried"] += 1
+                else:
+                    self.stats["dead"] += 1
+                    logging.error(
+                        f"Job {job['key']} is dead after {job.get('attempts', 0) + 1} attempts: {e!r}"
+                    )
+                continue
+            await self._ack(self.staging.add(job, table, token))
+
+    async def run(self, stop_when_idle: bool = True, idle_timeout: float = 1.0) -> Dict[str, int]:
+        """
+        Run the workers.
+        @param stop_when_idle: Stop once no job came for idle_timeout (else run until cancelled)
+        @param idle_timeout: Seconds a worker waits for a job
+        @return: Jobs done, retried and dead
+        """
+        start_time = time.perf_counter()
+        try:
+            await asyncio.gather(
+                *(self._work(stop_when_idle, idle_timeout) for _ in range(self.n_workers))
+            )
+        finally:
+            await self._ack(self.staging.flush())
+        requests = sum(scraper.stats["requests"] for scraper in self.scrapers.values())
+        print(
+            f"{self.n_workers} workers: {self.stats['done']} jobs done, "
+            f"{self.stats['retried']} retried, {self.stats['dead']} dead, {requests} requests. "
+            f"({time.perf_counter() - start_time:.2f}s)"
+        )
+        return dict(self.stats)
+
+
+async def enqueue(queue, jobs: Iterable[Job]) -> int:
+    """
+    Enqueue jobs, skipping duplicates.
+    @param queue: RedisJobQueue or InMemoryJobQueue
+    @param jobs: Jobs
+    @return: Number of jobs enqueued
+    """
+    enqueued = 0
+    for job in jobs:
+        enqueued += await queue.push(job)
+    return enqueued
+
+
+async def enqueue_competition_teams(queue, competitions: Dict[str, int], **scraper_options) -> int:
+    """
+    Producer: enqueue a team job for every squad of some fbref competitions.
+    @param queue: RedisJobQueue or InMemoryJobQueue
+    @param competitions: Competition name -> fbref competition ID
+    @param scraper_options: AsyncScraper options used to read the competition pages
+    @return: Number of jobs enqueued
+    """
+    async with AsyncScraper(**scraper_options) as scraper:
+        squad_urls = await asyncio.gather(
+            *(
+                scraper.fetch_and_parse(
+                    f"/en/comps/{competition_id}/{name}-Stats", parse_squad_urls
+                )
+                for name, competition_id in competitions.items()
+            )
+        )
+    return await enqueue(queue, (team_job(url) for urls in squad_urls for url in urls))
+
+
+async def _main(args) -> None:
+    from footy.scraping.fbref_scraper import BIG5_COMPETITIONS
+
+    queue = open_job_queue(None if args.in_memory else args.redis_url)
+    try:
+        jobs: List[Job] = [club_elo_job(day) for day in args.club_elo]
+        jobs += [player_job(url) for url in args.player]
+        enqueued = await enqueue(queue, jobs)
+        if args.big5:
+            enqueued += await enqueue_competition_teams(queue, BIG5_COMPETITIONS)
+        print(f"Enqueued {enqueued} jobs, {await queue.size()} waiting.")
+
+        if args.command == "work":
+            from footy.player_elo.database_connection import DATABASE_CONFIG
+
+            if args.recover:
+                print(f"Requeued {await queue.recover()} unfinished jobs.")
+            with DatabaseConnection(DATABASE_CONFIG) as conn:
+                async with ScrapeWorkerPool(queue, conn, n_workers=args.workers) as pool:
+                    await pool.run(stop_when_idle=not args.forever)
+    finally:
+        await queue.close()
+
+
+# Usage
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape job queue: enqueue jobs or run workers.")
+    parser.add_argument("command", choices=["enqueue", "work"])
+    parser.add_argument("--redis-url", default=REDIS_URL)
+    parser.add_argument(
+        "--in-memory", action="store_true", help="no Redis: enqueue and work in this process"
+    )
+    parser.add_argument("--big5", action="store_true", help="enqueue every big 5 league squad")
+    parser.add_argument("--club-elo", nargs="*", default=[], help="ClubElo dates (YYYY-MM-DD)")
+    parser.add_argument("--player", nargs="*", default=[], help="fbref player URLs")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--forever", action="store_true", help="keep waiting for jobs")
+    parser.add_argument("--recover", action="store_true", help="requeue unfinished jobs first")
+    asyncio.run(_main(parser.parse_args()))